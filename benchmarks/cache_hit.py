@@ -0,0 +1,138 @@
+"""
+Throughput of cache hits served through routing versus the CacheHitMiddleware fast path.
+
+Both apps share one in-memory cache pre-filled with 100 entries. The routed app resolves
+ProxyService through dependency injection and builds a Response per hit, as the proxy route
+did before; the fast path sends the entry's precomputed header block and stored body.
+
+    python benchmarks/cache_hit.py [-n REQUESTS] [-c CONCURRENCY] [--size BYTES]
+"""
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+from time import perf_counter
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from fastapi import FastAPI, Request, Response
+
+from src.caching_proxy.cache import InMemoryCache
+from src.caching_proxy.coalescing import SingleFlight
+from src.caching_proxy.freshness import FreshnessPolicy
+from src.caching_proxy.middlewares import CacheHitMiddleware
+from src.caching_proxy.routing import RouteTable, make_route
+from src.caching_proxy.schemas import DataToCache
+from src.caching_proxy.service import ProxyService, ProxyServiceDep
+from src.caching_proxy.utils import CachingHelper
+
+
+async def fill_cache(cache: InMemoryCache, size: int) -> None:
+    for i in range(100):
+        value = DataToCache(
+            status_code=200,
+            headers={"content-type": "application/json", "etag": f'"{i}"', "cache-control": "max-age=60"},
+            body=b"x" * size,
+        )
+        await cache.setval(f"GET item/{i}", value, ttl=3600)
+
+
+def make_service(size: int) -> ProxyService:
+    cache = InMemoryCache()
+    asyncio.run(fill_cache(cache, size))
+
+    freshness = FreshnessPolicy(default_ttl=60)
+    return ProxyService(
+        routes=RouteTable([make_route(["http://localhost:1"], freshness)]),
+        freshness=freshness,
+        client=None,
+        cache=cache,
+        single_flight=SingleFlight(),
+    )
+
+
+def make_routed_app(service: ProxyService) -> FastAPI:
+    app = FastAPI(openapi_url=None, docs_url=None, redoc_url=None)
+    app.state.proxy_service = service
+
+    @app.api_route("/{path:path}", methods=["GET", "HEAD"])
+    async def proxy(path: str, request: Request, proxy_service: ProxyServiceDep) -> Response:
+        request_components = CachingHelper.extract_request_components(request)
+        cache_key = CachingHelper.make_cache_key(request_components)
+        cached = await proxy_service.get_cached_entry(request_components, cache_key)
+        return proxy_service.respond_from_cache(request_components, cached, "HIT")
+
+    return app
+
+
+def make_fast_app(service: ProxyService) -> FastAPI:
+    app = FastAPI(openapi_url=None, docs_url=None, redoc_url=None)
+    app.state.proxy_service = service
+    app.add_middleware(CacheHitMiddleware)
+
+    @app.api_route("/{path:path}", methods=["GET", "HEAD"])
+    async def proxy(path: str) -> Response:
+        raise AssertionError("every request is expected to be a hit")
+
+    return app
+
+
+async def drive(app: FastAPI, requests: int, concurrency: int) -> float:
+    async def one(i: int) -> None:
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0", "spec_version": "2.4"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "server": ("localhost", 3000),
+            "client": ("127.0.0.1", 50000),
+            "root_path": "",
+            "path": f"/item/{i % 100}",
+            "raw_path": f"/item/{i % 100}".encode(),
+            "query_string": b"",
+            "headers": [(b"host", b"localhost:3000"), (b"accept", b"*/*")],
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            pass
+
+        await app(scope, receive, send)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(i: int) -> None:
+        async with semaphore:
+            await one(i)
+
+    start = perf_counter()
+    await asyncio.gather(*(limited(i) for i in range(requests)))
+    return requests / (perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--requests", type=int, default=20_000)
+    parser.add_argument("-c", "--concurrency", type=int, default=256)
+    parser.add_argument("--size", type=int, default=4096, help="Cached body size in bytes")
+    args = parser.parse_args()
+
+    service = make_service(args.size)
+    cases = [
+        ("Routing + DI + Response", make_routed_app(service)),
+        ("CacheHitMiddleware", make_fast_app(service)),
+    ]
+    baseline = None
+    for name, app in cases:
+        asyncio.run(drive(app, min(args.requests, 1000), args.concurrency))
+        rps = asyncio.run(drive(app, args.requests, args.concurrency))
+        baseline = baseline or rps
+        print(f"{name:<28} {rps:10.0f} req/s  x{rps / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Micro-benchmark of the per-request cache key path.
+
+Compares the original implementation (pydantic RequestComponents, header copies,
+sorting and urlencoding on every call) with CachingHelper as used by the proxy route.
+
+    python benchmarks/cache_key.py [-n ITERATIONS]
+"""
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+from urllib.parse import urlencode
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from pydantic import BaseModel
+from starlette.requests import Request
+
+from src.caching_proxy.config import settings
+from src.caching_proxy.utils import CachingHelper
+
+
+class LegacyRequestComponents(BaseModel):
+    headers: dict[str, str]
+    params: dict[str, str]
+    path: str
+    method: str
+
+
+def legacy_key(request: Request) -> str:
+    headers = {k: v for k, v in dict(request.headers).items() if k.lower() not in settings.REQUEST_EXCLUDED_HEADERS}
+    components = LegacyRequestComponents(
+        headers=headers,
+        params=dict(request.query_params),
+        path=request.url.path.lstrip("/"),
+        method=request.method,
+    )
+    path_with_params = components.path
+    if components.params:
+        path_with_params = f"{path_with_params}?{urlencode(sorted(components.params.items()))}"
+    return f"{components.method} {path_with_params}"
+
+
+def current_key(request: Request, hashed: bool = False) -> str:
+    components = CachingHelper.extract_request_components(request)
+    return CachingHelper.make_cache_key(components, hashed=hashed)
+
+
+def make_request() -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "scheme": "http",
+            "server": ("localhost", 3000),
+            "path": "/products/search",
+            "query_string": b"q=phone&limit=30&skip=10&select=title,price",
+            "headers": [
+                (b"host", b"localhost:3000"),
+                (b"user-agent", b"Mozilla/5.0 (X11; Linux x86_64) Gecko/20100101 Firefox/130.0"),
+                (b"accept", b"application/json"),
+                (b"accept-encoding", b"gzip, deflate, br"),
+                (b"accept-language", b"en-US,en;q=0.5"),
+                (b"connection", b"keep-alive"),
+                (b"cookie", b"session=0123456789abcdef; theme=dark"),
+            ],
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+
+    # every request gets a fresh Request object, as it would inside the server
+    scope = make_request().scope
+    assert legacy_key(Request(scope)) == current_key(Request(scope))
+
+    cases = {
+        "legacy": lambda: legacy_key(Request(scope)),
+        "current": lambda: current_key(Request(scope)),
+        "current, hashed": lambda: current_key(Request(scope), hashed=True),
+    }
+    baseline = None
+    for name, func in cases.items():
+        seconds = min(timeit.repeat(func, number=args.iterations, repeat=3))
+        per_call = seconds / args.iterations * 1_000_000
+        baseline = baseline or per_call
+        print(f"{name:<16} {per_call:8.2f} us/request  x{baseline / per_call:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Startup cost of the CLI for management commands.
+
+Times fresh interpreters importing the CLI and running `health` against a port nobody listens on,
+next to a bare interpreter and an import of the server for reference, and checks that the CLI
+does not load the server stack. Exits with 1 when a check fails or the CLI is over the budget.
+
+    python benchmarks/import_time.py [-n REPEATS] [--budget MS]
+"""
+
+import argparse
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+
+# loaded only by `run` and `bench`, a management command that imports one of them pays for the whole server
+HEAVY_MODULES = (
+    "fastapi",
+    "uvicorn",
+    "httpx",
+    "pydantic",
+    "pydantic_settings",
+    "src.caching_proxy.server",
+    "src.caching_proxy.service",
+)
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def measure(args: list[str], repeats: int) -> float:
+    """Best wall time in milliseconds of `python <args>`, the minimum filters out noise from other processes."""
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=BASE_DIR, stdout=subprocess.DEVNULL, check=True)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def get_loaded_heavy_modules() -> list[str]:
+    # building the parser must not read the registries behind lazy choices either
+    code = (
+        "import sys, src.caching_proxy.cli as cli; cli.build_parser(); "
+        f"print(*(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=BASE_DIR, capture_output=True, text=True, check=True)
+    return out.stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--repeats", type=int, default=10)
+    parser.add_argument("--budget", type=float, default=500.0, help="Max ms the CLI import may add to the interpreter")
+    args = parser.parse_args()
+
+    cases = {
+        "interpreter": ["-c", "pass"],
+        "import cli": ["-c", "import src.caching_proxy.cli"],
+        "health": ["-m", "src.caching_proxy.cli", "health", "-p", str(get_free_port())],
+        "import server": ["-c", "import src.caching_proxy.server"],
+    }
+    results = {name: measure(case_args, args.repeats) for name, case_args in cases.items()}
+    baseline = results["interpreter"]
+    for name, ms in results.items():
+        print(f"{name:<14} {ms:8.1f} ms  +{ms - baseline:.1f} ms")
+
+    failed = False
+    heavy = get_loaded_heavy_modules()
+    if heavy:
+        print(f"FAIL: the CLI imports {', '.join(heavy)}")
+        failed = True
+    cli_cost = results["import cli"] - baseline
+    if cli_cost > args.budget:
+        print(f"FAIL: the CLI import takes {cli_cost:.1f} ms, budget {args.budget:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Throughput of the request logging middleware under high concurrency.
+
+Drives a minimal app in-process (no sockets) with the previous BaseHTTPMiddleware
+implementation and the current pure ASGI one, each with handlers writing synchronously
+on the event loop and through the queue handler from logging_config.json.
+
+    python benchmarks/middleware.py [-n REQUESTS] [-c CONCURRENCY]
+"""
+
+import argparse
+import asyncio
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from fastapi import FastAPI, Request, Response
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from src.caching_proxy.middlewares import CacheLoggingMiddleware
+
+logger = logging.getLogger("middleware")
+
+
+class LegacyCacheLoggingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next) -> Response:
+        start_time = perf_counter()
+        response = await call_next(request)
+        process_time = (perf_counter() - start_time) * 1000
+        logger.info(
+            "%-8s %-50s STATUS=%s CACHE=%-4s TIME=%.2fms",
+            request.method,
+            request.url.path,
+            response.status_code,
+            response.headers.get("X-Cache", "N/A"),
+            process_time,
+        )
+        return response
+
+
+def make_app(middleware) -> FastAPI:
+    app = FastAPI(openapi_url=None, docs_url=None, redoc_url=None)
+    app.add_middleware(middleware)
+
+    @app.get("/{path:path}")
+    async def endpoint(path: str) -> Response:
+        return Response(content=b"x" * 512, headers={"X-Cache": "HIT"})
+
+    return app
+
+
+def make_handlers(log_file: Path) -> list[logging.Handler]:
+    stream = logging.StreamHandler(open(os.devnull, "w"))
+    rotating = logging.handlers.RotatingFileHandler(log_file, maxBytes=1024 * 1024, backupCount=3, encoding="utf-8")
+    formatter = logging.Formatter("%(asctime)s :: %(levelname)8s :: %(name)15s :: %(funcName)10s :: %(message)s")
+    for handler in (stream, rotating):
+        handler.setFormatter(formatter)
+    return [stream, rotating]
+
+
+def setup_logging(log_file: Path, queued: bool) -> logging.handlers.QueueListener | None:
+    logger.handlers.clear()
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handlers = make_handlers(log_file)
+    if not queued:
+        for handler in handlers:
+            logger.addHandler(handler)
+        return None
+
+    log_queue: queue.Queue = queue.Queue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+async def drive(app: FastAPI, requests: int, concurrency: int) -> float:
+    async def one(i: int) -> None:
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0", "spec_version": "2.4"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "server": ("localhost", 3000),
+            "client": ("127.0.0.1", 50000),
+            "root_path": "",
+            "path": f"/item/{i % 100}",
+            "raw_path": f"/item/{i % 100}".encode(),
+            "query_string": b"",
+            "headers": [(b"host", b"localhost:3000"), (b"accept", b"*/*")],
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            pass
+
+        await app(scope, receive, send)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(i: int) -> None:
+        async with semaphore:
+            await one(i)
+
+    start = perf_counter()
+    await asyncio.gather(*(limited(i) for i in range(requests)))
+    return requests / (perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--requests", type=int, default=20_000)
+    parser.add_argument("-c", "--concurrency", type=int, default=256)
+    args = parser.parse_args()
+
+    cases = [
+        ("BaseHTTPMiddleware, sync handlers", LegacyCacheLoggingMiddleware, False),
+        ("BaseHTTPMiddleware, queue handler", LegacyCacheLoggingMiddleware, True),
+        ("ASGI middleware, sync handlers", CacheLoggingMiddleware, False),
+        ("ASGI middleware, queue handler", CacheLoggingMiddleware, True),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline = None
+        for name, middleware, queued in cases:
+            listener = setup_logging(Path(tmp) / "proxy.log", queued)
+            app = make_app(middleware)
+            asyncio.run(drive(app, min(args.requests, 1000), args.concurrency))
+            rps = asyncio.run(drive(app, args.requests, args.concurrency))
+            if listener is not None:
+                listener.stop()
+            baseline = baseline or rps
+            print(f"{name:<36} {rps:10.0f} req/s  x{rps / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+from abc import ABC, abstractmethod
+
+from src.caching_proxy.config import settings
+from src.caching_proxy.schemas import AdmissionStats
+
+# maps every counter value to its half, so aging a row is one bytearray.translate call
+HALVED = bytes(value >> 1 for value in range(256))
+
+
+def _table_size(minimum: int) -> int:
+    size = 1024
+    while size < minimum:
+        size <<= 1
+    return size
+
+
+class FrequencySketch(ABC):
+    name: str
+
+    @abstractmethod
+    def increment(self, key: str) -> int:
+        """Counts one more request for `key` and returns the estimated number of requests so far."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class CountMinSketch(FrequencySketch):
+    """
+    Approximate request counts in `depth` rows of byte counters, never under the real count. Increments are
+    conservative, only the smallest counters grow. Every 10 counters per slot worth of increments all counters
+    are halved, so keys that were popular long ago fade out.
+    """
+
+    name = "count-min"
+
+    def __init__(self, capacity: int, depth: int = settings.ADMISSION_SKETCH_DEPTH) -> None:
+        self._width = _table_size(capacity)
+        self._mask = self._width - 1
+        self._rows = [bytearray(self._width) for _ in range(max(depth, 1))]
+        self._sample_size = 10 * self._width
+        self._additions = 0
+
+    def increment(self, key: str) -> int:
+        h = hash(key)
+        step = (h >> 32) | 1
+        slots = [(h + i * step) & self._mask for i in range(len(self._rows))]
+        estimate = min(row[slot] for row, slot in zip(self._rows, slots))
+        if estimate < 255:
+            for row, slot in zip(self._rows, slots):
+                if row[slot] == estimate:
+                    row[slot] = estimate + 1
+            estimate += 1
+
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self._additions //= 2
+            for i, row in enumerate(self._rows):
+                self._rows[i] = row.translate(HALVED)
+        return estimate
+
+    def clear(self) -> None:
+        for row in self._rows:
+            row[:] = bytes(self._width)
+        self._additions = 0
+
+
+class BloomDoorkeeper(FrequencySketch):
+    """
+    Remembers which keys were requested before in a Bloom filter with 8 bits per key of capacity, so it only
+    tells one request from several. It is emptied after `capacity` new keys to forget old one-time requests.
+    """
+
+    name = "bloom"
+
+    HASHES = 3
+
+    def __init__(self, capacity: int) -> None:
+        self._bits = _table_size(8 * capacity)
+        self._mask = self._bits - 1
+        self._filter = bytearray(self._bits // 8)
+        self._capacity = capacity
+        self._insertions = 0
+
+    def increment(self, key: str) -> int:
+        h = hash(key)
+        step = (h >> 32) | 1
+        seen = True
+        for i in range(self.HASHES):
+            bit = (h + i * step) & self._mask
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self._filter[byte] & mask:
+                seen = False
+                self._filter[byte] |= mask
+        if seen:
+            return 2
+
+        self._insertions += 1
+        if self._insertions >= self._capacity:
+            self.clear()
+        return 1
+
+    def clear(self) -> None:
+        self._filter[:] = bytes(len(self._filter))
+        self._insertions = 0
+
+
+SKETCHES: dict[str, type[FrequencySketch]] = {
+    CountMinSketch.name: CountMinSketch,
+    BloomDoorkeeper.name: BloomDoorkeeper,
+}
+
+
+def make_sketch(name: str, capacity: int) -> FrequencySketch:
+    try:
+        return SKETCHES[name.lower()](capacity)
+    except KeyError:
+        raise ValueError(f"Unknown admission sketch: {name}. Available: {', '.join(SKETCHES)}")
+
+
+class AdmissionFilter:
+    """
+    Decides whether a fetched response is worth a place in the cache. It is refused when larger than
+    `max_object_size`, when its key was requested fewer than `min_hits` times recently, or when its size
+    per expected hit (size divided by the requests seen) is over `max_bytes_per_hit`.
+    """
+
+    def __init__(
+        self,
+        sketch: FrequencySketch,
+        max_object_size: int,
+        min_hits: int = settings.ADMISSION_MIN_HITS,
+        max_bytes_per_hit: int = settings.ADMISSION_MAX_BYTES_PER_HIT,
+    ) -> None:
+        self.sketch = sketch
+        self.max_object_size = max_object_size
+        self.min_hits = min_hits
+        self.max_bytes_per_hit = max_bytes_per_hit
+        self._admitted = 0
+        self._rejected: dict[str, int] = {}
+
+    def admit(self, key: str, size: int) -> bool:
+        """Counts one request for `key`, call it once per response that could be stored."""
+        frequency = self.sketch.increment(key)
+        if self.max_object_size and size > self.max_object_size:
+            return self._reject("size")
+        if frequency < self.min_hits:
+            return self._reject("frequency")
+        if self.max_bytes_per_hit and size / frequency > self.max_bytes_per_hit:
+            return self._reject("cost")
+        self._admitted += 1
+        return True
+
+    def _reject(self, reason: str) -> bool:
+        self._rejected[reason] = self._rejected.get(reason, 0) + 1
+        return False
+
+    @property
+    def stats(self) -> AdmissionStats:
+        return AdmissionStats(sketch=self.sketch.name, admitted=self._admitted, rejected=dict(self._rejected))
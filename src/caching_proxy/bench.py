@@ -0,0 +1,212 @@
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+from time import perf_counter
+
+import httpx
+import uvicorn
+from starlette.types import Receive, Scope, Send
+
+from src.caching_proxy.client import client
+from src.caching_proxy.config import settings
+from src.caching_proxy.utils import CachingHelper
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class StubOrigin:
+    """Origin answering every GET with the same cacheable body after a fixed delay, counting the requests it serves."""
+
+    def __init__(self, latency: float, body_size: int) -> None:
+        self.latency = latency
+        self.requests = 0
+        self._body = os.urandom(body_size)
+        self._headers = [
+            (b"content-type", b"application/octet-stream"),
+            (b"content-length", str(body_size).encode()),
+            (b"cache-control", b"max-age=3600"),
+        ]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        await send({"type": "http.response.start", "status": 200, "headers": self._headers})
+        await send({"type": "http.response.body", "body": self._body})
+
+
+@dataclass(slots=True)
+class BenchResult:
+    requests: int
+    errors: int
+    concurrency: int
+    seconds: float
+    rps: float
+    p50_ms: float
+    p99_ms: float
+    max_ms: float
+    hit_ratio: float
+    origin_requests: int
+    # peak resident memory of the proxy process, None where the platform does not report it
+    proxy_max_rss_mb: float | None
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((settings.HOST, 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def start_proxy(origin_url: str, port: int, proxy_args: list[str]) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "src.caching_proxy.cli", "run", "-o", origin_url, "-p", str(port), *proxy_args]
+    return subprocess.Popen(cmd, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_until_ready(proxy: subprocess.Popen, port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proxy.poll() is not None:
+            raise RuntimeError(f"Proxy exited with code {proxy.returncode} before it was ready")
+        if await asyncio.to_thread(client.get_status, port) is not None:
+            return
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"Proxy did not start within {timeout:.0f}s")
+
+
+def get_children_max_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+async def drive(
+    base_url: str,
+    requests: int,
+    concurrency: int,
+    hit_ratio: float,
+    hot_keys: int,
+) -> tuple[list[float], int, int, float]:
+    """Sends `requests` GETs from `concurrency` workers; a `hit_ratio` share goes to warmed URLs, the rest to new ones."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies: list[float] = []
+    errors = 0
+    hits = 0
+    remaining = iter(range(requests))
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=settings.HTTPX_TIMEOUT) as http:
+        await asyncio.gather(*(http.get(f"/hot/{key}") for key in range(hot_keys)))
+
+        async def worker() -> None:
+            nonlocal errors, hits
+            for i in remaining:
+                path = f"/hot/{random.randrange(hot_keys)}" if random.random() < hit_ratio else f"/miss/{i}"
+                started = perf_counter()
+                try:
+                    resp = await http.get(path)
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(perf_counter() - started)
+                if resp.status_code != 200:
+                    errors += 1
+                elif resp.headers.get("x-cache") == "HIT":
+                    hits += 1
+
+        started = perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = perf_counter() - started
+
+    return latencies, errors, hits, elapsed
+
+
+async def run_bench_async(args) -> BenchResult:
+    origin = StubOrigin(latency=args.origin_latency, body_size=args.body_size)
+    origin_port = get_free_port()
+    origin_server = uvicorn.Server(
+        uvicorn.Config(origin, host=settings.HOST, port=origin_port, lifespan="off", log_level="error", access_log=False)
+    )
+    origin_task = asyncio.create_task(origin_server.serve())
+    while not origin_server.started:
+        await asyncio.sleep(0.01)
+
+    proxy_port = args.port or get_free_port()
+    proxy = start_proxy(f"http://{settings.HOST}:{origin_port}", proxy_port, args.proxy_args)
+    try:
+        await wait_until_ready(proxy, proxy_port)
+        hot_keys = max(args.hot_keys, 1)
+        # the warm-up fetches of the hot keys are not part of the measurement
+        latencies, errors, hits, elapsed = await drive(
+            CachingHelper.join_host_and_port(settings.HOST, proxy_port),
+            args.requests,
+            args.concurrency,
+            args.hit_ratio,
+            hot_keys,
+        )
+        origin_requests = origin.requests - hot_keys
+    finally:
+        proxy.terminate()
+        await asyncio.to_thread(proxy.wait)
+        origin_server.should_exit = True
+        await origin_task
+
+    latencies.sort()
+    return BenchResult(
+        requests=args.requests,
+        errors=errors,
+        concurrency=args.concurrency,
+        seconds=elapsed,
+        rps=args.requests / elapsed if elapsed else 0.0,
+        p50_ms=percentile(latencies, 0.50) * 1000,
+        p99_ms=percentile(latencies, 0.99) * 1000,
+        max_ms=latencies[-1] * 1000 if latencies else 0.0,
+        hit_ratio=hits / args.requests if args.requests else 0.0,
+        origin_requests=origin_requests,
+        proxy_max_rss_mb=get_children_max_rss_mb(),
+    )
+
+
+def print_result(result: BenchResult, target_hit_ratio: float) -> None:
+    memory = f"{result.proxy_max_rss_mb:.1f} MiB" if result.proxy_max_rss_mb is not None else "N/A"
+    print(f"Requests:    {result.requests} in {result.seconds:.2f}s, concurrency {result.concurrency}, {result.errors} errors")
+    print(f"Throughput:  {result.rps:.0f} req/s")
+    print(f"Latency:     p50 {result.p50_ms:.2f}ms, p99 {result.p99_ms:.2f}ms, max {result.max_ms:.2f}ms")
+    print(f"Hit ratio:   {result.hit_ratio:.3f} (target {target_hit_ratio:.3f})")
+    print(f"Origin:      {result.origin_requests} requests")
+    print(f"Peak memory: {memory} (proxy process)")
+
+
+def run_bench(args) -> None:
+    # the proxy under test gets every option after `--`
+    if args.proxy_args[:1] == ["--"]:
+        args.proxy_args = args.proxy_args[1:]
+    if not 0.0 <= args.hit_ratio <= 1.0:
+        print("--hit-ratio must be between 0 and 1")
+        return
+
+    try:
+        result = asyncio.run(run_bench_async(args))
+    except RuntimeError as exc:
+        print(f"Benchmark failed: {exc}")
+        return
+
+    if args.json:
+        print(json.dumps(asdict(result)))
+    else:
+        print_result(result, args.hit_ratio)
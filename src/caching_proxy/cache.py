@@ -1,71 +1,378 @@
 import time
 from abc import ABC, abstractmethod
+from bisect import bisect_right
+from fnmatch import fnmatchcase
 
-from src.caching_proxy.schemas import CachedBucket, DataToCache
+from src.caching_proxy.config import settings
+from src.caching_proxy.eviction import make_eviction_policy
+from src.caching_proxy.expiry import ExpiryQueue
+from src.caching_proxy.invalidation import VARIANT_SEPARATOR, PurgeIndex, get_surrogate_keys
+from src.caching_proxy.schemas import CachedBucket, CacheStats, DataToCache, KeyInfo
+
+# stale heap items tolerated before the expiry queue is rebuilt from the live entries
+EXPIRY_QUEUE_SLACK = 1024
+# positions of rewritten or removed keys tolerated before the scan index drops them
+SCAN_INDEX_SLACK = 1024
+# index slots a scan may examine per requested key, so a selective filter can not hold the loop for long
+SCAN_WORK_FACTOR = 10
+
+
+def key_matches(key: str, prefix: str, match: str | None) -> bool:
+    return key.startswith(prefix) and (match is None or fnmatchcase(key, match))
+
+
+class ScanIndex:
+    """
+    Cursor positions for incremental key listing. Every insert takes the next sequence number, so a cursor
+    is the last number handed out and resuming is a bisect into the append-only list of numbers.
+    A key rewritten during a scan moves to the end and may be listed twice, like with Redis SCAN;
+    keys left untouched are listed exactly once.
+    """
+
+    def __init__(self) -> None:
+        self._seqs: list[int] = []
+        self._keys: dict[int, str] = {}
+        self._positions: dict[str, int] = {}
+        self._next = 0
+
+    def add(self, key: str) -> None:
+        self.discard(key)
+        self._next += 1
+        self._seqs.append(self._next)
+        self._keys[self._next] = key
+        self._positions[key] = self._next
+        if len(self._seqs) > 2 * len(self._keys) + SCAN_INDEX_SLACK:
+            self._seqs = [seq for seq in self._seqs if seq in self._keys]
+
+    def discard(self, key: str) -> None:
+        seq = self._positions.pop(key, None)
+        if seq is not None:
+            del self._keys[seq]
+
+    def clear(self) -> None:
+        self._seqs.clear()
+        self._keys.clear()
+        self._positions.clear()
+
+    def page(self, cursor: int, budget: int) -> tuple[list[tuple[int, str]], int | None]:
+        """Returns the live keys among the next `budget` positions after `cursor`, and where to resume."""
+        start = bisect_right(self._seqs, cursor)
+        window = self._seqs[start : start + budget]
+        live = [(seq, self._keys[seq]) for seq in window if seq in self._keys]
+        if start + budget >= len(self._seqs):
+            return live, None
+        return live, window[-1]
 
 
 class Cache(ABC):
+    """
+    Storage of cached responses. Lookups and writes are coroutines, since a backend may live in another
+    process or on another host; in-process backends simply never suspend. Active expiry and the counters
+    of record_stale_hit are kept by the process itself, so those calls stay synchronous.
+    """
+
     @abstractmethod
-    def getval(self, key) -> None | DataToCache:
+    async def getval(self, key) -> None | DataToCache:
         raise NotImplementedError
 
     @abstractmethod
-    def setval(self, key: str, value: DataToCache, ttl: int = 0) -> None:
+    async def getstale(self, key, max_stale: int) -> None | DataToCache:
+        """
+        Returns the entry even if it expired no more than `max_stale` seconds ago. It is not counted as a hit,
+        the entry may only be revalidated; record_stale_hit counts it once it is actually served.
+        """
         raise NotImplementedError
 
     @abstractmethod
-    def delval(self, key: str) -> None:
+    def record_stale_hit(self, key: str) -> bool:
+        """Counts a stale response served from the entry; returns False when the key is not stored."""
         raise NotImplementedError
 
     @abstractmethod
-    def clear(self) -> None:
+    async def setval(self, key: str, value: DataToCache, ttl: int = 0, stale_ttl: int = 0) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delval(self, key: str) -> None:
         raise NotImplementedError
 
-    @property
     @abstractmethod
-    def keys(self) -> list[tuple[str, float | None]]:
+    async def clear(self) -> None:
         raise NotImplementedError
 
+    @abstractmethod
+    async def scan(
+        self,
+        cursor: str | None,
+        count: int,
+        prefix: str = "",
+        match: str | None = None,
+    ) -> tuple[list[KeyInfo], str | None]:
+        """
+        Lists up to `count` live keys starting after `cursor`, optionally filtered by prefix and glob.
+        Returns the page and the cursor to resume from, None once the scan is complete.
+        A page may be short, or empty, while the cursor is not None.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def purge_key(self, key: str) -> int:
+        """Removes the entry and every variant stored under it; returns how many entries were removed."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def purge_prefix(self, prefix: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def purge_tag(self, tag: str) -> int:
+        """Removes every entry whose response carried the tag in `Surrogate-Key` or `Cache-Tag`."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_stats(self) -> CacheStats:
+        raise NotImplementedError
+
+    def expire(self, time_budget: float) -> int:
+        """Removes entries past their retention, spending at most about `time_budget` seconds; returns how many."""
+        return 0
+
+    @property
+    def next_expiration(self) -> float | None:
+        """When the next entry stops being retained, None if nothing is scheduled."""
+        return None
+
+    async def close(self) -> None:
+        pass
+
+
+def entry_size(key: str, value: DataToCache) -> int:
+    headers_size = sum(len(k) + len(v) for k, v in value.headers.items())
+    return len(key) + headers_size + len(value.body)
+
 
 class InMemoryCache(Cache):
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        max_entries: int = settings.CACHE_MAX_ENTRIES,
+        max_bytes: int = settings.CACHE_MAX_BYTES,
+        policy: str = settings.CACHE_EVICTION_POLICY,
+    ) -> None:
         self._store: dict[str, CachedBucket] = {}
+        self._policy = make_eviction_policy(policy)
+        self._max_entries = max(max_entries, 0)
+        self._max_bytes = max(max_bytes, 0)
+        self._size = 0
+        self._expiry = ExpiryQueue()
+        self._scan_index = ScanIndex()
+        self._purge_index = PurgeIndex()
+        # bumped by every purge and clear, so a snapshot restore can tell it is about to bring back removed keys
+        self.purge_generation = 0
 
-    def getval(self, key) -> None | DataToCache:
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._rejections = 0
+
+    async def getval(self, key) -> None | DataToCache:
         entry: CachedBucket | None = self._store.get(key, None)
         if not entry:
+            self._misses += 1
             return None
 
         if entry.ttl and entry.expires_at and entry.expires_at < time.time():
-            del self._store[key]
+            if not self.is_retained(entry, time.time()):
+                self._remove(key)
+                self._expirations += 1
+            self._misses += 1
             return None
 
+        self._policy.record_access(key)
+        self._hits += 1
+        entry.hits += 1
         return entry.value
 
-    def setval(self, key: str, value: DataToCache, ttl: int = 0) -> None:
-        bucket = CachedBucket(ttl=ttl, value=value)
+    async def getstale(self, key, max_stale: int) -> None | DataToCache:
+        entry: CachedBucket | None = self._store.get(key, None)
+        if not entry:
+            return None
+
+        if entry.ttl and entry.expires_at and entry.expires_at + max_stale < time.time():
+            return None
+
+        self._policy.record_access(key)
+        return entry.value
+
+    def record_stale_hit(self, key: str) -> bool:
+        entry = self._store.get(key)
+        if entry is None:
+            return False
+        self._stale_hits += 1
+        entry.hits += 1
+        return True
+
+    async def setval(self, key: str, value: DataToCache, ttl: int = 0, stale_ttl: int = 0) -> None:
+        bucket = CachedBucket(ttl=ttl, stale_ttl=stale_ttl, value=value)
         if ttl:
             bucket.expires_at = time.time() + ttl
+        self.setbucket(key, bucket)
+
+    def setbucket(self, key: str, bucket: CachedBucket) -> None:
+        """Stores a prepared bucket as is, keeping its original expiration time."""
+        size = entry_size(key, bucket.value)
+        if self._max_bytes and size > self._max_bytes:
+            self._rejections += 1
+            if key in self._store:
+                self._remove(key)
+            return
+        bucket.size = size
+
+        previous = self._store.get(key)
+        if previous is not None:
+            self._size -= previous.size
         self._store[key] = bucket
+        self._size += size
+        self._policy.record_insert(key)
+        self._expiry.schedule(key, self.retained_until(bucket))
+        self._scan_index.add(key)
+        self._purge_index.add(key, get_surrogate_keys(bucket.value.headers))
+        self._enforce_limits()
 
-    def delval(self, key: str) -> None:
+    def restore(self, key: str, bucket: CachedBucket) -> bool:
+        """Inserts a bucket loaded from a snapshot, unless the key was cached again in the meantime."""
         if key in self._store:
-            del self._store[key]
+            return False
+        self.setbucket(key, bucket)
+        return True
 
-    def clear(self) -> None:
+    def items(self) -> list[tuple[str, CachedBucket]]:
+        return list(self._store.items())
+
+    async def delval(self, key: str) -> None:
+        if key in self._store:
+            self._remove(key)
+
+    async def clear(self) -> None:
+        self.purge_generation += 1
         self._store.clear()
+        self._policy.clear()
+        self._expiry.clear()
+        self._scan_index.clear()
+        self._purge_index.clear()
+        self._size = 0
+
+    async def scan(
+        self,
+        cursor: str | None,
+        count: int,
+        prefix: str = "",
+        match: str | None = None,
+    ) -> tuple[list[KeyInfo], str | None]:
+        # entries past retention are skipped here and left to the active expiry
+        now = time.time()
+        page: list[KeyInfo] = []
+        positions, next_cursor = self._scan_index.page(int(cursor or 0), count * SCAN_WORK_FACTOR)
+        for seq, key in positions:
+            entry = self._store[key]
+            if not self.is_retained(entry, now) or not key_matches(key, prefix, match):
+                continue
+            page.append(KeyInfo(key=key, expires_at=entry.expires_at, size=entry.size, hits=entry.hits))
+            if len(page) >= count:
+                return page, str(seq)
+        return page, None if next_cursor is None else str(next_cursor)
+
+    async def purge_key(self, key: str) -> int:
+        return self._purge(self._purge_index.by_prefix(key + VARIANT_SEPARATOR) + [key])
+
+    async def purge_prefix(self, prefix: str) -> int:
+        return self._purge(self._purge_index.by_prefix(prefix))
+
+    async def purge_tag(self, tag: str) -> int:
+        return self._purge(self._purge_index.by_tag(tag))
+
+    def hit_count(self, key: str) -> int:
+        entry = self._store.get(key)
+        return entry.hits if entry is not None else 0
+
+    def expire(self, time_budget: float) -> int:
+        started = time.perf_counter()
+        removed = 0
+        for deadline, key in self._expiry.pop_due(time.time()):
+            entry = self._store.get(key)
+            if entry is not None and self.retained_until(entry) == deadline:
+                self._remove(key)
+                removed += 1
+            if time.perf_counter() - started >= time_budget:
+                break
+
+        self._expirations += removed
+        if len(self._expiry) > 2 * len(self._store) + EXPIRY_QUEUE_SLACK:
+            self._expiry.rebuild((key, self.retained_until(entry)) for key, entry in self._store.items())
+        return removed
 
     @property
-    def keys(self) -> list[tuple[str, float | None]]:
-        cache_items = list(self._store.items())
-        relevant_items = list(
-            filter(
-                lambda item: not item[1].ttl or item[1].expires_at and item[1].expires_at > time.time(),
-                cache_items,
-            ),
+    def next_expiration(self) -> float | None:
+        return self._expiry.next_deadline
+
+    async def get_stats(self) -> CacheStats:
+        return CacheStats(
+            policy=self._policy.name,
+            entries=len(self._store),
+            bytes=self._size,
+            max_entries=self._max_entries,
+            max_bytes=self._max_bytes,
+            hits=self._hits,
+            stale_hits=self._stale_hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            expirations=self._expirations,
+            rejections=self._rejections,
         )
-        self._store = dict(relevant_items)
-        return list(map(lambda item: (item[0], item[1].expires_at), relevant_items))
 
+    @staticmethod
+    def is_retained(entry: CachedBucket, now: float) -> bool:
+        if not entry.ttl or not entry.expires_at:
+            return True
+        return entry.expires_at + entry.stale_ttl > now
+
+    @staticmethod
+    def retained_until(entry: CachedBucket) -> float | None:
+        if not entry.ttl or not entry.expires_at:
+            return None
+        return entry.expires_at + entry.stale_ttl
+
+    def _remove(self, key: str) -> None:
+        entry = self._store.pop(key)
+        self._size -= entry.size
+        self._policy.record_remove(key)
+        self._scan_index.discard(key)
+        self._purge_index.discard(key)
+
+    def _purge(self, keys: list[str]) -> int:
+        self.purge_generation += 1
+        removed = 0
+        for key in keys:
+            if key in self._store:
+                self._remove(key)
+                removed += 1
+        return removed
+
+    def _is_over_limits(self) -> bool:
+        if self._max_entries and len(self._store) > self._max_entries:
+            return True
+        return bool(self._max_bytes and self._size > self._max_bytes)
 
-cache = InMemoryCache()
+    def _enforce_limits(self) -> None:
+        while self._is_over_limits():
+            victim = self._policy.select_victim()
+            if victim is None:
+                break
+            entry = self._store.pop(victim, None)
+            if entry is None:
+                continue
+            self._scan_index.discard(victim)
+            self._purge_index.discard(victim)
+            self._size -= entry.size
+            self._evictions += 1
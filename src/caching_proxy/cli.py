@@ -1,29 +1,53 @@
 import argparse
+import importlib
 import subprocess
 import sys
 import time
 from pathlib import Path
+from urllib.parse import urlsplit
 
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
 from src.caching_proxy.client import client
 from src.caching_proxy.config import settings
-from src.caching_proxy.schemas import AppConfig, AppStatus
-from src.caching_proxy.server import run_server
 from src.caching_proxy.utils import CachingHelper, cfg
 
 
-def show_server_info(server: AppStatus, prefix: str = "") -> None:
+class RegistryChoices:
+    """
+    Choices of an option read from a registry dict on first use, so a module that pulls in the server
+    stack is only imported when the option is actually parsed, not by every command.
+    """
+
+    def __init__(self, module: str, registry: str, *extra: str) -> None:
+        self._module = module
+        self._registry = registry
+        self._extra = extra
+        self._names: list[str] | None = None
+
+    def _get_names(self) -> list[str]:
+        if self._names is None:
+            self._names = [*self._extra, *getattr(importlib.import_module(self._module), self._registry)]
+        return self._names
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._get_names()
+
+    def __iter__(self):
+        return iter(self._get_names())
+
+
+def show_server_info(server: dict, prefix: str = "") -> None:
     if prefix:
         print(prefix)
 
-    host = CachingHelper.join_host_and_port(settings.HOST, server.port)
+    host = CachingHelper.join_host_and_port(settings.HOST, server["port"])
     print(f"Host:   {host}")
-    print(f"Origin: {server.origin}")
-    print(f"TTL:    {server.ttl}s")
+    print(f"Origin: {server['origin']}")
+    print(f"TTL:    {server['ttl']}s")
 
 
-def get_server_on_port(port: int) -> AppStatus | None:
+def get_server_on_port(port: int) -> dict | None:
     status = client.get_status(port)
     if status is None:
         host = CachingHelper.join_host_and_port(settings.HOST, port)
@@ -39,13 +63,85 @@ def run_proxy_detached(args):
         "-m",
         module_path,
         "run",
-        "-o",
-        args.origin,
         "-p",
         str(args.port),
         "--ttl",
         str(args.ttl),
+        "--max-ttl",
+        str(args.max_ttl),
+        "--max-entries",
+        str(args.max_entries),
+        "--max-bytes",
+        str(args.max_bytes),
+        "--eviction",
+        args.eviction,
+        "--stale-while-revalidate",
+        str(args.stale_while_revalidate),
+        "--stale-if-error",
+        str(args.stale_if_error),
+        "--revalidate-window",
+        str(args.revalidate_window),
+        "--max-cacheable-size",
+        str(args.max_cacheable_size),
+        "--compression",
+        args.compression,
+        "--compression-min-size",
+        str(args.compression_min_size),
+        "--negative-ttl",
+        args.negative_ttl,
+        "--negative-max-entries",
+        str(args.negative_max_entries),
+        "--admission",
+        args.admission,
+        "--admission-min-hits",
+        str(args.admission_min_hits),
+        "--admission-max-bytes-per-hit",
+        str(args.admission_max_bytes_per_hit),
+        "--cache-backend",
+        args.cache_backend,
+        "--disk-max-bytes",
+        str(args.disk_max_bytes),
+        "--redis-url",
+        args.redis_url,
+        "--workers",
+        str(args.workers),
+        "--balancer",
+        args.balancer,
+        "--max-connections",
+        str(args.max_connections),
+        "--max-keepalive-connections",
+        str(args.max_keepalive_connections),
+        "--keepalive-expiry",
+        str(args.keepalive_expiry),
+        "--pool-timeout",
+        str(args.pool_timeout),
+        "--limiter",
+        args.limiter,
+        "--limit-max",
+        str(args.limit_max),
+        "--queue-size",
+        str(args.queue_size),
+        "--queue-timeout",
+        str(args.queue_timeout),
+        "--circuit-failure-ratio",
+        str(args.circuit_failure_ratio),
+        "--circuit-open-time",
+        str(args.circuit_open_time),
     ]
+    if args.circuit_breaker:
+        cmd.append("--circuit-breaker")
+    if args.http2:
+        cmd.append("--http2")
+    if args.origin:
+        cmd.extend(["-o", args.origin])
+    if args.routes:
+        cmd.extend(["--routes", args.routes])
+    if args.hash_keys:
+        cmd.append("--hash-keys")
+    if args.cache_dir:
+        cmd.extend(["--cache-dir", args.cache_dir])
+    if args.snapshot:
+        cmd.extend(["--snapshot", args.snapshot])
     if sys.platform == "win32":
         subprocess.Popen(
             cmd,
@@ -61,6 +157,10 @@ def run_proxy_detached(args):
 
 
 def run_proxy(args):
+    if not args.origin and not args.routes:
+        print("Nothing to proxy: pass an origin with -o or a routes file with --routes")
+        return
+
     status = get_server_on_port(args.port)
     if status is not None:
         show_server_info(status, prefix="Proxy server is already running:")
@@ -69,6 +169,9 @@ def run_proxy(args):
         run_proxy_detached(args)
         return
 
+    # the server stack is imported only here, management commands never load it
+    from src.caching_proxy.server import run_server
+
     run_server(args)
 
 
@@ -81,14 +184,13 @@ def status_proxy(args):
         show_server_info(status, prefix="Proxy server is running:")
         return
 
-    config: AppConfig = cfg.read_config()
-    servers = config.servers
+    servers = cfg.read_servers()
     if not servers:
         print("No proxy servers are running!")
         return
 
     for i, server in enumerate(iterable=servers, start=1):
-        status = client.get_status(server.port)
+        status = client.get_status(server["port"])
         if status:
             show_server_info(status, prefix=f"\nproxy server {i} is running")
 
@@ -121,24 +223,135 @@ def clear_cache(args):
     print(f"Failed to clear cache on {host}")
 
 
+def purge_cache(args):
+    status = get_server_on_port(port=args.port)
+    if status is None:
+        return
+
+    host = CachingHelper.join_host_and_port(settings.HOST, args.port)
+    result = client.purge(args.port, key=args.key, prefix=args.prefix, tag=args.tag, host=args.host)
+    if result is None:
+        print(f"Failed to purge cache on {host}")
+        return
+
+    print(f"Purged {result['removed']} entries on {host}")
+
+
 def show_keys(args):
     status = get_server_on_port(args.port)
     if not status:
         return
 
-    keys = client.get_keys(args.port)
-    if not keys:
-        print("Cache is empty")
-        return
-
-    print(f"Cache keys ({len(keys)}):")
+    shown = 0
     current_time = time.time()
-    for i, key in enumerate(keys, 1):
+    for info in client.iter_keys(args.port, prefix=args.prefix, match=args.match):
+        if args.limit and shown >= args.limit:
+            break
+        if not shown:
+            print("Cache keys:")
+        shown += 1
+
         expires = "N/A"
-        if key[1] is not None:
-            expires = str(key[1] - current_time)
+        if info["expires_at"] is not None:
+            expires = f"{info['expires_at'] - current_time:.1f}"
+
+        print(f"{shown:>3}. {info['key']: <50} SIZE: {info['size']:>8} HITS: {info['hits']:>6} EXPIRES IN: {expires} sec")
+
+    if not shown:
+        print("Cache is empty" if not (args.prefix or args.match) else "No keys match")
 
-        print(f"{i:>3}. {key[0]: <50} EXPIRES IN: {expires} sec")
+
+def show_stats(args):
+    status = get_server_on_port(args.port)
+    if not status:
+        return
+
+    stats = client.get_stats(args.port)
+    if stats is None:
+        print("Failed to fetch cache stats")
+        return
+
+    cache_stats = stats["cache"]
+    lookups = cache_stats["hits"] + cache_stats["misses"]
+    hit_ratio = cache_stats["hits"] / lookups * 100 if lookups else 0.0
+    max_entries = cache_stats["max_entries"] or "unlimited"
+    max_bytes = cache_stats["max_bytes"] or "unlimited"
+    print(f"Policy:      {cache_stats['policy']}")
+    print(f"Entries:     {cache_stats['entries']} / {max_entries}")
+    print(f"Bytes:       {cache_stats['bytes']} / {max_bytes}")
+    print(f"Hits:        {cache_stats['hits']} ({hit_ratio:.1f}%)")
+    print(f"Stale hits:  {cache_stats['stale_hits']}")
+    print(f"Misses:      {cache_stats['misses']}")
+    print(f"Evictions:   {cache_stats['evictions']}")
+    print(f"Expirations: {cache_stats['expirations']}")
+    print(f"Rejections:  {cache_stats['rejections']}")
+    coalescing = stats["coalescing"]
+    print(f"Origin:      {coalescing['leaders']} fetches, {coalescing['coalesced']} coalesced")
+    revalidation = stats["revalidation"]
+    print(
+        f"Revalidated: {revalidation['not_modified']} not modified, {revalidation['modified']} modified, "
+        f"{revalidation['bytes_saved']} bytes saved"
+    )
+    admission = stats["admission"]
+    if admission is not None:
+        rejected = ", ".join(f"{count} {reason}" for reason, count in admission["rejected"].items()) or "none"
+        print(f"Admission:   {admission['sketch']}, {admission['admitted']} admitted, rejected: {rejected}")
+    negative = stats["negative"]
+    if negative is not None:
+        print(f"Negative:    {negative['entries']} entries, {negative['hits']} hits, {negative['misses']} misses")
+    for upstream in stats["upstreams"]:
+        state = "EJECTED" if upstream["ejected"] else "up"
+        print(
+            f"Upstream:    {upstream['route']} -> {upstream['url']} {state}, {upstream['requests']} requests, "
+            f"{upstream['outstanding']} in flight, {upstream['ewma_ms']:.1f}ms EWMA, {upstream['ejections']} ejections"
+        )
+        connections = upstream["connections_opened"] + upstream["connections_reused"]
+        reuse = upstream["connections_reused"] / connections * 100 if connections else 0.0
+        print(
+            f"             {upstream['connections_opened']} connections opened, {reuse:.1f}% reused, "
+            f"{upstream['pool_wait_ms']:.2f}ms mean pool wait"
+        )
+    for route in stats["routes"]:
+        shed = ", ".join(f"{count} {reason}" for reason, count in route["shed"].items()) or "none"
+        limit = f"{route['limiter']} limit {route['limit']:.1f}" if route["limiter"] != "none" else "no limit"
+        print(
+            f"Overload:    {route['route']} {limit}, {route['in_flight']} in flight, {route['queued']} queued, "
+            f"shed: {shed}, circuit {route['circuit']} (opened {route['circuit_opened']} times)"
+        )
+
+
+def warm_cache(args):
+    status = get_server_on_port(args.port)
+    if not status:
+        return
+
+    try:
+        lines = Path(args.urls).read_text().splitlines()
+    except OSError as exc:
+        print(f"Failed to read {args.urls}: {exc}")
+        return
+
+    paths = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        url = urlsplit(line)
+        # full URLs are accepted too, only their path and query are requested through the proxy
+        path = url.path or "/"
+        paths.append(f"{path}?{url.query}" if url.query else path)
+
+    start_time = time.time()
+    results = client.warm(args.port, paths, args.concurrency)
+    elapsed = time.time() - start_time
+    summary = ", ".join(f"{cache_status}: {count}" for cache_status, count in results.most_common())
+    print(f"Warmed {len(paths)} URLs in {elapsed:.2f}s ({summary or 'nothing to do'})")
+
+
+def bench_proxy(args):
+    from src.caching_proxy.bench import run_bench
+
+    run_bench(args)
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -153,22 +366,339 @@ def build_parser() -> argparse.ArgumentParser:
     parser_run = subparsers.add_parser("run", help="Run the caching proxy server")
     parser_run.add_argument(*port_arg["flags"], **{k: v for k, v in port_arg.items() if k != "flags"}, required=True)
     parser_run.add_argument("-d", "--detached", action="store_true", help="Run the server in detached mode")
-    parser_run.add_argument("-o", "--origin", type=str, required=True, help="Origin server URL")
-    parser_run.add_argument("--ttl", type=int, default=settings.TTL, help=f"TTL in seconds, default: {settings.TTL}")
+    parser_run.add_argument(
+        "-o",
+        "--origin",
+        type=str,
+        default=None,
+        help="Origin server URL, or several comma-separated instances to balance between",
+    )
+    parser_run.add_argument(
+        "--routes",
+        type=str,
+        default=None,
+        help="JSON file with routes by path prefix or host to their own origins, TTL and cache policy",
+    )
+    parser_run.add_argument(
+        "--balancer",
+        type=str,
+        choices=RegistryChoices("src.caching_proxy.routing", "BALANCERS"),
+        metavar="BALANCER",
+        default=settings.UPSTREAM_BALANCER,
+        help=f"How requests are spread over the instances of a route: %(choices)s, default: {settings.UPSTREAM_BALANCER}",
+    )
+    parser_run.add_argument(
+        "--max-connections",
+        type=int,
+        default=settings.HTTPX_MAX_CONNECTIONS,
+        help=f"Max open connections to all origins together, 0 = unlimited, default: {settings.HTTPX_MAX_CONNECTIONS}",
+    )
+    parser_run.add_argument(
+        "--max-keepalive-connections",
+        type=int,
+        default=settings.HTTPX_MAX_KEEP_ALIVE_CONNECTIONS,
+        help=f"Idle connections kept open for reuse, default: {settings.HTTPX_MAX_KEEP_ALIVE_CONNECTIONS}",
+    )
+    parser_run.add_argument(
+        "--keepalive-expiry",
+        type=float,
+        default=settings.HTTPX_KEEPALIVE_EXPIRY,
+        help=f"Seconds an idle connection is kept open, default: {settings.HTTPX_KEEPALIVE_EXPIRY}",
+    )
+    parser_run.add_argument(
+        "--pool-timeout",
+        type=float,
+        default=settings.HTTPX_POOL_TIMEOUT,
+        help=f"Seconds to wait for a free connection before answering 503, default: {settings.HTTPX_POOL_TIMEOUT}",
+    )
+    parser_run.add_argument(
+        "--http2",
+        action="store_true",
+        default=settings.HTTPX_HTTP2,
+        help="Multiplex origin requests over HTTP/2 where the origin supports it, needs the h2 package",
+    )
+    parser_run.add_argument(
+        "--limiter",
+        type=str,
+        choices=RegistryChoices("src.caching_proxy.overload", "LIMITERS", "none"),
+        metavar="LIMITER",
+        default=settings.ORIGIN_LIMITER,
+        help="Adaptive limit on concurrent origin requests per route, lowered when origin latency rises: "
+        f"aimd or gradient, default: {settings.ORIGIN_LIMITER}",
+    )
+    parser_run.add_argument(
+        "--limit-max",
+        type=int,
+        default=settings.ORIGIN_LIMIT_MAX,
+        help=f"Upper bound of the adaptive limit, default: {settings.ORIGIN_LIMIT_MAX}",
+    )
+    parser_run.add_argument(
+        "--queue-size",
+        type=int,
+        default=settings.ORIGIN_QUEUE_SIZE,
+        help=f"Requests that may wait for a slot over the limit before the rest get 503, default: {settings.ORIGIN_QUEUE_SIZE}",
+    )
+    parser_run.add_argument(
+        "--queue-timeout",
+        type=float,
+        default=settings.ORIGIN_QUEUE_TIMEOUT,
+        help=f"Seconds a request waits for a slot before it gets 503, default: {settings.ORIGIN_QUEUE_TIMEOUT}",
+    )
+    parser_run.add_argument(
+        "--circuit-breaker",
+        action="store_true",
+        help="Stop contacting a failing origin for a while, answering from stale entries or with 503",
+    )
+    parser_run.add_argument(
+        "--circuit-failure-ratio",
+        type=float,
+        default=settings.CIRCUIT_FAILURE_RATIO,
+        help=f"Share of failed origin requests that opens the circuit, default: {settings.CIRCUIT_FAILURE_RATIO}",
+    )
+    parser_run.add_argument(
+        "--circuit-open-time",
+        type=float,
+        default=settings.CIRCUIT_OPEN_TIME,
+        help=f"Seconds the circuit stays open before probing the origin, default: {settings.CIRCUIT_OPEN_TIME}",
+    )
+    parser_run.add_argument(
+        "--ttl",
+        type=int,
+        default=settings.TTL,
+        help=f"TTL in seconds for responses without Cache-Control max-age or Expires, default: {settings.TTL}",
+    )
+    parser_run.add_argument(
+        "--max-ttl",
+        type=int,
+        default=settings.MAX_TTL,
+        help=f"Upper bound in seconds for any TTL, including one set by the origin, 0 = no cap, default: {settings.MAX_TTL}",
+    )
+    parser_run.add_argument(
+        "--max-entries",
+        type=int,
+        default=settings.CACHE_MAX_ENTRIES,
+        help=f"Max number of cached entries, 0 = unlimited, default: {settings.CACHE_MAX_ENTRIES}",
+    )
+    parser_run.add_argument(
+        "--max-bytes",
+        type=int,
+        default=settings.CACHE_MAX_BYTES,
+        help=f"Max total size of cached entries in bytes, 0 = unlimited, default: {settings.CACHE_MAX_BYTES}",
+    )
+    parser_run.add_argument(
+        "--eviction",
+        type=str,
+        choices=RegistryChoices("src.caching_proxy.eviction", "EVICTION_POLICIES"),
+        metavar="POLICY",
+        default=settings.CACHE_EVICTION_POLICY,
+        help=f"Cache eviction policy: %(choices)s, default: {settings.CACHE_EVICTION_POLICY}",
+    )
+    parser_run.add_argument(
+        "--stale-while-revalidate",
+        type=int,
+        default=settings.STALE_WHILE_REVALIDATE,
+        help="Seconds an expired entry is still served (X-Cache: STALE) while it is refreshed in background, "
+        f"default: {settings.STALE_WHILE_REVALIDATE}",
+    )
+    parser_run.add_argument(
+        "--stale-if-error",
+        type=int,
+        default=settings.STALE_IF_ERROR,
+        help=f"Seconds an expired entry is served when the origin fails, default: {settings.STALE_IF_ERROR}",
+    )
+    parser_run.add_argument(
+        "--revalidate-window",
+        type=int,
+        default=settings.REVALIDATE_WINDOW,
+        help="Seconds an expired entry with ETag or Last-Modified is kept to revalidate it with a conditional request, "
+        f"0 = always refetch, default: {settings.REVALIDATE_WINDOW}",
+    )
+    parser_run.add_argument(
+        "--max-cacheable-size",
+        type=int,
+        default=settings.MAX_CACHEABLE_SIZE,
+        help=f"Largest response body in bytes that is kept in the cache, default: {settings.MAX_CACHEABLE_SIZE}",
+    )
+    parser_run.add_argument(
+        "--compression",
+        type=str,
+        choices=RegistryChoices("src.caching_proxy.compression", "COMPRESSION_CHOICES"),
+        metavar="CODEC",
+        default=settings.CACHE_COMPRESSION,
+        help="Codec for cached text bodies: %(choices)s; auto picks br, zstd or gzip, whichever is installed first, "
+        f"default: {settings.CACHE_COMPRESSION}",
+    )
+    parser_run.add_argument(
+        "--compression-min-size",
+        type=int,
+        default=settings.COMPRESSION_MIN_SIZE,
+        help=f"Bodies smaller than this many bytes are stored uncompressed, default: {settings.COMPRESSION_MIN_SIZE}",
+    )
+    parser_run.add_argument(
+        "--admission",
+        type=str,
+        choices=RegistryChoices("src.caching_proxy.admission", "SKETCHES", "none"),
+        metavar="SKETCH",
+        default=settings.CACHE_ADMISSION,
+        help="Only store responses for URLs requested repeatedly, counted with a count-min sketch "
+        f"or told apart from one-time requests with a bloom filter, default: {settings.CACHE_ADMISSION}",
+    )
+    parser_run.add_argument(
+        "--admission-min-hits",
+        type=int,
+        default=settings.ADMISSION_MIN_HITS,
+        help=f"Requests for a URL before its response is stored, default: {settings.ADMISSION_MIN_HITS}",
+    )
+    parser_run.add_argument(
+        "--admission-max-bytes-per-hit",
+        type=int,
+        default=settings.ADMISSION_MAX_BYTES_PER_HIT,
+        help="Largest body size divided by the requests seen for its URL that is stored, "
+        "so large objects need more requests to get in, 0 = no limit, default: 0",
+    )
+    parser_run.add_argument(
+        "--negative-ttl",
+        type=str,
+        default=settings.NEGATIVE_TTL,
+        help="Seconds to cache error responses by status, an exact code or a class, e.g. 404=30,410=300,5xx=2. "
+        "Served with X-Cache: NEG-HIT from a separate store, default: off",
+    )
+    parser_run.add_argument(
+        "--negative-max-entries",
+        type=int,
+        default=settings.NEGATIVE_CACHE_MAX_ENTRIES,
+        help=f"Size of the negative cache in entries, default: {settings.NEGATIVE_CACHE_MAX_ENTRIES}",
+    )
+    parser_run.add_argument(
+        "--cache-backend",
+        type=str,
+        choices=["memory", "disk", "tiered", "shared", "redis"],
+        default=settings.CACHE_BACKEND,
+        help="Where cached responses are stored: memory, memory-mapped disk segments, "
+        "hot entries in memory backed by disk, a cache server shared by all local workers, "
+        f"or an external Redis-compatible server, default: {settings.CACHE_BACKEND}",
+    )
+    parser_run.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help=f"Directory for the disk cache, default: {settings.CACHE_DIR}",
+    )
+    parser_run.add_argument(
+        "--snapshot",
+        type=str,
+        nargs="?",
+        const=str(settings.SNAPSHOT_FILE),
+        default=None,
+        help="Save the memory cache to this file on shutdown and load it in background on startup, "
+        f"default file: {settings.SNAPSHOT_FILE}",
+    )
+    parser_run.add_argument(
+        "--disk-max-bytes",
+        type=int,
+        default=settings.DISK_CACHE_MAX_BYTES,
+        help=f"Disk space budget of the disk cache in bytes, default: {settings.DISK_CACHE_MAX_BYTES}",
+    )
+    parser_run.add_argument(
+        "--redis-url",
+        type=str,
+        default=settings.REDIS_URL,
+        help=f"Redis-compatible server for --cache-backend redis, default: {settings.REDIS_URL}",
+    )
+    parser_run.add_argument(
+        "--workers",
+        type=int,
+        default=settings.WORKERS,
+        help=f"Number of worker processes, default: {settings.WORKERS}",
+    )
+    parser_run.add_argument(
+        "--hash-keys",
+        action="store_true",
+        default=settings.CACHE_KEY_HASH,
+        help="Store entries under fixed-length digests of the cache key instead of the key itself",
+    )
     parser_run.set_defaults(func=run_proxy)
 
     parser_clear = subparsers.add_parser("clear", help="Cleans the cache")
     parser_clear.add_argument(*port_arg["flags"], **{k: v for k, v in port_arg.items() if k != "flags"}, required=True)
     parser_clear.set_defaults(func=clear_cache)
 
+    parser_purge = subparsers.add_parser("purge", help="Removes selected entries from the cache")
+    parser_purge.add_argument(*port_arg["flags"], **{k: v for k, v in port_arg.items() if k != "flags"}, required=True)
+    purge_target = parser_purge.add_mutually_exclusive_group(required=True)
+    purge_target.add_argument(
+        "--key", type=str, help="Path with query of one URL, its variants are purged too, e.g. '/api/items?page=2'"
+    )
+    purge_target.add_argument("--prefix", type=str, help="Every URL under this path, e.g. '/static/'")
+    purge_target.add_argument("--tag", type=str, help="Every response the origin tagged with Surrogate-Key or Cache-Tag")
+    parser_purge.add_argument("--host", type=str, default=None, help="Host of the route serving the URLs, for host routes")
+    parser_purge.set_defaults(func=purge_cache)
+
     parser_stop = subparsers.add_parser("stop", help="Stop the proxy server")
     parser_stop.add_argument(*port_arg["flags"], **{k: v for k, v in port_arg.items() if k != "flags"}, required=True)
     parser_stop.set_defaults(func=stop_proxy)
 
     parser_keys = subparsers.add_parser("keys", help="Displays all keys stored in the cache")
     parser_keys.add_argument(*port_arg["flags"], **{k: v for k, v in port_arg.items() if k != "flags"}, required=True)
+    parser_keys.add_argument("--prefix", type=str, default="", help="Only keys starting with this prefix, e.g. 'GET api/'")
+    parser_keys.add_argument("--match", type=str, default=None, help="Only keys matching this glob, e.g. 'GET *?page=*'")
+    parser_keys.add_argument("--limit", type=int, default=0, help="Stop after this many keys, 0 = all")
     parser_keys.set_defaults(func=show_keys)
 
+    parser_stats = subparsers.add_parser("stats", help="Displays cache size and eviction counters")
+    parser_stats.add_argument(*port_arg["flags"], **{k: v for k, v in port_arg.items() if k != "flags"}, required=True)
+    parser_stats.set_defaults(func=show_stats)
+
+    parser_warm = subparsers.add_parser("warm", help="Prefetches a list of paths into the cache")
+    parser_warm.add_argument(*port_arg["flags"], **{k: v for k, v in port_arg.items() if k != "flags"}, required=True)
+    parser_warm.add_argument("--urls", type=str, required=True, help="File with one path or URL per line")
+    parser_warm.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=settings.WARM_CONCURRENCY,
+        help=f"Max requests in flight, default: {settings.WARM_CONCURRENCY}",
+    )
+    parser_warm.set_defaults(func=warm_cache)
+
+    parser_bench = subparsers.add_parser(
+        "bench",
+        help="Load-tests a fresh proxy against a local stub origin",
+        description="Starts a stub origin and a proxy in front of it, drives the proxy and reports throughput, "
+        "latency, peak memory and origin requests. Options after `--` are passed to `run`, "
+        "e.g. `caching-proxy bench -- --cache-backend tiered`",
+    )
+    parser_bench.add_argument("-n", "--requests", type=int, default=settings.BENCH_REQUESTS, help="Measured requests")
+    parser_bench.add_argument("-c", "--concurrency", type=int, default=settings.BENCH_CONCURRENCY, help="Requests in flight")
+    parser_bench.add_argument(
+        "--hit-ratio",
+        type=float,
+        default=settings.BENCH_HIT_RATIO,
+        help=f"Share of requests to already cached URLs, the rest are new URLs, default: {settings.BENCH_HIT_RATIO}",
+    )
+    parser_bench.add_argument(
+        "--hot-keys",
+        type=int,
+        default=settings.BENCH_HOT_KEYS,
+        help=f"Number of cached URLs the hits are spread over, default: {settings.BENCH_HOT_KEYS}",
+    )
+    parser_bench.add_argument(
+        "--origin-latency",
+        type=float,
+        default=settings.BENCH_ORIGIN_LATENCY,
+        help=f"Seconds the stub origin takes per response, default: {settings.BENCH_ORIGIN_LATENCY}",
+    )
+    parser_bench.add_argument(
+        "--body-size",
+        type=int,
+        default=settings.BENCH_BODY_SIZE,
+        help=f"Stub origin response body in bytes, default: {settings.BENCH_BODY_SIZE}",
+    )
+    parser_bench.add_argument("-p", "--port", type=int, default=0, help="Proxy port, default: a free one")
+    parser_bench.add_argument("--json", action="store_true", help="Print the result as one JSON object")
+    parser_bench.add_argument("proxy_args", nargs=argparse.REMAINDER, help="Options for the proxy after `--`")
+    parser_bench.set_defaults(func=bench_proxy)
+
     parser_health = subparsers.add_parser("health", help="Displays basic info about running proxy server")
     parser_health.add_argument(*port_arg["flags"], **{k: v for k, v in port_arg.items() if k != "flags"}, required=False)
     parser_health.set_defaults(func=status_proxy)
@@ -1,51 +1,153 @@
+import http.client
+import json
 import posixpath
 import sys
+from collections import Counter
+from contextlib import contextmanager
 from pathlib import Path
-from urllib.parse import urljoin
-
-import httpx
+from typing import Iterator
+from urllib.parse import urlencode
 
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
 from src.caching_proxy.config import settings
-from src.caching_proxy.schemas import AppStatus
 from src.caching_proxy.utils import CachingHelper
 
 
 class ProxyClient:
+    """
+    Client of the management API. It speaks plain http.client, every CLI command creates it and importing httpx
+    would take longer than most of them run; only `warm`, which needs concurrent requests, loads asyncio and httpx.
+    Responses are returned as parsed JSON, the pydantic schemas they are built from are never loaded here.
+    """
+
     def __init__(self, host: str):
         self.host = host
 
-    def _build_url(self, port: int, endpoint: str) -> str:
-        host_port = CachingHelper.join_host_and_port(self.host, port)
-        return urljoin(host_port, posixpath.join(settings.API_PREFIX_MANAGEMENT, endpoint))
+    def _build_path(self, endpoint: str, params: dict[str, str] | None = None) -> str:
+        path = "/" + posixpath.join(settings.API_PREFIX_MANAGEMENT, endpoint)
+        return f"{path}?{urlencode(params)}" if params else path
+
+    @contextmanager
+    def _open(
+        self,
+        method: str,
+        port: int,
+        endpoint: str,
+        params: dict[str, str] | None = None,
+        timeout: float = 1.0,
+    ) -> Iterator[http.client.HTTPResponse]:
+        conn = http.client.HTTPConnection(self.host, port, timeout=timeout)
+        try:
+            conn.request(method, self._build_path(endpoint, params), headers=settings.HTTPX_HEADERS)
+            yield conn.getresponse()
+        finally:
+            conn.close()
 
-    def _request(self, method: str, port: int, endpoint: str, **kwargs) -> httpx.Response | None:
-        url = self._build_url(port, endpoint)
+    def _request(self, method: str, port: int, endpoint: str, **params: str) -> tuple[int, bytes] | None:
         try:
-            return httpx.request(method, url, headers=settings.HTTPX_HEADERS, timeout=1.0, **kwargs)
-        except httpx.RequestError:
+            with self._open(method, port, endpoint, params) as resp:
+                return resp.status, resp.read()
+        except (OSError, http.client.HTTPException):
             return None
 
-    def get_status(self, port: int) -> AppStatus | None:
-        resp = self._request("GET", port, settings.API_PREFIX_HEALTH)
-        if resp and resp.is_success:
-            return AppStatus.model_validate(resp.json())
-        return None
+    @staticmethod
+    def _is_success(result: tuple[int, bytes] | None) -> bool:
+        return result is not None and 200 <= result[0] < 300
+
+    def _parse(self, result: tuple[int, bytes] | None) -> dict | None:
+        if not self._is_success(result):
+            return None
+        try:
+            return json.loads(result[1])
+        except ValueError:
+            return None
+
+    def get_status(self, port: int) -> dict | None:
+        """The server's AppStatus."""
+        return self._parse(self._request("GET", port, settings.API_PREFIX_HEALTH))
 
     def shutdown(self, port: int) -> bool:
-        resp = self._request("POST", port, settings.API_PREFIX_SHUTDOWN)
-        return resp is not None
+        result = self._request("POST", port, settings.API_PREFIX_SHUTDOWN)
+        return result is not None
 
     def clear_cache(self, port: int) -> bool:
-        resp = self._request("POST", port, settings.API_PREFIX_CLEAR)
-        return resp is not None
-
-    def get_keys(self, port: int) -> list[tuple[str, float | None]]:
-        resp = self._request("GET", port, settings.API_PREFIX_KEYS)
-        if resp and resp.is_success:
-            return resp.json().get("keys", [])
-        return []
+        result = self._request("POST", port, settings.API_PREFIX_CLEAR)
+        return result is not None
+
+    def purge(
+        self,
+        port: int,
+        key: str | None = None,
+        prefix: str | None = None,
+        tag: str | None = None,
+        host: str | None = None,
+    ) -> dict | None:
+        """The PurgeResult with the number of removed entries."""
+        params = {
+            name: value for name, value in (("key", key), ("prefix", prefix), ("tag", tag), ("host", host)) if value is not None
+        }
+        return self._parse(self._request("POST", port, settings.API_PREFIX_PURGE, **params))
+
+    def iter_keys(self, port: int, prefix: str = "", match: str | None = None) -> Iterator[dict]:
+        """
+        Streams KeyInfo dicts as the server scans them, so large caches are never held in one response.
+        Only the key names seen so far are kept, to drop the repeats a Redis SCAN of the shared backend may return.
+        """
+        params = {"format": "ndjson", "prefix": prefix}
+        if match is not None:
+            params["match"] = match
+        seen: set[str] = set()
+        try:
+            with self._open("GET", port, settings.API_PREFIX_KEYS, params, timeout=settings.HTTPX_READ_TIMEOUT) as resp:
+                if not 200 <= resp.status < 300:
+                    return
+                for line in resp:
+                    if not line.strip():
+                        continue
+                    info = json.loads(line)
+                    if info["key"] not in seen:
+                        seen.add(info["key"])
+                        yield info
+        except (OSError, http.client.HTTPException, ValueError):
+            return
+
+    def warm(self, port: int, paths: list[str], concurrency: int) -> Counter[str]:
+        """Requests every path through the proxy, at most `concurrency` at a time, and counts X-Cache results."""
+        import asyncio
+
+        return asyncio.run(self._warm(port, paths, concurrency))
+
+    async def _warm(self, port: int, paths: list[str], concurrency: int) -> Counter[str]:
+        import asyncio
+
+        import httpx
+
+        results: Counter[str] = Counter()
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+        base_url = CachingHelper.join_host_and_port(self.host, port)
+
+        async with httpx.AsyncClient(base_url=base_url, headers=settings.HTTPX_HEADERS, timeout=settings.HTTPX_TIMEOUT) as client:
+
+            async def fetch(path: str) -> None:
+                async with semaphore:
+                    try:
+                        resp = await client.get(path)
+                        await resp.aclose()
+                    except httpx.HTTPError:
+                        results["ERROR"] += 1
+                        return
+                if resp.is_success:
+                    results[resp.headers.get("X-Cache", "N/A")] += 1
+                else:
+                    results["ERROR"] += 1
+
+            await asyncio.gather(*(fetch(path) for path in paths))
+        return results
+
+    def get_stats(self, port: int) -> dict | None:
+        """The ServerStats of the cache, origins and routes."""
+        return self._parse(self._request("GET", port, settings.API_PREFIX_STATS))
 
 
 client = ProxyClient(settings.HOST)
@@ -0,0 +1,67 @@
+import asyncio
+from typing import Awaitable, Callable, TypeVar
+
+from src.caching_proxy.schemas import CoalescingStats
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into a single in-flight task."""
+
+    def __init__(self) -> None:
+        self._calls: dict[str, asyncio.Future] = {}
+        self._leaders = 0
+        self._coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = self.spawn(key, func)
+        else:
+            self._coalesced += 1
+
+        # shield: a disconnecting client must not cancel the fetch other waiters depend on
+        return await asyncio.shield(task)
+
+    def join(self, key: str) -> asyncio.Future | None:
+        """Returns the in-flight call for `key`, if any, counting the caller as coalesced."""
+        flight = self._calls.get(key)
+        if flight is not None:
+            self._coalesced += 1
+        return flight
+
+    def begin(self, key: str) -> asyncio.Future:
+        """Registers the caller as the leader for `key`; it must resolve the returned future itself."""
+        flight = asyncio.get_running_loop().create_future()
+        self._register(key, flight)
+        return flight
+
+    def spawn(self, key: str, func: Callable[[], Awaitable[T]]) -> asyncio.Task:
+        """Starts the call for `key` without waiting for it, unless one is already in flight."""
+        task = self._calls.get(key)
+        if task is not None:
+            return task
+
+        task = asyncio.ensure_future(func())
+        self._register(key, task)
+        return task
+
+    def _register(self, key: str, flight: asyncio.Future) -> None:
+        self._calls[key] = flight
+        flight.add_done_callback(lambda f: self._forget(key, f))
+        self._leaders += 1
+
+    def _forget(self, key: str, flight: asyncio.Future) -> None:
+        if self._calls.get(key) is flight:
+            del self._calls[key]
+        if not flight.cancelled():
+            flight.exception()
+
+    @property
+    def stats(self) -> CoalescingStats:
+        return CoalescingStats(
+            leaders=self._leaders,
+            coalesced=self._coalesced,
+            in_flight=len(self._calls),
+        )
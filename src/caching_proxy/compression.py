@@ -0,0 +1,76 @@
+import gzip
+from dataclasses import dataclass
+from typing import Callable
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+
+@dataclass(frozen=True, slots=True)
+class Codec:
+    name: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+def _build_codecs() -> dict[str, Codec]:
+    """Available codecs, most preferred first: brotli and zstd need optional packages, gzip is always there."""
+    codecs: dict[str, Codec] = {}
+    if brotli is not None:
+        codecs["br"] = Codec("br", lambda data: brotli.compress(data, quality=5), brotli.decompress)
+    if zstd is not None:
+        codecs["zstd"] = Codec("zstd", lambda data: zstd.compress(data, 3), zstd.decompress)
+    codecs["gzip"] = Codec("gzip", lambda data: gzip.compress(data, compresslevel=6, mtime=0), gzip.decompress)
+    return codecs
+
+
+CODECS = _build_codecs()
+COMPRESSION_CHOICES = ("auto", "none", "br", "zstd", "gzip")
+
+
+def get_codec(name: str) -> Codec | None:
+    if name == "none":
+        return None
+    if name == "auto":
+        return next(iter(CODECS.values()))
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(
+            f"Compression {name} is not available, install the package providing it or use one of: {', '.join(CODECS)}"
+        )
+
+
+def is_compressible(content_type: str, compressible_types: list[str]) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return any(media_type.startswith(prefix) or media_type.endswith(prefix) for prefix in compressible_types)
+
+
+def accepts_encoding(accept_encoding: str, encoding: str) -> bool:
+    """Checks an Accept-Encoding value, honouring q=0 exclusions and the `*` wildcard."""
+    wildcard = False
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name == encoding:
+            return quality > 0
+        if name == "*":
+            wildcard = quality > 0
+    return wildcard
@@ -1,19 +1,116 @@
+import json
+import os
 from pathlib import Path
+from typing import TYPE_CHECKING, get_origin, get_type_hints
 
-import httpx
-from pydantic_settings import BaseSettings
+if TYPE_CHECKING:
+    import httpx
 
+TRUE_VALUES = frozenset(("1", "true", "t", "yes", "y", "on"))
+FALSE_VALUES = frozenset(("0", "false", "f", "no", "n", "off"))
 
-class ProxyConfig(BaseSettings):
+
+def parse_env_value(name: str, value: str, annotation: type):
+    kind = get_origin(annotation) or annotation
+    if kind is bool:
+        flag = value.strip().lower()
+        if flag not in TRUE_VALUES | FALSE_VALUES:
+            raise ValueError(f"Invalid boolean for {name}: {value!r}")
+        return flag in TRUE_VALUES
+    if kind in (list, dict):
+        parsed = json.loads(value)
+        if not isinstance(parsed, kind):
+            raise ValueError(f"Expected a JSON {kind.__name__} for {name}: {value!r}")
+        return parsed
+    return kind(value)
+
+
+class EnvSettings:
+    """
+    Fields overridden by environment variables of the same name, in any case; lists and dicts are given as JSON.
+    Every CLI command reads its defaults from here, so it stays on the standard library instead of pydantic-settings.
+    """
+
+    def __init__(self) -> None:
+        environ = {name.upper(): value for name, value in os.environ.items()}
+        for name, annotation in get_type_hints(type(self)).items():
+            if name.upper() in environ:
+                setattr(self, name, parse_env_value(name, environ[name.upper()], annotation))
+            elif isinstance(default := getattr(self, name, None), (list, dict)):
+                # the class attributes are only defaults, every instance gets its own list or dict
+                setattr(self, name, default.copy())
+
+
+class ProxyConfig(EnvSettings):
     TTL: int = 60
+    MAX_TTL: int = 0
     PORT: int = 3000
     HOST: str = "localhost"
 
+    CACHE_MAX_ENTRIES: int = 100_000
+    CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    CACHE_EVICTION_POLICY: str = "lru"
+    CACHE_BACKEND: str = "memory"
+    DISK_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024
+    DISK_CACHE_SEGMENT_SIZE: int = 64 * 1024 * 1024
+    REDIS_URL: str = "redis://localhost:6379/0"
+    WORKERS: int = 1
+    CACHE_KEY_HASH: bool = False
+    CACHE_KEY_MEMO_SIZE: int = 4096
+    STALE_WHILE_REVALIDATE: int = 0
+    STALE_IF_ERROR: int = 0
+    REVALIDATE_WINDOW: int = 300
+    MAX_CACHEABLE_SIZE: int = 10 * 1024 * 1024
+    RANGE_MAX_PARTS: int = 16
+    NEGATIVE_TTL: str = ""
+    CACHE_ADMISSION: str = "none"
+    ADMISSION_MIN_HITS: int = 2
+    ADMISSION_MAX_BYTES_PER_HIT: int = 0
+    ADMISSION_SKETCH_DEPTH: int = 4
+    NEGATIVE_CACHE_MAX_ENTRIES: int = 10_000
+    NEGATIVE_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+    CACHE_COMPRESSION: str = "auto"
+    COMPRESSION_MIN_SIZE: int = 1024
+    WARM_CONCURRENCY: int = 16
+    BENCH_REQUESTS: int = 10_000
+    BENCH_CONCURRENCY: int = 64
+    BENCH_HIT_RATIO: float = 0.9
+    BENCH_HOT_KEYS: int = 1000
+    BENCH_ORIGIN_LATENCY: float = 0.01
+    BENCH_BODY_SIZE: int = 4096
+    EXPIRY_INTERVAL: float = 1.0
+    KEYS_PAGE_SIZE: int = 1000
+    KEYS_MAX_PAGE_SIZE: int = 10_000
+    EXPIRY_TIME_BUDGET: float = 0.005
+    UPSTREAM_BALANCER: str = "round-robin"
+    UPSTREAM_EWMA_ALPHA: float = 0.3
+    UPSTREAM_EJECT_FAILURES: int = 5
+    UPSTREAM_EJECT_TIME: float = 30.0
+    UPSTREAM_FAILURE_PENALTY: float = 1.0
+    ORIGIN_LIMITER: str = "none"
+    ORIGIN_LIMIT_INITIAL: int = 20
+    ORIGIN_LIMIT_MIN: int = 1
+    ORIGIN_LIMIT_MAX: int = 100
+    ORIGIN_LIMIT_BACKOFF: float = 0.9
+    ORIGIN_LIMIT_TOLERANCE: float = 2.0
+    ORIGIN_LIMIT_WINDOW: float = 30.0
+    ORIGIN_QUEUE_SIZE: int = 100
+    ORIGIN_QUEUE_TIMEOUT: float = 1.0
+    COALESCE_TIMEOUT: float = 10.0
+    CIRCUIT_FAILURE_RATIO: float = 0.5
+    CIRCUIT_MIN_REQUESTS: int = 20
+    CIRCUIT_WINDOW: float = 10.0
+    CIRCUIT_OPEN_TIME: float = 5.0
+    CIRCUIT_HALF_OPEN_PROBES: int = 3
+
     API_PREFIX_MANAGEMENT: str = "__management"
     API_PREFIX_HEALTH: str = "__health"
     API_PREFIX_SHUTDOWN: str = "__shutdown"
     API_PREFIX_KEYS: str = "__keys"
     API_PREFIX_CLEAR: str = "__clear"
+    API_PREFIX_PURGE: str = "__purge"
+    API_PREFIX_STATS: str = "__stats"
+    API_PREFIX_METRICS: str = "__metrics"
 
     BASE_DIR: Path = Path(__file__).resolve().parent.parent.parent
 
@@ -29,16 +126,35 @@ class ProxyConfig(BaseSettings):
     def LOG_FILE(self):
         return self.LOG_DIR / "proxy.log"
 
+    @property
+    def CACHE_DIR(self) -> Path:
+        return self.BASE_DIR / "cache"
+
+    @property
+    def SNAPSHOT_FILE(self) -> Path:
+        return self.CACHE_DIR / "snapshot.bin"
+
     @property
     def APP_CONFIG_FILE(self) -> Path:
         return self.BASE_DIR / "config.json"
 
-    HTTPX_TIMEOUT: httpx.Timeout = httpx.Timeout(
-        connect=10.0,
-        read=30.0,
-        write=10.0,
-        pool=10.0,
-    )
+    HTTPX_CONNECT_TIMEOUT: float = 10.0
+    HTTPX_READ_TIMEOUT: float = 30.0
+    HTTPX_WRITE_TIMEOUT: float = 10.0
+    HTTPX_POOL_TIMEOUT: float = 10.0
+
+    @property
+    def HTTPX_TIMEOUT(self) -> "httpx.Timeout":
+        # httpx is imported on use, the management commands load the settings without it
+        import httpx
+
+        return httpx.Timeout(
+            connect=self.HTTPX_CONNECT_TIMEOUT,
+            read=self.HTTPX_READ_TIMEOUT,
+            write=self.HTTPX_WRITE_TIMEOUT,
+            pool=self.HTTPX_POOL_TIMEOUT,
+        )
+
     HTTPX_HEADERS: dict = {
         "User-Agent": "curl/7.68.0",
         "Accept": "*/*",
@@ -46,6 +162,8 @@ class ProxyConfig(BaseSettings):
     HTTPX_FOLLOW_REDIRECTS: bool = True
     HTTPX_MAX_CONNECTIONS: int = 100
     HTTPX_MAX_KEEP_ALIVE_CONNECTIONS: int = 20
+    HTTPX_KEEPALIVE_EXPIRY: float = 5.0
+    HTTPX_HTTP2: bool = False
 
     REQUEST_EXCLUDED_HEADERS: list[str] = [
         "host",
@@ -53,6 +171,17 @@ class ProxyConfig(BaseSettings):
         "keep-alive",
         "proxy-connection",
         "transfer-encoding",
+        "accept-encoding",
+    ]
+
+    COMPRESSIBLE_CONTENT_TYPES: list[str] = [
+        "text/",
+        "application/json",
+        "application/javascript",
+        "application/xml",
+        "image/svg+xml",
+        "+json",
+        "+xml",
     ]
 
     RESPONSE_EXCLUDED_HEADERS: list[str] = [
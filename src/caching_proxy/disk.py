@@ -0,0 +1,520 @@
+import json
+import mmap
+import os
+import struct
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from src.caching_proxy.cache import EXPIRY_QUEUE_SLACK, SCAN_WORK_FACTOR, Cache, InMemoryCache, ScanIndex, key_matches
+from src.caching_proxy.config import settings
+from src.caching_proxy.expiry import ExpiryQueue
+from src.caching_proxy.invalidation import VARIANT_SEPARATOR, PurgeIndex, get_surrogate_keys
+from src.caching_proxy.logconfig import get_logger
+from src.caching_proxy.schemas import CachedBucket, CacheStats, DataToCache, KeyInfo
+
+logger = get_logger("cache")
+
+RECORD_MAGIC = b"CPX1"
+# magic, flags, status_code, ttl, stale_ttl, expires_at, key_len, headers_len, body_len
+RECORD_HEADER = struct.Struct("<4sHHIIdIIQ")
+FLAG_TOMBSTONE = 1
+
+
+@dataclass(slots=True)
+class DiskEntry:
+    segment_id: int
+    body_offset: int
+    body_len: int
+    record_len: int
+    status_code: int
+    headers: dict[str, str]
+    ttl: int
+    stale_ttl: int
+    expires_at: float | None
+    hits: int = 0
+
+    @property
+    def retained_until(self) -> float | None:
+        if not self.ttl or not self.expires_at:
+            return None
+        return self.expires_at + self.stale_ttl
+
+
+@dataclass(slots=True)
+class Segment:
+    id: int
+    path: Path
+    data: mmap.mmap
+    capacity: int
+    offset: int = 0
+    keys: set[str] = field(default_factory=set)
+
+
+class DiskCache(Cache):
+    """
+    Log-structured cache: records are appended to fixed-size memory-mapped segment files
+    and only a compact index of keys, expiration and headers is kept in memory.
+    Bodies are returned as memoryview slices of the segment, without copying.
+    When the disk budget is exceeded the oldest segment is dropped as a whole.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        max_bytes: int = settings.DISK_CACHE_MAX_BYTES,
+        segment_size: int = settings.DISK_CACHE_SEGMENT_SIZE,
+    ) -> None:
+        self._dir = directory
+        self._segment_size = segment_size
+        self._max_segments = max(max_bytes // segment_size, 2)
+        self._segments: dict[int, Segment] = {}
+        self._index: dict[str, DiskEntry] = {}
+        self._size = 0
+        self._expiry = ExpiryQueue()
+        self._scan_index = ScanIndex()
+        self._purge_index = PurgeIndex()
+
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._rejections = 0
+
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._load_segments()
+        if not self._segments:
+            self._open_segment(1)
+
+    async def getval(self, key) -> None | DataToCache:
+        entry = self._index.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+
+        now = time.time()
+        if entry.ttl and entry.expires_at and entry.expires_at < now:
+            if entry.expires_at + entry.stale_ttl <= now:
+                self._forget(key)
+                self._expirations += 1
+            self._misses += 1
+            return None
+
+        self._hits += 1
+        entry.hits += 1
+        return self._read(entry)
+
+    async def getstale(self, key, max_stale: int) -> None | DataToCache:
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+
+        if entry.ttl and entry.expires_at and entry.expires_at + max_stale < time.time():
+            return None
+
+        return self._read(entry)
+
+    def record_stale_hit(self, key: str) -> bool:
+        entry = self._index.get(key)
+        if entry is None:
+            return False
+        self._stale_hits += 1
+        entry.hits += 1
+        return True
+
+    def getbucket(self, key: str) -> CachedBucket | None:
+        """Returns the entry with its expiration metadata, used to promote it into a faster tier."""
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        return CachedBucket(
+            ttl=entry.ttl,
+            expires_at=entry.expires_at,
+            stale_ttl=entry.stale_ttl,
+            value=self._read(entry),
+        )
+
+    async def setval(self, key: str, value: DataToCache, ttl: int = 0, stale_ttl: int = 0) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        self._append(key, value, ttl, stale_ttl, expires_at)
+
+    def setbucket(self, key: str, bucket: CachedBucket) -> None:
+        self._append(key, bucket.value, bucket.ttl, bucket.stale_ttl, bucket.expires_at)
+
+    async def delval(self, key: str) -> None:
+        if key in self._index:
+            self._delete(key)
+
+    async def clear(self) -> None:
+        for segment_id in list(self._segments):
+            self._drop_segment(segment_id)
+        self._index.clear()
+        self._expiry.clear()
+        self._scan_index.clear()
+        self._purge_index.clear()
+        self._size = 0
+        self._open_segment(1)
+
+    async def scan(
+        self,
+        cursor: str | None,
+        count: int,
+        prefix: str = "",
+        match: str | None = None,
+    ) -> tuple[list[KeyInfo], str | None]:
+        now = time.time()
+        page: list[KeyInfo] = []
+        positions, next_cursor = self._scan_index.page(int(cursor or 0), count * SCAN_WORK_FACTOR)
+        for seq, key in positions:
+            entry = self._index[key]
+            if (entry.retained_until is not None and entry.retained_until <= now) or not key_matches(key, prefix, match):
+                continue
+            page.append(KeyInfo(key=key, expires_at=entry.expires_at, size=entry.record_len, hits=entry.hits))
+            if len(page) >= count:
+                return page, str(seq)
+        return page, None if next_cursor is None else str(next_cursor)
+
+    async def purge_key(self, key: str) -> int:
+        return self._purge(self._purge_index.by_prefix(key + VARIANT_SEPARATOR) + [key])
+
+    async def purge_prefix(self, prefix: str) -> int:
+        return self._purge(self._purge_index.by_prefix(prefix))
+
+    async def purge_tag(self, tag: str) -> int:
+        return self._purge(self._purge_index.by_tag(tag))
+
+    def expire(self, time_budget: float) -> int:
+        """Drops expired keys from the index; their records stay in the segment until it is recycled."""
+        started = time.perf_counter()
+        removed = 0
+        for deadline, key in self._expiry.pop_due(time.time()):
+            entry = self._index.get(key)
+            if entry is not None and entry.retained_until == deadline:
+                self._forget(key)
+                removed += 1
+            if time.perf_counter() - started >= time_budget:
+                break
+
+        self._expirations += removed
+        if len(self._expiry) > 2 * len(self._index) + EXPIRY_QUEUE_SLACK:
+            self._expiry.rebuild((key, entry.retained_until) for key, entry in self._index.items())
+        return removed
+
+    @property
+    def next_expiration(self) -> float | None:
+        return self._expiry.next_deadline
+
+    async def get_stats(self) -> CacheStats:
+        return CacheStats(
+            policy="fifo-segments",
+            entries=len(self._index),
+            bytes=self._size,
+            max_entries=0,
+            max_bytes=self._max_segments * self._segment_size,
+            hits=self._hits,
+            stale_hits=self._stale_hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            expirations=self._expirations,
+            rejections=self._rejections,
+        )
+
+    async def close(self) -> None:
+        for segment in self._segments.values():
+            segment.data.flush()
+
+    def _read(self, entry: DiskEntry) -> DataToCache:
+        segment = self._segments[entry.segment_id]
+        body = memoryview(segment.data)[entry.body_offset : entry.body_offset + entry.body_len]
+        return DataToCache(status_code=entry.status_code, headers=entry.headers, body=body)
+
+    def _append(
+        self,
+        key: str,
+        value: DataToCache,
+        ttl: int,
+        stale_ttl: int,
+        expires_at: float | None,
+    ) -> None:
+        headers = json.dumps(value.headers, separators=(",", ":")).encode()
+        entry = self._write_record(key, 0, value.status_code, ttl, stale_ttl, expires_at, headers, value.body)
+        if entry is None:
+            self._rejections += 1
+            if key in self._index:
+                self._forget(key)
+            return
+
+        entry.headers = dict(value.headers)
+        self._remember(key, entry)
+
+    def _write_record(
+        self,
+        key: str,
+        flags: int,
+        status_code: int,
+        ttl: int,
+        stale_ttl: int,
+        expires_at: float | None,
+        headers: bytes,
+        body: bytes | memoryview,
+    ) -> DiskEntry | None:
+        key_bytes = key.encode()
+        record_len = RECORD_HEADER.size + len(key_bytes) + len(headers) + len(body)
+        if record_len > self._segment_size:
+            return None
+
+        segment = self._active_segment()
+        if segment.offset + record_len > segment.capacity:
+            segment = self._rotate()
+
+        start = segment.offset
+        body_offset = start + RECORD_HEADER.size + len(key_bytes) + len(headers)
+        data = segment.data
+        data[start + RECORD_HEADER.size : body_offset] = key_bytes + headers
+        data[body_offset : body_offset + len(body)] = body
+        # the header goes in last, so a record torn by a crash is never seen as valid on load
+        data[start : start + RECORD_HEADER.size] = RECORD_HEADER.pack(
+            RECORD_MAGIC,
+            flags,
+            status_code,
+            ttl,
+            stale_ttl,
+            expires_at or 0.0,
+            len(key_bytes),
+            len(headers),
+            len(body),
+        )
+        segment.offset += record_len
+
+        return DiskEntry(
+            segment_id=segment.id,
+            body_offset=body_offset,
+            body_len=len(body),
+            record_len=record_len,
+            status_code=status_code,
+            headers={},
+            ttl=ttl,
+            stale_ttl=stale_ttl,
+            expires_at=expires_at,
+        )
+
+    def _remember(self, key: str, entry: DiskEntry) -> None:
+        if key in self._index:
+            self._forget(key)
+        self._index[key] = entry
+        self._segments[entry.segment_id].keys.add(key)
+        self._size += entry.record_len
+        self._expiry.schedule(key, entry.retained_until)
+        self._scan_index.add(key)
+        self._purge_index.add(key, get_surrogate_keys(entry.headers))
+
+    def _forget(self, key: str) -> None:
+        entry = self._index.pop(key)
+        self._segments[entry.segment_id].keys.discard(key)
+        self._size -= entry.record_len
+        self._scan_index.discard(key)
+        self._purge_index.discard(key)
+
+    def _delete(self, key: str) -> None:
+        self._forget(key)
+        # the tombstone keeps the deleted record from being resurrected on restart
+        self._write_record(key, FLAG_TOMBSTONE, 0, 0, 0, None, b"", b"")
+
+    def _purge(self, keys: list[str]) -> int:
+        removed = 0
+        for key in keys:
+            if key in self._index:
+                self._delete(key)
+                removed += 1
+        return removed
+
+    def _active_segment(self) -> Segment:
+        return self._segments[max(self._segments)]
+
+    def _rotate(self) -> Segment:
+        segment = self._open_segment(max(self._segments) + 1)
+        while len(self._segments) > self._max_segments:
+            oldest = min(self._segments)
+            self._evictions += len(self._segments[oldest].keys)
+            for key in list(self._segments[oldest].keys):
+                self._forget(key)
+            self._drop_segment(oldest)
+        return segment
+
+    def _segment_path(self, segment_id: int) -> Path:
+        return self._dir / f"segment-{segment_id:08d}.dat"
+
+    def _open_segment(self, segment_id: int) -> Segment:
+        path = self._segment_path(segment_id)
+        with open(path, "w+b") as f:
+            f.truncate(self._segment_size)
+            data = mmap.mmap(f.fileno(), self._segment_size)
+        segment = Segment(id=segment_id, path=path, data=data, capacity=self._segment_size)
+        self._segments[segment_id] = segment
+        return segment
+
+    def _drop_segment(self, segment_id: int) -> None:
+        segment = self._segments.pop(segment_id)
+        # the mapping is not closed explicitly: bodies still being sent may reference it
+        try:
+            os.remove(segment.path)
+        except OSError as exc:
+            logger.warning("Failed to remove cache segment %s: %s", segment.path, exc)
+
+    def _load_segments(self) -> None:
+        for path in sorted(self._dir.glob("segment-*.dat")):
+            try:
+                segment_id = int(path.stem.split("-")[1])
+                with open(path, "r+b") as f:
+                    capacity = os.fstat(f.fileno()).st_size
+                    data = mmap.mmap(f.fileno(), capacity)
+            except (OSError, ValueError) as exc:
+                logger.warning("Skipping unreadable cache segment %s: %s", path, exc)
+                continue
+
+            segment = Segment(id=segment_id, path=path, data=data, capacity=capacity)
+            self._segments[segment_id] = segment
+            self._scan_segment(segment)
+
+        logger.info("Loaded %s cached entries from %s", len(self._index), self._dir)
+
+    def _scan_segment(self, segment: Segment) -> None:
+        data = segment.data
+        now = time.time()
+        offset = 0
+        while offset + RECORD_HEADER.size <= segment.capacity:
+            magic, flags, status_code, ttl, stale_ttl, expires_at, key_len, headers_len, body_len = RECORD_HEADER.unpack_from(
+                data, offset
+            )
+            record_len = RECORD_HEADER.size + key_len + headers_len + body_len
+            if magic != RECORD_MAGIC or offset + record_len > segment.capacity:
+                break
+
+            key_start = offset + RECORD_HEADER.size
+            key = data[key_start : key_start + key_len].decode()
+            if key in self._index:
+                self._forget(key)
+
+            is_dead = flags & FLAG_TOMBSTONE or ttl and expires_at + stale_ttl <= now
+            if not is_dead:
+                headers_start = key_start + key_len
+                entry = DiskEntry(
+                    segment_id=segment.id,
+                    body_offset=headers_start + headers_len,
+                    body_len=body_len,
+                    record_len=record_len,
+                    status_code=status_code,
+                    headers=json.loads(data[headers_start : headers_start + headers_len]),
+                    ttl=ttl,
+                    stale_ttl=stale_ttl,
+                    expires_at=expires_at or None,
+                )
+                self._remember(key, entry)
+            offset += record_len
+
+        segment.offset = offset
+
+
+class TieredCache(Cache):
+    """Hot entries live in memory, every entry is written through to disk and promoted back on a disk hit."""
+
+    def __init__(self, hot: InMemoryCache, cold: DiskCache) -> None:
+        self._hot = hot
+        self._cold = cold
+
+    async def getval(self, key) -> None | DataToCache:
+        value = await self._hot.getval(key)
+        if value is not None:
+            return value
+
+        value = await self._cold.getval(key)
+        if value is not None:
+            self._promote(key)
+        return value
+
+    async def getstale(self, key, max_stale: int) -> None | DataToCache:
+        value = await self._hot.getstale(key, max_stale)
+        if value is not None:
+            return value
+        return await self._cold.getstale(key, max_stale)
+
+    def record_stale_hit(self, key: str) -> bool:
+        # getstale served the hot copy when there was one
+        return self._hot.record_stale_hit(key) or self._cold.record_stale_hit(key)
+
+    async def setval(self, key: str, value: DataToCache, ttl: int = 0, stale_ttl: int = 0) -> None:
+        await self._hot.setval(key, value, ttl, stale_ttl)
+        await self._cold.setval(key, value, ttl, stale_ttl)
+
+    async def delval(self, key: str) -> None:
+        await self._hot.delval(key)
+        await self._cold.delval(key)
+
+    async def clear(self) -> None:
+        await self._hot.clear()
+        await self._cold.clear()
+
+    async def scan(
+        self,
+        cursor: str | None,
+        count: int,
+        prefix: str = "",
+        match: str | None = None,
+    ) -> tuple[list[KeyInfo], str | None]:
+        # every entry is on disk, the hot tier only adds the hits it served
+        page, next_cursor = await self._cold.scan(cursor, count, prefix, match)
+        for info in page:
+            info.hits += self._hot.hit_count(info.key)
+        return page, next_cursor
+
+    # the hot tier holds a subset of the disk entries, unless the disk already recycled some of them
+    async def purge_key(self, key: str) -> int:
+        return max(await self._hot.purge_key(key), await self._cold.purge_key(key))
+
+    async def purge_prefix(self, prefix: str) -> int:
+        return max(await self._hot.purge_prefix(prefix), await self._cold.purge_prefix(prefix))
+
+    async def purge_tag(self, tag: str) -> int:
+        return max(await self._hot.purge_tag(tag), await self._cold.purge_tag(tag))
+
+    async def get_stats(self) -> CacheStats:
+        hot = await self._hot.get_stats()
+        cold = await self._cold.get_stats()
+        return CacheStats(
+            policy=f"{hot.policy}+{cold.policy}",
+            entries=cold.entries,
+            bytes=hot.bytes + cold.bytes,
+            max_entries=hot.max_entries,
+            max_bytes=hot.max_bytes + cold.max_bytes,
+            hits=hot.hits + cold.hits,
+            stale_hits=hot.stale_hits + cold.stale_hits,
+            misses=cold.misses,
+            evictions=cold.evictions,
+            expirations=hot.expirations + cold.expirations,
+            rejections=cold.rejections,
+            tiers=[hot, cold],
+        )
+
+    def expire(self, time_budget: float) -> int:
+        return self._hot.expire(time_budget / 2) + self._cold.expire(time_budget / 2)
+
+    @property
+    def next_expiration(self) -> float | None:
+        deadlines = [d for d in (self._hot.next_expiration, self._cold.next_expiration) if d is not None]
+        return min(deadlines, default=None)
+
+    async def close(self) -> None:
+        await self._hot.close()
+        await self._cold.close()
+
+    def _promote(self, key: str) -> None:
+        bucket = self._cold.getbucket(key)
+        if bucket is not None:
+            # copy the body out of the segment so the hot tier does not pin its mapping
+            bucket.value = DataToCache(
+                status_code=bucket.value.status_code,
+                headers=dict(bucket.value.headers),
+                body=bytes(bucket.value.body),
+            )
+            self._hot.setbucket(key, bucket)
@@ -0,0 +1,224 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class EvictionPolicy(ABC):
+    name: str
+
+    @abstractmethod
+    def record_insert(self, key: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def record_access(self, key: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def record_remove(self, key: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def select_victim(self) -> str | None:
+        """Pops the next key to evict from the policy's bookkeeping."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class LRUPolicy(EvictionPolicy):
+    name = "lru"
+
+    def __init__(self) -> None:
+        self._order: OrderedDict[str, None] = OrderedDict()
+
+    def record_insert(self, key: str) -> None:
+        self._order[key] = None
+        self._order.move_to_end(key)
+
+    def record_access(self, key: str) -> None:
+        if key in self._order:
+            self._order.move_to_end(key)
+
+    def record_remove(self, key: str) -> None:
+        self._order.pop(key, None)
+
+    def select_victim(self) -> str | None:
+        if not self._order:
+            return None
+        key, _ = self._order.popitem(last=False)
+        return key
+
+    def clear(self) -> None:
+        self._order.clear()
+
+
+class LFUPolicy(EvictionPolicy):
+    """
+    O(1) LFU: keys are grouped into frequency buckets, ties are broken by recency. The non-empty buckets are
+    linked in ascending order of frequency, so the lowest one is known after any insert, access or removal.
+    """
+
+    name = "lfu"
+
+    def __init__(self) -> None:
+        self._freq: dict[str, int] = {}
+        self._buckets: dict[int, OrderedDict[str, None]] = {}
+        # neighbours of each non-empty bucket in the frequency order, None at the ends
+        self._lower: dict[int, int | None] = {}
+        self._higher: dict[int, int | None] = {}
+        self._min_freq: int | None = None
+
+    def _add(self, key: str, freq: int, lower: int | None) -> None:
+        """Adds the key to the bucket of `freq`, created right above the bucket of `lower` if needed."""
+        bucket = self._buckets.get(freq)
+        if bucket is None:
+            bucket = self._buckets[freq] = OrderedDict()
+            higher = self._min_freq if lower is None else self._higher[lower]
+            self._lower[freq] = lower
+            self._higher[freq] = higher
+            if lower is None:
+                self._min_freq = freq
+            else:
+                self._higher[lower] = freq
+            if higher is not None:
+                self._lower[higher] = freq
+        bucket[key] = None
+        self._freq[key] = freq
+
+    def _unlink(self, key: str, freq: int) -> None:
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if bucket:
+            return
+        del self._buckets[freq]
+        lower = self._lower.pop(freq)
+        higher = self._higher.pop(freq)
+        if lower is None:
+            self._min_freq = higher
+        else:
+            self._higher[lower] = higher
+        if higher is not None:
+            self._lower[higher] = lower
+
+    def record_insert(self, key: str) -> None:
+        if key in self._freq:
+            self.record_access(key)
+            return
+        self._add(key, 1, None)
+
+    def record_access(self, key: str) -> None:
+        freq = self._freq.get(key)
+        if freq is None:
+            return
+        # the next bucket is linked above the current one before the current one may empty
+        self._add(key, freq + 1, freq)
+        self._unlink(key, freq)
+
+    def record_remove(self, key: str) -> None:
+        freq = self._freq.pop(key, None)
+        if freq is not None:
+            self._unlink(key, freq)
+
+    def select_victim(self) -> str | None:
+        if self._min_freq is None:
+            return None
+        freq = self._min_freq
+        key = next(iter(self._buckets[freq]))
+        del self._freq[key]
+        self._unlink(key, freq)
+        return key
+
+    def clear(self) -> None:
+        self._freq.clear()
+        self._buckets.clear()
+        self._lower.clear()
+        self._higher.clear()
+        self._min_freq = None
+
+
+class S3FIFOPolicy(EvictionPolicy):
+    """Scan-resistant S3-FIFO: a small probationary FIFO, a main FIFO and a ghost FIFO of recently evicted keys."""
+
+    name = "s3fifo"
+
+    SMALL_RATIO = 0.1
+    MAX_FREQ = 3
+
+    def __init__(self) -> None:
+        self._small: OrderedDict[str, None] = OrderedDict()
+        self._main: OrderedDict[str, None] = OrderedDict()
+        self._ghost: OrderedDict[str, None] = OrderedDict()
+        self._freq: dict[str, int] = {}
+
+    def record_insert(self, key: str) -> None:
+        if key in self._freq:
+            self.record_access(key)
+            return
+        self._freq[key] = 0
+        if key in self._ghost:
+            del self._ghost[key]
+            self._main[key] = None
+        else:
+            self._small[key] = None
+
+    def record_access(self, key: str) -> None:
+        freq = self._freq.get(key)
+        if freq is not None and freq < self.MAX_FREQ:
+            self._freq[key] = freq + 1
+
+    def record_remove(self, key: str) -> None:
+        if self._freq.pop(key, None) is None:
+            return
+        self._small.pop(key, None)
+        self._main.pop(key, None)
+
+    def select_victim(self) -> str | None:
+        while True:
+            total = len(self._small) + len(self._main)
+            if self._small and (len(self._small) >= total * self.SMALL_RATIO or not self._main):
+                key, _ = self._small.popitem(last=False)
+                if self._freq[key] > 1:
+                    self._freq[key] = 0
+                    self._main[key] = None
+                    continue
+                del self._freq[key]
+                self._remember(key)
+                return key
+
+            if self._main:
+                key, _ = self._main.popitem(last=False)
+                if self._freq[key] > 0:
+                    self._freq[key] -= 1
+                    self._main[key] = None
+                    continue
+                del self._freq[key]
+                return key
+
+            return None
+
+    def _remember(self, key: str) -> None:
+        self._ghost[key] = None
+        while len(self._ghost) > max(len(self._main) + len(self._small), 1):
+            self._ghost.popitem(last=False)
+
+    def clear(self) -> None:
+        self._small.clear()
+        self._main.clear()
+        self._ghost.clear()
+        self._freq.clear()
+
+
+EVICTION_POLICIES: dict[str, type[EvictionPolicy]] = {
+    LRUPolicy.name: LRUPolicy,
+    LFUPolicy.name: LFUPolicy,
+    S3FIFOPolicy.name: S3FIFOPolicy,
+}
+
+
+def make_eviction_policy(name: str) -> EvictionPolicy:
+    try:
+        return EVICTION_POLICIES[name.lower()]()
+    except KeyError:
+        raise ValueError(f"Unknown eviction policy: {name}. Available: {', '.join(EVICTION_POLICIES)}")
@@ -0,0 +1,64 @@
+import asyncio
+import heapq
+import time
+from typing import TYPE_CHECKING, Iterator
+
+from src.caching_proxy.logconfig import get_logger
+
+if TYPE_CHECKING:
+    from src.caching_proxy.cache import Cache
+
+logger = get_logger("cache")
+
+
+class ExpiryQueue:
+    """
+    Min-heap of (deadline, key). Items are never removed in place: a key that is rewritten or deleted
+    leaves its old item behind, and the owner checks the popped deadline against the live entry.
+    """
+
+    def __init__(self) -> None:
+        self._heap: list[tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, key: str, deadline: float | None) -> None:
+        if deadline is not None:
+            heapq.heappush(self._heap, (deadline, key))
+
+    def pop_due(self, now: float) -> Iterator[tuple[float, str]]:
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            yield heapq.heappop(heap)
+
+    @property
+    def next_deadline(self) -> float | None:
+        return self._heap[0][0] if self._heap else None
+
+    def rebuild(self, items: Iterator[tuple[str, float | None]]) -> None:
+        """Drops outdated items, called by the owner when the heap has grown well past the live entries."""
+        self._heap = [(deadline, key) for key, deadline in items if deadline is not None]
+        heapq.heapify(self._heap)
+
+    def clear(self) -> None:
+        self._heap.clear()
+
+
+async def run_active_expiry(cache: "Cache", interval: float, time_budget: float) -> None:
+    """
+    Removes expired entries in slices of at most `time_budget` seconds, so the event loop is never held
+    for long. Sleeps until the next deadline (at most `interval`), or just yields when a slice ran out of time.
+    """
+    while True:
+        try:
+            removed = cache.expire(time_budget)
+        except Exception:
+            logger.exception("Active expiry failed")
+            removed = 0
+        if removed:
+            logger.debug("Expired %s cache entries", removed)
+
+        next_deadline = cache.next_expiration
+        delay = interval if next_deadline is None else min(max(next_deadline - time.time(), 0.0), interval)
+        await asyncio.sleep(delay)
@@ -0,0 +1,178 @@
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+
+from src.caching_proxy.request import RequestComponents
+from src.caching_proxy.schemas import DataToCache
+
+# a vary marker is stored under the plain cache key and names the request headers that select the variant
+VARY_MARKER_STATUS = 0
+VARY_MARKER_HEADER = "x-cache-vary"
+
+
+@dataclass(slots=True)
+class Freshness:
+    ttl: int
+    allow_stale: bool = True
+    vary: tuple[str, ...] = ()
+    # zero freshness: the stored response is revalidated with the origin before every reuse
+    revalidate: bool = False
+
+
+def parse_cache_control(value: str | None) -> dict[str, str | None]:
+    directives: dict[str, str | None] = {}
+    if not value:
+        return directives
+
+    for part in value.split(","):
+        name, sep, argument = part.strip().partition("=")
+        name = name.strip().lower()
+        if name:
+            directives[name] = argument.strip().strip('"') if sep else None
+    return directives
+
+
+def parse_delta_seconds(value: str | None) -> int | None:
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_http_date(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def make_vary_marker(vary: tuple[str, ...]) -> DataToCache:
+    return DataToCache(
+        status_code=VARY_MARKER_STATUS,
+        headers={VARY_MARKER_HEADER: ",".join(vary)},
+        body=b"",
+    )
+
+
+def get_marker_vary(value: DataToCache) -> tuple[str, ...] | None:
+    """Returns the selecting headers if `value` is a vary marker rather than a response."""
+    if value.status_code != VARY_MARKER_STATUS:
+        return None
+    return tuple(name for name in value.headers.get(VARY_MARKER_HEADER, "").split(",") if name)
+
+
+class FreshnessPolicy:
+    """
+    RFC 9111 freshness rules for a shared cache. The lifetime comes from `s-maxage`, `max-age` or `Expires`,
+    minus the `Age` the response already has; responses without explicit freshness get `default_ttl`,
+    and every lifetime is capped by `max_ttl` when it is set. `0` keeps the existing meaning of "no expiration".
+    """
+
+    def __init__(self, default_ttl: int, max_ttl: int = 0, ignored_headers: frozenset[str] = frozenset()):
+        self.default_ttl = max(default_ttl, 0)
+        self.max_ttl = max(max_ttl, 0)
+        # request headers that are never forwarded to the origin, so the response can not vary on them
+        self._ignored_headers = ignored_headers
+
+    def derive(self, default_ttl: int | None = None, max_ttl: int | None = None) -> "FreshnessPolicy":
+        """The same rules with other limits, for a route that overrides some of them."""
+        return FreshnessPolicy(
+            default_ttl=self.default_ttl if default_ttl is None else default_ttl,
+            max_ttl=self.max_ttl if max_ttl is None else max_ttl,
+            ignored_headers=self._ignored_headers,
+        )
+
+    def evaluate(
+        self,
+        request_components: RequestComponents,
+        response_headers: dict[str, str],
+        now: float | None = None,
+    ) -> Freshness | None:
+        """Returns how long the response may be reused, or None if it must not be stored."""
+        response_cc = parse_cache_control(response_headers.get("cache-control"))
+        if "no-store" in response_cc or "private" in response_cc:
+            return None
+
+        request_cc = parse_cache_control(request_components.headers.get("cache-control"))
+        if "no-store" in request_cc:
+            return None
+
+        if "authorization" in request_components.headers and not (
+            "public" in response_cc or "s-maxage" in response_cc or "must-revalidate" in response_cc
+        ):
+            return None
+
+        vary = self.get_vary(response_headers)
+        if vary is None:
+            return None
+
+        if "no-cache" in response_cc:
+            # only worth storing when a conditional request can revalidate it
+            if not self.get_validators(response_headers):
+                return None
+            return Freshness(ttl=0, allow_stale=False, vary=vary, revalidate=True)
+
+        lifetime = self._explicit_lifetime(response_cc, response_headers, time.time() if now is None else now)
+        if lifetime is None:
+            ttl = self.default_ttl
+        else:
+            ttl = lifetime - (parse_delta_seconds(response_headers.get("age")) or 0)
+            if ttl <= 0:
+                return None
+
+        if self.max_ttl:
+            ttl = min(ttl, self.max_ttl) if ttl else self.max_ttl
+
+        return Freshness(ttl=ttl, allow_stale=self.allows_stale(response_headers), vary=vary)
+
+    @staticmethod
+    def allows_stale(response_headers: dict[str, str]) -> bool:
+        response_cc = parse_cache_control(response_headers.get("cache-control"))
+        return not ("must-revalidate" in response_cc or "proxy-revalidate" in response_cc or "no-cache" in response_cc)
+
+    @staticmethod
+    def requires_revalidation(response_headers: dict[str, str]) -> bool:
+        """Whether a stored response has zero freshness and may only be reused after a conditional request."""
+        cache_control = response_headers.get("cache-control")
+        # checked on every hit, most responses are ruled out without parsing
+        return cache_control is not None and "no-cache" in cache_control and "no-cache" in parse_cache_control(cache_control)
+
+    @staticmethod
+    def get_validators(response_headers: dict[str, str]) -> dict[str, str]:
+        """Returns the conditional request headers that revalidate a stored response."""
+        validators = {}
+        if "etag" in response_headers:
+            validators["if-none-match"] = response_headers["etag"]
+        if "last-modified" in response_headers:
+            validators["if-modified-since"] = response_headers["last-modified"]
+        return validators
+
+    def get_vary(self, response_headers: dict[str, str]) -> tuple[str, ...] | None:
+        """Returns the sorted request headers selecting the variant, or None for `Vary: *`."""
+        names = {name.strip().lower() for name in response_headers.get("vary", "").split(",")}
+        names.discard("")
+        if "*" in names:
+            return None
+        return tuple(sorted(names - self._ignored_headers))
+
+    @staticmethod
+    def _explicit_lifetime(
+        response_cc: dict[str, str | None],
+        response_headers: dict[str, str],
+        now: float,
+    ) -> int | None:
+        for directive in ("s-maxage", "max-age"):
+            if directive in response_cc:
+                # an invalid value makes the response stale, RFC 9111 4.2.1
+                return parse_delta_seconds(response_cc[directive]) or 0
+
+        if "expires" not in response_headers:
+            return None
+
+        expires = parse_http_date(response_headers["expires"])
+        if expires is None:
+            return 0
+        date = parse_http_date(response_headers.get("date")) or now
+        return max(int(expires - date), 0)
@@ -0,0 +1,91 @@
+from typing import Iterable
+
+# separates a cache key from the request header values that select one of its variants
+VARIANT_SEPARATOR = "|"
+# characters after which a key prefix is indexed: the method, path segments, the query and the variant part
+PREFIX_BOUNDARIES = frozenset(" /?" + VARIANT_SEPARATOR)
+
+
+def get_surrogate_keys(headers: dict[str, str]) -> frozenset[str]:
+    """
+    Tags the origin attached to a response: `Surrogate-Key` is space separated (Fastly),
+    `Cache-Tag` is comma separated (Cloudflare, Akamai).
+    """
+    tags = headers.get("surrogate-key", "").split()
+    tags.extend(tag.strip() for tag in headers.get("cache-tag", "").split(","))
+    return frozenset(tag for tag in tags if tag)
+
+
+def iter_prefix_boundaries(key: str) -> Iterable[str]:
+    """
+    Prefixes of `key` ending at a boundary: the method, every path segment, the start of the query
+    and the start of the variant part. The query itself is not split, but the variants of a URL
+    with a query are still found under their `key|` prefix.
+    """
+    for i, char in enumerate(key):
+        if char in PREFIX_BOUNDARIES:
+            yield key[: i + 1]
+            if char == VARIANT_SEPARATOR:
+                return
+            if char == "?":
+                variant = key.find(VARIANT_SEPARATOR, i + 1)
+                if variant >= 0:
+                    yield key[: variant + 1]
+                return
+
+
+class PurgeIndex:
+    """
+    Secondary indexes for targeted invalidation: keys by tag and keys by every boundary prefix,
+    so purging a tag or a directory only touches the keys it removes. A prefix that ends mid-segment
+    is served from its longest indexed boundary and filtered; one without any boundary needs a full scan.
+    """
+
+    def __init__(self) -> None:
+        self._tags: dict[str, set[str]] = {}
+        self._key_tags: dict[str, frozenset[str]] = {}
+        self._prefixes: dict[str, set[str]] = {}
+
+    def add(self, key: str, tags: frozenset[str]) -> None:
+        if key in self._key_tags:
+            self.discard(key)
+        self._key_tags[key] = tags
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        for prefix in iter_prefix_boundaries(key):
+            self._prefixes.setdefault(prefix, set()).add(key)
+
+    def discard(self, key: str) -> None:
+        tags = self._key_tags.pop(key, None)
+        if tags is None:
+            return
+        for tag in tags:
+            self._discard_from(self._tags, tag, key)
+        for prefix in iter_prefix_boundaries(key):
+            self._discard_from(self._prefixes, prefix, key)
+
+    def clear(self) -> None:
+        self._tags.clear()
+        self._key_tags.clear()
+        self._prefixes.clear()
+
+    def by_tag(self, tag: str) -> list[str]:
+        return list(self._tags.get(tag, ()))
+
+    def by_prefix(self, prefix: str) -> list[str]:
+        # the boundaries of the prefix are the ones every key starting with it was indexed under
+        boundary = max(iter_prefix_boundaries(prefix), key=len, default=None)
+        if boundary is None:
+            candidates = self._key_tags.keys()
+        else:
+            candidates = self._prefixes.get(boundary, ())
+        return [key for key in candidates if key.startswith(prefix)]
+
+    @staticmethod
+    def _discard_from(index: dict[str, set[str]], name: str, key: str) -> None:
+        keys = index.get(name)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del index[name]
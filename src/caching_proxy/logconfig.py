@@ -1,10 +1,18 @@
+import atexit
 import json
 import logging
 import logging.config
+import logging.handlers
 import os
 
 from src.caching_proxy.config import settings
 
+QUEUE_HANDLER_NAME = "queue"
+
+# the listener started by start_log_listener, dictConfig replaces it when it runs again
+_listener: logging.handlers.QueueListener | None = None
+_atexit_registered = False
+
 
 def get_logging_config() -> dict:
     with open(settings.LOG_CONFIG_FILE, "r") as f:
@@ -16,6 +24,33 @@ def get_logging_config() -> dict:
 def configurate_logging() -> None:
     config = get_logging_config()
     logging.config.dictConfig(config)
+    start_log_listener()
+
+
+def start_log_listener() -> None:
+    """
+    Starts the thread that drains the logging queue into the stdout and file handlers,
+    so the event loop only enqueues records. dictConfig (ours or uvicorn's) creates the
+    listener but does not start it.
+    """
+    global _listener, _atexit_registered
+    handler = logging.getHandlerByName(QUEUE_HANDLER_NAME)
+    listener = getattr(handler, "listener", None)
+    if listener is None or listener is _listener:
+        return
+    stop_log_listener()
+    listener.start()
+    _listener = listener
+    if not _atexit_registered:
+        atexit.register(stop_log_listener)
+        _atexit_registered = True
+
+
+def stop_log_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
 
 def get_logger(root_logger_name: str) -> logging.Logger:
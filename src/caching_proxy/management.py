@@ -1,40 +1,155 @@
 import asyncio
 import os
 import signal
+from typing import Annotated, AsyncIterator, Literal
 
-from fastapi import APIRouter, Request, Response, status
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 
-from src.caching_proxy.cache import cache
+from src.caching_proxy.cache import Cache
 from src.caching_proxy.config import settings
-from src.caching_proxy.schemas import AppStatus
+from src.caching_proxy.metrics import metrics
+from src.caching_proxy.request import RequestComponents
+from src.caching_proxy.routing import get_key_namespace
+from src.caching_proxy.schemas import AppStatus, KeysPage, PurgeResult, RevalidationStats, ServerStats
+from src.caching_proxy.utils import CachingHelper
 
 router = APIRouter(prefix=f"/{settings.API_PREFIX_MANAGEMENT}")
 
 
 @router.post("/__shutdown")
-async def shutdown() -> Response:
+async def shutdown(request: Request) -> Response:
+    # with several workers the uvicorn supervisor is the parent process, stopping it stops every worker
+    pid = os.getppid() if request.app.state.workers > 1 else os.getpid()
+
     async def delayed_shutdown():
         await asyncio.sleep(1.0)
-        os.kill(os.getpid(), signal.SIGTERM)
+        os.kill(pid, signal.SIGTERM)
 
     asyncio.create_task(delayed_shutdown())
 
     return Response(status_code=status.HTTP_202_ACCEPTED)
 
 
-@router.get("/__keys")
-async def keys() -> dict:
-    return {
-        "keys": cache.keys,
-    }
+async def stream_keys(cache: Cache, cursor: str | None, prefix: str, match: str | None) -> AsyncIterator[bytes]:
+    """Scans the whole cache page by page, yielding to the event loop between pages."""
+    while True:
+        page, cursor = await cache.scan(cursor, settings.KEYS_PAGE_SIZE, prefix, match)
+        if page:
+            yield "".join(f"{info.model_dump_json()}\n" for info in page).encode()
+        if cursor is None:
+            return
+        await asyncio.sleep(0)
+
+
+@router.get("/__keys", response_model=None)
+async def keys(
+    request: Request,
+    cursor: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=settings.KEYS_MAX_PAGE_SIZE)] = settings.KEYS_PAGE_SIZE,
+    prefix: str = "",
+    match: str | None = None,
+    format: Literal["json", "ndjson"] = "json",
+) -> KeysPage | StreamingResponse:
+    """
+    One page of keys with a cursor for the next one, or with `format=ndjson`
+    every matching key from `cursor` on as a stream of JSON lines.
+    """
+    if cursor is not None and not cursor.isdigit():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid cursor: {cursor}")
+
+    cache = request.app.state.cache
+    if format == "ndjson":
+        return StreamingResponse(stream_keys(cache, cursor, prefix, match), media_type="application/x-ndjson")
+
+    page, next_cursor = await cache.scan(cursor, limit, prefix, match)
+    return KeysPage(keys=page, cursor=next_cursor)
 
 
 @router.post("/__clear")
-async def clear_cache() -> Response:
-    cache.clear()
+async def clear_cache(request: Request) -> Response:
+    await request.app.state.cache.clear()
+    if request.app.state.negative_cache is not None:
+        await request.app.state.negative_cache.clear()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+# GET and HEAD responses are cached under their own keys, a purge drops both
+PURGED_METHODS = ("GET", "HEAD")
+
+
+def build_purge_key(method: str, url: str, hashed: bool, namespace: str) -> str:
+    path, _, query_string = url.partition("?")
+    request_components = RequestComponents(method=method, path=path.lstrip("/"), query_string=query_string, raw_headers=[])
+    return CachingHelper.make_cache_key(request_components, hashed=hashed, namespace=namespace)
+
+
+@router.post("/__purge")
+async def purge(
+    request: Request,
+    key: str | None = None,
+    prefix: str | None = None,
+    tag: str | None = None,
+    host: str | None = None,
+) -> PurgeResult:
+    """
+    Removes the entries for one URL with its variants (`key=/path?query`), every URL under a path
+    (`prefix=/static/`), or every response tagged by the origin (`tag=...`). Exactly one is expected.
+    URLs served by a host route are purged with that route's `host`.
+    """
+    if sum(value is not None for value in (key, prefix, tag)) != 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected exactly one of: key, prefix, tag")
+    if prefix is not None and request.app.state.hash_keys:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Purging by prefix is not possible when keys are stored as digests (--hash-keys)",
+        )
+
+    # a cached 404 must go too, or a page created at the URL stays hidden until it expires
+    caches = [cache for cache in (request.app.state.cache, request.app.state.negative_cache) if cache is not None]
+    hashed = request.app.state.hash_keys
+    namespace = get_key_namespace(host)
+    removed = 0
+    for cache in caches:
+        if tag is not None:
+            removed += await cache.purge_tag(tag)
+            continue
+        for method in PURGED_METHODS:
+            if key is not None:
+                removed += await cache.purge_key(build_purge_key(method, key, hashed, namespace))
+            else:
+                removed += await cache.purge_prefix(f"{method} {namespace}{prefix.lstrip('/')}")
+    return PurgeResult(removed=removed)
+
+
+async def collect_stats(request: Request) -> ServerStats:
+    negative_cache = request.app.state.negative_cache
+    return ServerStats(
+        cache=await request.app.state.cache.get_stats(),
+        coalescing=request.app.state.single_flight.stats,
+        revalidation=RevalidationStats(
+            not_modified=int(metrics.revalidations.get(("not_modified",))),
+            modified=int(metrics.revalidations.get(("modified",))),
+            bytes_saved=int(metrics.revalidation_bytes_saved.get()),
+        ),
+        upstreams=request.app.state.routes.stats,
+        routes=request.app.state.routes.overload_stats,
+        admission=request.app.state.admission.stats if request.app.state.admission is not None else None,
+        negative=await negative_cache.get_stats() if negative_cache is not None else None,
+    )
+
+
+@router.get("/__stats")
+async def stats(request: Request) -> ServerStats:
+    return await collect_stats(request)
+
+
+@router.get("/__metrics")
+async def prometheus_metrics(request: Request) -> Response:
+    metrics.collect(await collect_stats(request), request.app.state.client)
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @router.get("/__health")
 async def health(request: Request) -> AppStatus:
     app = request.app
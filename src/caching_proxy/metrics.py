@@ -0,0 +1,241 @@
+from bisect import bisect_left
+from typing import Iterator
+
+import httpx
+
+from src.caching_proxy.schemas import ServerStats
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape_label_value(value: str) -> str:
+    """Escapes a label value as the Prometheus text format requires: backslash, double quote and line feed."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    """Renders a sample exactly: `:g` kept six significant digits, so a counter past a million lost its last digits."""
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def _format_labels(labelnames: tuple[str, ...], labelvalues: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """
+    A counter or gauge. Updates are plain dict operations on the event loop thread,
+    so no locks are taken on the request path; each worker process exposes its own values.
+    """
+
+    def __init__(self, name: str, documentation: str, kind: str = "counter", labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+
+    # counts stay ints until a float amount is added, so they render without a fraction
+    def inc(self, labelvalues: tuple[str, ...] = (), amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, labelvalues: tuple[str, ...] = (), amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) - amount
+
+    def set(self, value: float, labelvalues: tuple[str, ...] = ()) -> None:
+        self._values[labelvalues] = value
+
+    def get(self, labelvalues: tuple[str, ...] = ()) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def items(self) -> list[tuple[tuple[str, ...], float]]:
+        return list(self._values.items())
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for labelvalues, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._buckets = buckets
+        # per label set: [count per bucket..., count in +Inf], sum
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, labelvalues: tuple[str, ...] = ()) -> None:
+        counts = self._counts.get(labelvalues)
+        if counts is None:
+            counts = self._counts[labelvalues] = [0] * (len(self._buckets) + 1)
+            self._sums[labelvalues] = 0.0
+        counts[bisect_left(self._buckets, value)] += 1
+        self._sums[labelvalues] += value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labelvalues, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self._buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            cumulative += counts[-1]
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, 'le="+Inf"')} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labelvalues)} {_format_value(self._sums[labelvalues])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labelvalues)} {cumulative}"
+
+
+class ProxyMetrics:
+    def __init__(self) -> None:
+        self.requests = Metric("proxy_requests_total", "Requests served, by cache status", labelnames=("cache",))
+        self.request_duration = Histogram(
+            "proxy_request_duration_seconds",
+            "Time to serve a request, by cache status",
+            labelnames=("cache",),
+        )
+        self.cache_ratio = Metric("proxy_cache_ratio", "Share of requests per cache status", "gauge", ("cache",))
+
+        self.origin_requests = Metric(
+            "proxy_origin_requests_total", "Requests sent to the origin, by outcome", labelnames=("outcome",)
+        )
+        self.origin_duration = Histogram("proxy_origin_request_duration_seconds", "Time until the origin response headers arrive")
+        self.origin_in_flight = Metric("proxy_origin_requests_in_flight", "Origin requests currently in flight", "gauge")
+        self.revalidations = Metric(
+            "proxy_revalidations_total",
+            "Conditional requests sent to the origin for expired entries, by result",
+            labelnames=("result",),
+        )
+        self.origin_limit = Metric(
+            "proxy_origin_concurrency_limit",
+            "Adaptive limit on origin requests awaiting response headers, by route",
+            "gauge",
+            ("route",),
+        )
+        self.origin_queue_depth = Metric(
+            "proxy_origin_queue_depth",
+            "Requests queued for an origin request slot, by route",
+            "gauge",
+            ("route",),
+        )
+        self.origin_shed = Metric(
+            "proxy_origin_shed_total",
+            "Requests refused without contacting the origin, by route and reason",
+            labelnames=("route", "reason"),
+        )
+        self.circuit_state = Metric(
+            "proxy_circuit_state",
+            "Circuit breaker state by route, 1 for the current state",
+            "gauge",
+            ("route", "state"),
+        )
+        self.range_requests = Metric(
+            "proxy_range_requests_total",
+            "GET requests with a Range header, by how they were answered",
+            labelnames=("result",),
+        )
+        self.revalidation_bytes_saved = Metric(
+            "proxy_revalidation_bytes_saved_total",
+            "Body bytes not transferred from the origin thanks to 304 Not Modified",
+        )
+
+        self.cache_entries = Metric("proxy_cache_entries", "Entries stored in the cache", "gauge")
+        self.cache_bytes = Metric("proxy_cache_bytes", "Bytes stored in the cache", "gauge")
+        self.cache_max_bytes = Metric("proxy_cache_max_bytes", "Cache size budget in bytes, 0 = unlimited", "gauge")
+        self.cache_lookups = Metric("proxy_cache_lookups_total", "Cache lookups, by result", labelnames=("result",))
+        self.cache_evictions = Metric("proxy_cache_evictions_total", "Entries evicted to stay within the size budget")
+        self.cache_expirations = Metric("proxy_cache_expirations_total", "Entries removed after their TTL")
+        self.admission = Metric(
+            "proxy_cache_admission_total",
+            "Cacheable responses by admission result: admitted, or rejected for size, frequency or cost",
+            labelnames=("result",),
+        )
+        self.coalesced = Metric("proxy_coalesced_requests_total", "Cache misses that waited for an in-flight origin fetch")
+
+        self.pool_connections = Metric("proxy_upstream_connections", "Upstream connections, by state", "gauge", ("state",))
+        self.pool_max_connections = Metric("proxy_upstream_connections_max", "Upstream connection pool size", "gauge")
+        self.pool_utilization = Metric("proxy_upstream_pool_utilization", "Share of the pool with a request in flight", "gauge")
+        self.pool_wait = Histogram(
+            "proxy_upstream_pool_wait_seconds",
+            "Time an origin request waited for a free connection slot, by origin",
+            labelnames=("origin",),
+        )
+        self.upstream_connect_duration = Histogram(
+            "proxy_upstream_connect_seconds",
+            "Time to open a new origin connection, TCP and TLS, by origin",
+            labelnames=("origin",),
+        )
+        self.upstream_connection_use = Metric(
+            "proxy_upstream_connection_use_total",
+            "Origin requests by origin and whether they opened a connection or reused a kept-alive one",
+            labelnames=("origin", "connection"),
+        )
+
+    def observe_request(self, cache_status: str, seconds: float) -> None:
+        labels = (cache_status,)
+        self.requests.inc(labels)
+        self.request_duration.observe(seconds, labels)
+
+    def collect(self, stats: ServerStats, client: httpx.AsyncClient | None) -> None:
+        """Refreshes the gauges that mirror state owned by other components, called on every scrape."""
+        total = sum(value for labels, value in self.requests.items() if labels[0] != "N/A")
+        for labels, value in self.requests.items():
+            if labels[0] != "N/A":
+                self.cache_ratio.set(value / total if total else 0.0, labels)
+
+        cache_stats = stats.cache
+        self.cache_entries.set(cache_stats.entries)
+        self.cache_bytes.set(cache_stats.bytes)
+        self.cache_max_bytes.set(cache_stats.max_bytes)
+        self.cache_lookups.set(cache_stats.hits, ("hit",))
+        self.cache_lookups.set(cache_stats.stale_hits, ("stale",))
+        self.cache_lookups.set(cache_stats.misses, ("miss",))
+        self.cache_evictions.set(cache_stats.evictions)
+        self.cache_expirations.set(cache_stats.expirations)
+        self.coalesced.set(stats.coalescing.coalesced)
+        if stats.admission is not None:
+            self.admission.set(stats.admission.admitted, ("admitted",))
+            for reason, count in stats.admission.rejected.items():
+                self.admission.set(count, (reason,))
+
+        for route in stats.routes:
+            self.origin_limit.set(route.limit, (route.route,))
+            self.origin_queue_depth.set(route.queued, (route.route,))
+            for reason, count in route.shed.items():
+                self.origin_shed.set(count, (route.route, reason))
+            for state in ("closed", "open", "half-open"):
+                self.circuit_state.set(1.0 if route.circuit == state else 0.0, (route.route, state))
+
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        if pool is None:
+            return
+        connections = list(pool.connections)
+        idle = sum(1 for connection in connections if connection.is_idle())
+        max_connections = pool._max_connections or 0
+        self.pool_connections.set(len(connections) - idle, ("active",))
+        self.pool_connections.set(idle, ("idle",))
+        self.pool_max_connections.set(max_connections)
+        self.pool_utilization.set((len(connections) - idle) / max_connections if max_connections else 0.0)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in vars(self).values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = ProxyMetrics()
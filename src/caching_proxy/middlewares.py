@@ -1,30 +1,87 @@
 from time import perf_counter
-from typing import Awaitable, Callable
 
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from src.caching_proxy.config import settings
 from src.caching_proxy.logconfig import get_logger
+from src.caching_proxy.metrics import metrics
 
 logger = get_logger("middleware")
 
 
-class CacheLoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(
-        self,
-        request: Request,
-        call_next: Callable[[Request], Awaitable[Response]],
-    ) -> Response:
+class CacheLoggingMiddleware:
+    """Pure ASGI middleware: reads status and X-Cache from the response start message without wrapping the body."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         start_time = perf_counter()
-        response = await call_next(request)
-        process_time = (perf_counter() - start_time) * 1000
-        cache_status = response.headers.get("X-Cache", "N/A")
-        logger.info(
-            "%-8s %-50s STATUS=%s CACHE=%-4s TIME=%.2fms",
-            request.method,
-            request.url.path,
-            response.status_code,
-            cache_status,
-            process_time,
-        )
-        return response
+        status_code = 500
+        cache_status = "N/A"
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, cache_status
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name.lower() == b"x-cache":
+                        cache_status = value.decode("latin-1")
+                        break
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = perf_counter() - start_time
+            process_time = elapsed * 1000
+            metrics.observe_request(cache_status, elapsed)
+            logger.info(
+                "%-8s %-50s STATUS=%s CACHE=%-4s TIME=%.2fms",
+                scope["method"],
+                scope["path"],
+                status_code,
+                cache_status,
+                process_time,
+            )
+
+
+class CacheHitMiddleware:
+    """
+    Serves fresh cache hits straight from the ASGI scope, skipping routing and dependency injection.
+    The common hit is two send() calls with the entry's precomputed header block and stored body.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._management_prefix = f"/{settings.API_PREFIX_MANAGEMENT}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD") or scope["path"].startswith(self._management_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        proxy_service = scope["app"].state.proxy_service
+        resolved = proxy_service.resolve(scope)
+        if resolved is None:
+            await self.app(scope, receive, send)
+            return
+
+        request_components, _, cache_key = resolved
+
+        cached = await proxy_service.get_cached_entry(request_components, cache_key)
+        if cached is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not proxy_service.can_send_as_is(request_components, cached):
+            response = proxy_service.respond_from_cache(request_components, cached, "HIT")
+            await response(scope, receive, send)
+            return
+
+        await send({"type": "http.response.start", "status": cached.status_code, "headers": cached.header_block})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else cached.body})
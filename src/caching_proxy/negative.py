@@ -0,0 +1,51 @@
+from src.caching_proxy.freshness import parse_cache_control, parse_delta_seconds
+
+NEGATIVE_HIT = "NEG-HIT"
+
+
+class NegativeCachePolicy:
+    """
+    TTLs for error responses by status: an exact code like `404` or a class like `5xx`,
+    the exact code wins. An origin that marks the error `no-store` or `private` is never cached,
+    and a shorter `s-maxage` or `max-age` it sends lowers the TTL.
+    """
+
+    def __init__(self, ttls: dict[str, int]):
+        self.ttls = ttls
+
+    @classmethod
+    def parse(cls, value: str) -> "NegativeCachePolicy":
+        """Reads a table like `404=30,410=300,5xx=2`."""
+        ttls: dict[str, int] = {}
+        for item in value.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            status, sep, ttl = item.partition("=")
+            status = status.strip().lower()
+            if not sep or not (len(status) == 3 and status[0] in "345" and (status[1:].isdigit() or status[1:] == "xx")):
+                raise ValueError(f"Invalid negative TTL {item!r}, expected STATUS=SECONDS with STATUS like 404 or 5xx")
+            if status in ("304", "3xx"):
+                raise ValueError("304 Not Modified is a revalidation result, it can not be cached negatively")
+            try:
+                ttls[status] = max(int(ttl), 0)
+            except ValueError:
+                raise ValueError(f"Invalid negative TTL {item!r}, seconds must be an integer")
+        return cls(ttls)
+
+    def __bool__(self) -> bool:
+        return any(self.ttls.values())
+
+    def get_ttl(self, status_code: int, headers: dict[str, str]) -> int:
+        """Seconds to keep the error response, 0 when it is not cached."""
+        ttl = self.ttls.get(str(status_code))
+        if ttl is None:
+            ttl = self.ttls.get(f"{status_code // 100}xx", 0)
+        if not ttl:
+            return 0
+
+        directives = parse_cache_control(headers.get("cache-control"))
+        if "no-store" in directives or "private" in directives:
+            return 0
+        max_age = parse_delta_seconds(directives.get("s-maxage") or directives.get("max-age"))
+        return ttl if max_age is None else min(ttl, max_age)
@@ -0,0 +1,285 @@
+import asyncio
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+
+from fastapi import HTTPException, status
+
+from src.caching_proxy.config import settings
+
+
+class OriginShed(HTTPException):
+    """A request refused before it reached the origin, by an open circuit or a full or slow queue."""
+
+    def __init__(self, reason: str, route: str, retry_after: float) -> None:
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Origin overloaded ({reason}): {route}",
+            headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+        )
+        self.reason = reason
+
+
+class ConcurrencyLimiter(ABC):
+    """
+    Caps the requests waiting for origin response headers at an adaptive limit. Requests over the limit
+    wait in a FIFO queue of at most `max_queue` for up to `queue_timeout` seconds, and are shed after that.
+    Subclasses move the limit from the latency of each response relative to the lowest latency seen
+    in the last one or two windows, which stands for the origin's latency without load.
+    """
+
+    name: str
+
+    def __init__(
+        self,
+        route: str,
+        max_limit: int = settings.ORIGIN_LIMIT_MAX,
+        max_queue: int = settings.ORIGIN_QUEUE_SIZE,
+        queue_timeout: float = settings.ORIGIN_QUEUE_TIMEOUT,
+    ) -> None:
+        self.route = route
+        self.max_limit = max(max_limit, settings.ORIGIN_LIMIT_MIN)
+        self.limit = float(min(settings.ORIGIN_LIMIT_INITIAL, self.max_limit))
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.shed: dict[str, int] = {}
+        self._waiters: deque[asyncio.Future] = deque()
+        self._window_end = 0.0
+        self._window_min = math.inf
+        self._previous_min = math.inf
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def baseline(self) -> float:
+        return min(self._window_min, self._previous_min)
+
+    async def acquire(self) -> None:
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._shed("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except TimeoutError:
+            raise self._shed("queue_timeout")
+        except asyncio.CancelledError:
+            # the client went away while queued; a slot granted at the same moment is handed on
+            if waiter.done() and not waiter.cancelled():
+                self.in_flight -= 1
+                self._wake()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self, latency: float | None = None, ok: bool = True) -> None:
+        """Frees the slot; `latency` is None for a request that never reached the origin."""
+        utilized = self.in_flight >= self.limit / 2
+        self.in_flight -= 1
+        if latency is not None:
+            now = time.monotonic()
+            if now >= self._window_end:
+                self._previous_min = self._window_min
+                self._window_min = math.inf
+                self._window_end = now + settings.ORIGIN_LIMIT_WINDOW
+            if ok:
+                self._window_min = min(self._window_min, latency)
+            limit = self.adjust(latency, ok, utilized, now)
+            self.limit = min(max(limit, settings.ORIGIN_LIMIT_MIN), self.max_limit)
+        self._wake()
+
+    @abstractmethod
+    def adjust(self, latency: float, ok: bool, utilized: bool, now: float) -> float:
+        """Returns the new limit; `utilized` tells whether the limit was being used, growth is pointless otherwise."""
+        raise NotImplementedError
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _shed(self, reason: str) -> OriginShed:
+        self.shed[reason] = self.shed.get(reason, 0) + 1
+        return OriginShed(reason, self.route, self.queue_timeout)
+
+
+class AimdLimiter(ConcurrencyLimiter):
+    """
+    Additive increase, multiplicative decrease: +1 per `limit` responses within the latency tolerance,
+    times ORIGIN_LIMIT_BACKOFF on a slow or failed one, at most once per round trip.
+    """
+
+    name = "aimd"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._next_decrease = 0.0
+
+    def adjust(self, latency: float, ok: bool, utilized: bool, now: float) -> float:
+        if not ok or latency > self.baseline * settings.ORIGIN_LIMIT_TOLERANCE:
+            if now < self._next_decrease:
+                return self.limit
+            self._next_decrease = now + latency
+            return self.limit * settings.ORIGIN_LIMIT_BACKOFF
+        if utilized:
+            return self.limit + 1 / self.limit
+        return self.limit
+
+
+class GradientLimiter(ConcurrencyLimiter):
+    """
+    Scales the limit by the ratio of the no-load latency (with tolerance) to the smoothed current latency,
+    plus a square-root allowance for queueing, and moves a fifth of the way there on each response.
+    """
+
+    name = "gradient"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._latency = 0.0
+
+    def adjust(self, latency: float, ok: bool, utilized: bool, now: float) -> float:
+        self._latency = latency if not self._latency else self._latency + 0.2 * (latency - self._latency)
+        gradient = 0.5 if not ok else min(max(settings.ORIGIN_LIMIT_TOLERANCE * self.baseline / self._latency, 0.5), 1.0)
+        target = self.limit * gradient + math.sqrt(self.limit)
+        if not utilized:
+            target = min(target, self.limit)
+        return 0.8 * self.limit + 0.2 * target
+
+
+LIMITERS: dict[str, type[ConcurrencyLimiter]] = {
+    AimdLimiter.name: AimdLimiter,
+    GradientLimiter.name: GradientLimiter,
+}
+
+
+def make_limiter(name: str, route: str, **kwargs) -> ConcurrencyLimiter | None:
+    if name.lower() == "none":
+        return None
+    try:
+        return LIMITERS[name.lower()](route, **kwargs)
+    except KeyError:
+        raise ValueError(f"Unknown concurrency limiter: {name}. Available: none, {', '.join(LIMITERS)}")
+
+
+class CircuitBreaker:
+    """
+    Opens when at least `failure_ratio` of the origin requests in a window of CIRCUIT_WINDOW seconds failed
+    (5xx, timeouts, connection errors), with at least CIRCUIT_MIN_REQUESTS of them. While open, requests
+    are refused without contacting the origin. After `open_time` it lets CIRCUIT_HALF_OPEN_PROBES requests
+    through: all of them succeeding closes it, any failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        route: str,
+        failure_ratio: float = settings.CIRCUIT_FAILURE_RATIO,
+        open_time: float = settings.CIRCUIT_OPEN_TIME,
+    ) -> None:
+        self.route = route
+        self.failure_ratio = failure_ratio
+        self.open_time = open_time
+        self.state = self.CLOSED
+        self.opened = 0
+        self.shed = 0
+        self._open_until = 0.0
+        self._window_end = 0.0
+        self._requests = 0
+        self._failures = 0
+        self._probes = 0
+        self._probe_successes = 0
+
+    def admit(self) -> None:
+        """Raises OriginShed while the circuit is open or its probes are taken."""
+        if self.state == self.OPEN:
+            now = time.monotonic()
+            if now < self._open_until:
+                self.shed += 1
+                raise OriginShed("circuit_open", self.route, self._open_until - now)
+            self.state = self.HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+
+        if self.state == self.HALF_OPEN:
+            if self._probes >= settings.CIRCUIT_HALF_OPEN_PROBES:
+                self.shed += 1
+                raise OriginShed("circuit_open", self.route, self.open_time)
+            self._probes += 1
+
+    def forget(self) -> None:
+        """Returns the probe of a request that never reached the origin."""
+        if self.state == self.HALF_OPEN:
+            self._probes = max(self._probes - 1, 0)
+
+    def record(self, ok: bool) -> None:
+        if self.state == self.HALF_OPEN:
+            if not ok:
+                self._open()
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= settings.CIRCUIT_HALF_OPEN_PROBES:
+                self.state = self.CLOSED
+                self._window_end = 0.0
+            return
+        if self.state == self.OPEN:
+            # a request admitted before the circuit opened
+            return
+
+        now = time.monotonic()
+        if now >= self._window_end:
+            self._window_end = now + settings.CIRCUIT_WINDOW
+            self._requests = 0
+            self._failures = 0
+        self._requests += 1
+        if not ok:
+            self._failures += 1
+            if self._requests >= settings.CIRCUIT_MIN_REQUESTS and self._failures >= self._requests * self.failure_ratio:
+                self._open()
+
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self.opened += 1
+        self._open_until = time.monotonic() + self.open_time
+
+
+@dataclass(slots=True)
+class OverloadPolicy:
+    """Limiter and circuit breaker settings, each route gets its own instances."""
+
+    limiter: str = "none"
+    max_limit: int = settings.ORIGIN_LIMIT_MAX
+    max_queue: int = settings.ORIGIN_QUEUE_SIZE
+    queue_timeout: float = settings.ORIGIN_QUEUE_TIMEOUT
+    circuit_breaker: bool = False
+    failure_ratio: float = settings.CIRCUIT_FAILURE_RATIO
+    open_time: float = settings.CIRCUIT_OPEN_TIME
+
+    def make_limiter(self, route: str) -> ConcurrencyLimiter | None:
+        return make_limiter(
+            self.limiter,
+            route,
+            max_limit=self.max_limit,
+            max_queue=self.max_queue,
+            queue_timeout=self.queue_timeout,
+        )
+
+    def make_breaker(self, route: str) -> CircuitBreaker | None:
+        if not self.circuit_breaker:
+            return None
+        return CircuitBreaker(route, failure_ratio=self.failure_ratio, open_time=self.open_time)
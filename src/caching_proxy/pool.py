@@ -0,0 +1,79 @@
+import importlib.util
+from time import perf_counter
+from typing import Any
+
+import httpx
+from starlette.datastructures import State
+
+from src.caching_proxy.config import settings
+from src.caching_proxy.metrics import metrics
+from src.caching_proxy.routing import Upstream
+
+
+def create_origin_client(state: State) -> httpx.AsyncClient:
+    """The HTTP client shared by every route, sized and tuned from the CLI options stored on the app state."""
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(
+            connect=settings.HTTPX_CONNECT_TIMEOUT,
+            read=settings.HTTPX_READ_TIMEOUT,
+            write=settings.HTTPX_WRITE_TIMEOUT,
+            pool=state.pool_timeout,
+        ),
+        follow_redirects=settings.HTTPX_FOLLOW_REDIRECTS,
+        limits=httpx.Limits(
+            max_connections=state.max_connections or None,
+            max_keepalive_connections=state.max_keepalive_connections,
+            keepalive_expiry=state.keepalive_expiry,
+        ),
+        http2=state.http2,
+    )
+
+
+def check_http2_available() -> None:
+    if importlib.util.find_spec("h2") is None:
+        raise ValueError("HTTP/2 to the origin needs the h2 package, install it with the `http2` extra")
+
+
+class ConnectionTrace:
+    """
+    Receives httpcore's trace events for one origin request and splits the time before the request
+    headers are written into waiting for a pool slot and opening a connection (TCP and TLS).
+    A request that never opened a connection was sent over a kept-alive one.
+    """
+
+    __slots__ = ("started", "connect_time", "new_connection", "headers_sent", "_connect_started")
+
+    def __init__(self) -> None:
+        self.started = perf_counter()
+        self.connect_time = 0.0
+        self.new_connection = False
+        self.headers_sent: float | None = None
+        self._connect_started = 0.0
+
+    async def __call__(self, event_name: str, info: dict[str, Any]) -> None:
+        if event_name in ("connection.connect_tcp.started", "connection.start_tls.started"):
+            self.new_connection = True
+            self._connect_started = perf_counter()
+        elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            self.connect_time += perf_counter() - self._connect_started
+        elif event_name.endswith(".send_request_headers.started") and self.headers_sent is None:
+            self.headers_sent = perf_counter()
+
+    @property
+    def pool_wait(self) -> float:
+        end = self.headers_sent if self.headers_sent is not None else perf_counter()
+        return max(end - self.started - self.connect_time, 0.0)
+
+    def record(self, upstream: Upstream) -> None:
+        labels = (upstream.url,)
+        upstream.pool_wait += self.pool_wait
+        metrics.pool_wait.observe(self.pool_wait, labels)
+        if self.headers_sent is None:
+            return
+
+        if self.new_connection:
+            upstream.connections_opened += 1
+            metrics.upstream_connect_duration.observe(self.connect_time, labels)
+        else:
+            upstream.connections_reused += 1
+        metrics.upstream_connection_use.inc((upstream.url, "new" if self.new_connection else "reused"))
@@ -0,0 +1,148 @@
+import secrets
+
+from fastapi import Response, status
+
+from src.caching_proxy.config import settings
+from src.caching_proxy.freshness import parse_http_date
+
+MULTIPART_CONTENT_TYPE = "multipart/byteranges"
+
+
+class RangeNotSatisfiable(Exception):
+    """None of the requested ranges overlaps the body."""
+
+
+def parse_range(value: str, size: int) -> list[tuple[int, int]] | None:
+    """
+    Parses a `bytes=` Range header into sorted, merged (start, end) pairs with an inclusive end.
+    Returns None when the header must be ignored and the full body sent: another unit, a syntax error
+    or more than RANGE_MAX_PARTS ranges. Raises RangeNotSatisfiable when every range starts past the end.
+    """
+    unit, sep, specs = value.partition("=")
+    if not sep or unit.strip().lower() != "bytes":
+        return None
+
+    ranges: list[tuple[int, int]] = []
+    parts = [part.strip() for part in specs.split(",") if part.strip()]
+    if not parts or len(parts) > settings.RANGE_MAX_PARTS:
+        return None
+
+    for part in parts:
+        first, dash, last = part.partition("-")
+        if not dash:
+            return None
+        try:
+            if not first:
+                # suffix range: the last N bytes
+                suffix = int(last)
+                if suffix < 0:
+                    return None
+                # an empty body has no last bytes to send
+                if suffix and size:
+                    ranges.append((max(size - suffix, 0), size - 1))
+                continue
+
+            start = int(first)
+            end = int(last) if last else None
+        except ValueError:
+            return None
+        if start < 0 or (end is not None and end < start):
+            return None
+        if end is None:
+            end = size - 1
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def get_complete_length(content_range: str) -> int | None:
+    """The full size from a `bytes first-last/size` Content-Range, None when the origin did not know it."""
+    _, sep, size = content_range.rpartition("/")
+    try:
+        return int(size) if sep else None
+    except ValueError:
+        return None
+
+
+def if_range_matches(if_range: str, headers: dict[str, str]) -> bool:
+    """
+    If-Range holds either an entity tag, which must match the stored one strongly,
+    or a date, which must equal the stored Last-Modified.
+    """
+    if_range = if_range.strip()
+    if if_range.startswith(('"', "W/")):
+        etag = headers.get("etag", "")
+        return not if_range.startswith("W/") and not etag.startswith("W/") and if_range == etag
+
+    last_modified = parse_http_date(headers.get("last-modified"))
+    return last_modified is not None and last_modified == parse_http_date(if_range)
+
+
+def build_range_response(
+    body: bytes | memoryview,
+    ranges: list[tuple[int, int]],
+    headers: dict[str, str],
+    cache_status: str,
+) -> Response:
+    """A 206 with the slices of `body`, as multipart/byteranges when there are several."""
+    size = len(body)
+    view = memoryview(body)
+    content_type = None
+    response_headers = {}
+    for name, value in headers.items():
+        if name.lower() == "content-type":
+            content_type = value
+        elif name.lower() != "content-range":
+            response_headers[name] = value
+    headers = response_headers
+    headers["Accept-Ranges"] = "bytes"
+    headers["X-Cache"] = cache_status
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return Response(
+            content=view[start : end + 1],
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            headers=headers,
+            media_type=content_type,
+        )
+
+    boundary = secrets.token_hex(16)
+    parts = []
+    for start, end in ranges:
+        part_headers = f"--{boundary}\r\n"
+        if content_type:
+            part_headers += f"Content-Type: {content_type}\r\n"
+        part_headers += f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        parts.append(part_headers.encode("latin-1"))
+        parts.append(view[start : end + 1])
+        parts.append(b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode("latin-1"))
+
+    return Response(
+        content=b"".join(parts),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        headers=headers,
+        media_type=f"{MULTIPART_CONTENT_TYPE}; boundary={boundary}",
+    )
+
+
+def build_not_satisfiable_response(size: int, cache_status: str) -> Response:
+    return Response(
+        content=b"",
+        status_code=status.HTTP_416_RANGE_NOT_SATISFIABLE,
+        headers={"Content-Range": f"bytes */{size}", "X-Cache": cache_status},
+    )
@@ -0,0 +1,37 @@
+from dataclasses import dataclass
+from urllib.parse import parse_qsl
+
+
+@dataclass(slots=True)
+class RequestComponents:
+    """Raw parts of an incoming request; headers and params are only decoded when the origin is contacted."""
+
+    method: str
+    path: str
+    query_string: str
+    raw_headers: list[tuple[bytes, bytes]]
+    excluded_headers: frozenset[bytes] = frozenset()
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in self.raw_headers
+            if name not in self.excluded_headers
+        }
+
+    @property
+    def accept_encoding(self) -> str:
+        """Accept-Encoding is never forwarded to the origin, so it is read from the raw headers."""
+        return self.get_header(b"accept-encoding")
+
+    def get_header(self, name: bytes) -> str:
+        """Reads a single header without decoding the rest, `name` must be lowercase."""
+        for header_name, value in self.raw_headers:
+            if header_name == name:
+                return value.decode("latin-1")
+        return ""
+
+    @property
+    def params(self) -> dict[str, str]:
+        return dict(parse_qsl(self.query_string, keep_blank_values=True))
@@ -0,0 +1,310 @@
+import itertools
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+
+from src.caching_proxy.config import settings
+from src.caching_proxy.freshness import FreshnessPolicy
+from src.caching_proxy.overload import CircuitBreaker, ConcurrencyLimiter, OverloadPolicy
+from src.caching_proxy.request import RequestComponents
+from src.caching_proxy.schemas import RoutesConfig, RouteStats, UpstreamStats
+
+
+class Upstream:
+    """One origin instance, with the load and passive health state the balancers read."""
+
+    __slots__ = (
+        "url",
+        "outstanding",
+        "ewma",
+        "requests",
+        "failures",
+        "ejections",
+        "ejected_until",
+        "connections_opened",
+        "connections_reused",
+        "pool_wait",
+    )
+
+    def __init__(self, url: str) -> None:
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        # smoothed time to response headers in seconds, 0 until the first response
+        self.ewma = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.connections_opened = 0
+        self.connections_reused = 0
+        # total seconds requests to this instance waited for a pool slot
+        self.pool_wait = 0.0
+
+    def is_available(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+    def begin(self) -> None:
+        self.outstanding += 1
+        self.requests += 1
+
+    def release(self) -> None:
+        """Ends a request that never reached the instance, without counting it towards its health."""
+        self.outstanding -= 1
+
+    def finish(self, latency: float, ok: bool) -> None:
+        """
+        Records a response, or a 5xx, timeout or connection error when `ok` is False. After
+        UPSTREAM_EJECT_FAILURES consecutive failures the instance is ejected for UPSTREAM_EJECT_TIME;
+        the counter is only reset by a success, so one more failure after the ejection ejects it again.
+        """
+        self.outstanding -= 1
+        if not ok:
+            # a refused connection fails fast, it must not look like the quickest instance
+            latency = max(latency, settings.UPSTREAM_FAILURE_PENALTY)
+        self.ewma = latency if not self.ewma else self.ewma + settings.UPSTREAM_EWMA_ALPHA * (latency - self.ewma)
+        if ok:
+            self.failures = 0
+            return
+
+        self.failures += 1
+        if self.failures >= settings.UPSTREAM_EJECT_FAILURES:
+            if self.is_available(time.monotonic()):
+                self.ejections += 1
+            self.ejected_until = time.monotonic() + settings.UPSTREAM_EJECT_TIME
+
+
+class Balancer(ABC):
+    name: str
+
+    @abstractmethod
+    def choose(self, upstreams: list[Upstream]) -> Upstream:
+        raise NotImplementedError
+
+
+class RoundRobinBalancer(Balancer):
+    name = "round-robin"
+
+    def __init__(self) -> None:
+        self._counter = itertools.count()
+
+    def choose(self, upstreams: list[Upstream]) -> Upstream:
+        return upstreams[next(self._counter) % len(upstreams)]
+
+
+class LeastOutstandingBalancer(Balancer):
+    """Fewest requests in flight; the scan starts at a rotating offset so ties are spread evenly."""
+
+    name = "least-outstanding"
+
+    def __init__(self) -> None:
+        self._counter = itertools.count()
+
+    def choose(self, upstreams: list[Upstream]) -> Upstream:
+        offset = next(self._counter) % len(upstreams)
+        return min(upstreams[offset:] + upstreams[:offset], key=lambda upstream: upstream.outstanding)
+
+
+class EwmaBalancer(Balancer):
+    """
+    Lowest expected wait: latency EWMA times the requests already queued on the instance.
+    Instances that have not answered yet cost nothing, so each one is tried early.
+    """
+
+    name = "ewma"
+
+    def __init__(self) -> None:
+        self._counter = itertools.count()
+
+    def choose(self, upstreams: list[Upstream]) -> Upstream:
+        offset = next(self._counter) % len(upstreams)
+        return min(upstreams[offset:] + upstreams[:offset], key=lambda upstream: upstream.ewma * (upstream.outstanding + 1))
+
+
+BALANCERS: dict[str, type[Balancer]] = {
+    RoundRobinBalancer.name: RoundRobinBalancer,
+    LeastOutstandingBalancer.name: LeastOutstandingBalancer,
+    EwmaBalancer.name: EwmaBalancer,
+}
+
+
+def make_balancer(name: str) -> Balancer:
+    try:
+        return BALANCERS[name.lower()]()
+    except KeyError:
+        raise ValueError(f"Unknown balancer: {name}. Available: {', '.join(BALANCERS)}")
+
+
+def get_key_namespace(host: str | None) -> str:
+    """Entries of host routes are kept apart from other hosts serving the same paths."""
+    return f"//{host.lower()}/" if host else ""
+
+
+@dataclass(slots=True)
+class Route:
+    prefix: str
+    host: str | None
+    upstreams: list[Upstream]
+    balancer: Balancer
+    # None when responses on this route are never stored
+    freshness: FreshnessPolicy | None
+    limiter: ConcurrencyLimiter | None = None
+    breaker: CircuitBreaker | None = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.host or ''}{self.prefix}"
+
+    @property
+    def key_namespace(self) -> str:
+        return get_key_namespace(self.host)
+
+    def matches(self, host: str, path: str) -> bool:
+        # on a segment boundary, so /api serves /api and /api/users but not /apiary
+        if self.host is not None and self.host != host:
+            return False
+        return path == self.prefix or path.startswith(self.prefix.rstrip("/") + "/")
+
+    def pick_upstream(self) -> Upstream:
+        if len(self.upstreams) == 1:
+            return self.upstreams[0]
+        now = time.monotonic()
+        # with every instance ejected the load is spread over all of them rather than refused
+        available = [upstream for upstream in self.upstreams if upstream.is_available(now)] or self.upstreams
+        return self.balancer.choose(available)
+
+    async def admit(self) -> None:
+        """Waits for an origin request slot, raises OriginShed when the request is refused instead."""
+        if self.breaker is not None:
+            self.breaker.admit()
+        if self.limiter is None:
+            return
+        try:
+            await self.limiter.acquire()
+        except BaseException:
+            if self.breaker is not None:
+                self.breaker.forget()
+            raise
+
+    def complete(self, latency: float, ok: bool, reached_upstream: bool = True) -> None:
+        if self.limiter is not None:
+            self.limiter.release(latency if reached_upstream else None, ok)
+        if self.breaker is not None:
+            if reached_upstream:
+                self.breaker.record(ok)
+            else:
+                self.breaker.forget()
+
+
+def make_route(
+    origins: list[str],
+    freshness: FreshnessPolicy | None,
+    prefix: str = "/",
+    host: str | None = None,
+    balancer: str = settings.UPSTREAM_BALANCER,
+    overload: OverloadPolicy | None = None,
+) -> Route:
+    if not origins:
+        raise ValueError(f"Route {host or ''}{prefix} has no origins")
+    route = Route(
+        prefix=f"/{prefix.lstrip('/')}",
+        host=host.lower() if host else None,
+        upstreams=[Upstream(origin) for origin in origins],
+        balancer=make_balancer(balancer),
+        freshness=freshness,
+    )
+    if overload is not None:
+        route.limiter = overload.make_limiter(route.name)
+        route.breaker = overload.make_breaker(route.name)
+    return route
+
+
+def get_request_host(request_components: RequestComponents) -> str:
+    host = request_components.get_header(b"host").lower()
+    port_sep = host.rfind(":")
+    return host[:port_sep] if port_sep > host.rfind("]") else host
+
+
+class RouteTable:
+    """Routes checked in order of specificity: host routes before the others, longer prefixes first."""
+
+    def __init__(self, routes: list[Route]) -> None:
+        self.routes = sorted(routes, key=lambda route: (route.host is None, -len(route.prefix)))
+
+    def match(self, request_components: RequestComponents) -> Route | None:
+        # the Host header is only parsed when some route needs it, those are sorted first
+        host = get_request_host(request_components) if self.routes[0].host else ""
+        path = f"/{request_components.path}"
+        for route in self.routes:
+            if route.matches(host, path):
+                return route
+        return None
+
+    @property
+    def stats(self) -> list[UpstreamStats]:
+        now = time.monotonic()
+        return [
+            UpstreamStats(
+                route=route.name,
+                url=upstream.url,
+                outstanding=upstream.outstanding,
+                ewma_ms=upstream.ewma * 1000,
+                requests=upstream.requests,
+                failures=upstream.failures,
+                ejections=upstream.ejections,
+                ejected=not upstream.is_available(now),
+                connections_opened=upstream.connections_opened,
+                connections_reused=upstream.connections_reused,
+                pool_wait_ms=upstream.pool_wait / upstream.requests * 1000 if upstream.requests else 0.0,
+            )
+            for route in self.routes
+            for upstream in route.upstreams
+        ]
+
+    @property
+    def overload_stats(self) -> list[RouteStats]:
+        """Limiter and circuit state of the routes that have either."""
+        return [
+            RouteStats(
+                route=route.name,
+                limiter=route.limiter.name if route.limiter is not None else "none",
+                limit=route.limiter.limit if route.limiter is not None else 0.0,
+                in_flight=route.limiter.in_flight if route.limiter is not None else 0,
+                queued=route.limiter.queued if route.limiter is not None else 0,
+                shed={
+                    **(route.limiter.shed if route.limiter is not None else {}),
+                    **({"circuit_open": route.breaker.shed} if route.breaker is not None else {}),
+                },
+                circuit=route.breaker.state if route.breaker is not None else "off",
+                circuit_opened=route.breaker.opened if route.breaker is not None else 0,
+            )
+            for route in self.routes
+            if route.limiter is not None or route.breaker is not None
+        ]
+
+
+def create_route_table(
+    default_origins: list[str],
+    default_freshness: FreshnessPolicy,
+    balancer: str = settings.UPSTREAM_BALANCER,
+    routes_file: Path | None = None,
+    overload: OverloadPolicy | None = None,
+) -> RouteTable:
+    """
+    Routes from the file, each with its own TTL and cache policy derived from the defaults,
+    followed by a catch-all route to the default origins when there are any.
+    """
+    routes = []
+    if routes_file is not None:
+        config = RoutesConfig.model_validate_json(routes_file.read_text())
+        for route in config.routes:
+            freshness = None
+            if route.cache:
+                freshness = default_freshness.derive(default_ttl=route.ttl, max_ttl=route.max_ttl)
+            routes.append(make_route(route.origins, freshness, route.prefix, route.host, route.balancer or balancer, overload))
+
+    if default_origins:
+        routes.append(make_route(default_origins, default_freshness, balancer=balancer, overload=overload))
+    if not routes:
+        raise ValueError("No origin to proxy to, pass an origin or a routes file")
+    return RouteTable(routes)
@@ -1,31 +1,149 @@
-from pydantic import BaseModel, Field
-
-
-class RequestComponents(BaseModel):
-    headers: dict[str, str]
-    params: dict[str, str]
-    path: str
-    method: str
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
 
 
 class DataToCache(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     status_code: int
     headers: dict[str, str]
-    body: bytes
+    body: bytes | memoryview
+
+    _header_block: list[tuple[bytes, bytes]] | None = PrivateAttr(default=None)
+
+    @property
+    def header_block(self) -> list[tuple[bytes, bytes]]:
+        """
+        ASGI headers of a HIT that sends the body as stored. Encoded on first use and kept with the entry,
+        so repeated hits on an in-memory entry reuse the same list; it must not be modified.
+        """
+        if self._header_block is None:
+            block = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in self.headers.items()]
+            if "content-encoding" in self.headers:
+                vary = self.headers.get("vary", "")
+                if "accept-encoding" not in vary.lower():
+                    block = [(name, value) for name, value in block if name != b"vary"]
+                    block.append((b"vary", f"{vary}, Accept-Encoding".encode("latin-1") if vary else b"Accept-Encoding"))
+            block.append((b"content-length", str(len(self.body)).encode()))
+            block.append((b"x-cache", b"HIT"))
+            self._header_block = block
+        return self._header_block
 
 
 class CachedBucket(BaseModel):
     ttl: int = Field(default=0, ge=0)
     expires_at: float | None = Field(default=None, ge=0)
+    stale_ttl: int = Field(default=0, ge=0)
+    size: int = Field(default=0, ge=0)
+    hits: int = Field(default=0, ge=0)
     value: DataToCache
 
 
+class KeyInfo(BaseModel):
+    key: str
+    expires_at: float | None
+    size: int
+    hits: int
+
+
+class KeysPage(BaseModel):
+    keys: list[KeyInfo]
+    cursor: str | None
+
+
+class PurgeResult(BaseModel):
+    removed: int
+
+
+class CacheStats(BaseModel):
+    policy: str
+    entries: int
+    bytes: int
+    max_entries: int
+    max_bytes: int
+    hits: int
+    stale_hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    rejections: int
+    errors: int = 0
+    tiers: list["CacheStats"] = []
+
+
+class CoalescingStats(BaseModel):
+    leaders: int
+    coalesced: int
+    in_flight: int
+
+
+class RevalidationStats(BaseModel):
+    not_modified: int
+    modified: int
+    bytes_saved: int
+
+
+class UpstreamStats(BaseModel):
+    route: str
+    url: str
+    outstanding: int
+    ewma_ms: float
+    requests: int
+    failures: int
+    ejections: int
+    ejected: bool
+    connections_opened: int = 0
+    connections_reused: int = 0
+    pool_wait_ms: float = 0.0
+
+
+class RouteStats(BaseModel):
+    route: str
+    limiter: str
+    limit: float
+    in_flight: int
+    queued: int
+    # requests refused without contacting the origin, by reason
+    shed: dict[str, int]
+    circuit: str
+    circuit_opened: int
+
+
+class AdmissionStats(BaseModel):
+    sketch: str
+    admitted: int
+    # responses kept out of the cache, by reason: size, frequency or cost
+    rejected: dict[str, int]
+
+
+class ServerStats(BaseModel):
+    cache: CacheStats
+    coalescing: CoalescingStats
+    revalidation: RevalidationStats
+    upstreams: list[UpstreamStats] = []
+    routes: list[RouteStats] = []
+    # None when negative caching is off
+    negative: CacheStats | None = None
+    # None when every cacheable response is stored
+    admission: AdmissionStats | None = None
+
+
+class RouteConfig(BaseModel):
+    prefix: str = "/"
+    host: str | None = None
+    origins: list[str]
+    balancer: str | None = None
+    # None keeps the server-wide value
+    ttl: int | None = None
+    max_ttl: int | None = None
+    cache: bool = True
+
+
+class RoutesConfig(BaseModel):
+    routes: list[RouteConfig]
+
+
 class AppStatus(BaseModel):
     host: str
     port: int
     origin: str
     ttl: int
-
-
-class AppConfig(BaseModel):
-    servers: list[AppStatus]
@@ -1,31 +1,57 @@
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
 from contextlib import asynccontextmanager
+from pathlib import Path
 
-import httpx
 import uvicorn
-from fastapi import FastAPI, Request, Response
+from fastapi import FastAPI, HTTPException, Request, Response, status
 
+from src.caching_proxy.admission import AdmissionFilter, make_sketch
+from src.caching_proxy.cache import Cache, InMemoryCache
+from src.caching_proxy.coalescing import SingleFlight
+from src.caching_proxy.compression import get_codec
 from src.caching_proxy.config import settings
-from src.caching_proxy.logconfig import configurate_logging, get_logger
+from src.caching_proxy.disk import DiskCache, TieredCache
+from src.caching_proxy.expiry import run_active_expiry
+from src.caching_proxy.freshness import FreshnessPolicy
+from src.caching_proxy.logconfig import configurate_logging, get_logger, start_log_listener, stop_log_listener
 from src.caching_proxy.management import router as router_management
-from src.caching_proxy.middlewares import CacheLoggingMiddleware
+from src.caching_proxy.middlewares import CacheHitMiddleware, CacheLoggingMiddleware
+from src.caching_proxy.negative import NegativeCachePolicy
+from src.caching_proxy.overload import OverloadPolicy
+from src.caching_proxy.pool import check_http2_available, create_origin_client
+from src.caching_proxy.routing import create_route_table
 from src.caching_proxy.schemas import AppStatus
-from src.caching_proxy.service import ProxyServiceDep
-from src.caching_proxy.utils import CachingHelper, cfg
+from src.caching_proxy.service import ProxyServiceDep, create_proxy_service
+from src.caching_proxy.shared import LocalRespServer, RedisCache
+from src.caching_proxy.snapshot import dump_snapshot, restore_snapshot
+from src.caching_proxy.utils import cfg
 
 logger = get_logger("server")
 
+WORKER_ARGS_ENV = "CACHING_PROXY_WORKER_ARGS"
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with httpx.AsyncClient(
-        timeout=settings.HTTPX_TIMEOUT,
-        follow_redirects=settings.HTTPX_FOLLOW_REDIRECTS,
-        limits=httpx.Limits(
-            max_connections=settings.HTTPX_MAX_CONNECTIONS,
-            max_keepalive_connections=settings.HTTPX_MAX_KEEP_ALIVE_CONNECTIONS,
-        ),
-    ) as client:
+    async with create_origin_client(app.state) as client:
+        # uvicorn re-applies the logging config on startup, which replaces the queue listener
+        start_log_listener()
         app.state.client = client
+        app.state.single_flight = SingleFlight()
+        app.state.proxy_service = create_proxy_service(app.state)
+        expiry_tasks = [
+            asyncio.create_task(run_active_expiry(cache, settings.EXPIRY_INTERVAL, settings.EXPIRY_TIME_BUDGET))
+            for cache in (app.state.cache, app.state.negative_cache)
+            if cache is not None
+        ]
+        restore_task = None
+        if app.state.snapshot is not None:
+            # readiness does not wait for the snapshot, entries show up in the cache as they are read
+            restore_task = asyncio.create_task(restore_snapshot(app.state.cache, app.state.snapshot))
         logger.info("Running proxy server on %s:%s", settings.HOST, app.state.port)
         logger.info("Requests will be proxied from %s", app.state.origin)
 
@@ -33,7 +59,18 @@ async def lifespan(app: FastAPI):
         cfg.add_server_to_config(server=server)
         yield
         logger.info("Shutting down proxy server...")
+        for expiry_task in expiry_tasks:
+            expiry_task.cancel()
+        if restore_task is not None:
+            restore_task.cancel()
+        if app.state.snapshot is not None:
+            written = dump_snapshot(app.state.cache, app.state.snapshot)
+            logger.info("Saved %s cache entries to %s", written, app.state.snapshot)
+        await app.state.cache.close()
+        if app.state.negative_cache is not None:
+            await app.state.negative_cache.close()
         cfg.remove_server_from_config(port=app.state.port)
+        stop_log_listener()
 
 
 configurate_logging()
@@ -45,14 +82,153 @@ app = FastAPI(
     docs_url=None,
     redoc_url=None,
 )
+app.add_middleware(CacheHitMiddleware)
 app.add_middleware(CacheLoggingMiddleware)
 
 
-def run_server(args):
-    app.state.origin = args.origin.rstrip("/")
+def create_cache(args) -> Cache:
+    memory_cache = InMemoryCache(
+        max_entries=args.max_entries,
+        max_bytes=args.max_bytes,
+        policy=args.eviction,
+    )
+    if args.cache_backend == "memory":
+        return memory_cache
+
+    if args.cache_backend in ("shared", "redis"):
+        return RedisCache(url=args.redis_url)
+
+    disk_cache = DiskCache(
+        directory=Path(args.cache_dir) if args.cache_dir else settings.CACHE_DIR,
+        max_bytes=args.disk_max_bytes,
+    )
+    if args.cache_backend == "disk":
+        return disk_cache
+
+    return TieredCache(hot=memory_cache, cold=disk_cache)
+
+
+def create_admission_filter(args) -> AdmissionFilter | None:
+    if args.admission == "none":
+        return None
+    # the sketch is sized for the keys the cache can hold, an unbounded cache gets the default size
+    capacity = args.max_entries if args.max_entries > 0 else settings.CACHE_MAX_ENTRIES
+    return AdmissionFilter(
+        make_sketch(args.admission, capacity),
+        max_object_size=max(args.max_cacheable_size, 0),
+        # a bloom filter only tells one request from several
+        min_hits=min(max(args.admission_min_hits, 1), 2) if args.admission == "bloom" else max(args.admission_min_hits, 1),
+        max_bytes_per_hit=max(args.admission_max_bytes_per_hit, 0),
+    )
+
+
+def get_snapshot_path(args) -> Path | None:
+    if not args.snapshot:
+        return None
+    if args.cache_backend != "memory":
+        logger.warning("Cache snapshots are only needed for the memory backend, %s is ignored", args.snapshot)
+        return None
+    if args.workers > 1:
+        logger.warning("Cache snapshots are not supported with several workers, %s is ignored", args.snapshot)
+        return None
+    return Path(args.snapshot)
+
+
+def configure_app(args) -> FastAPI:
+    origins = [origin.strip() for origin in (args.origin or "").split(",") if origin.strip()]
+    app.state.origin = ", ".join(origin.rstrip("/") for origin in origins) or f"routes from {args.routes}"
     app.state.port = args.port
+    app.state.workers = args.workers
     app.state.ttl = args.ttl if args.ttl >= 0 else 0
-    uvicorn.run(app=app, host=settings.HOST, port=args.port, log_config="logging_config.json")
+    app.state.freshness = FreshnessPolicy(
+        default_ttl=app.state.ttl,
+        max_ttl=args.max_ttl,
+        ignored_headers=frozenset(settings.REQUEST_EXCLUDED_HEADERS),
+    )
+    app.state.routes = create_route_table(
+        origins,
+        app.state.freshness,
+        balancer=args.balancer,
+        routes_file=Path(args.routes) if args.routes else None,
+        overload=OverloadPolicy(
+            limiter=args.limiter,
+            max_limit=args.limit_max,
+            max_queue=max(args.queue_size, 0),
+            queue_timeout=max(args.queue_timeout, 0.0),
+            circuit_breaker=args.circuit_breaker,
+            failure_ratio=args.circuit_failure_ratio,
+            open_time=max(args.circuit_open_time, 0.0),
+        ),
+    )
+    app.state.max_connections = max(args.max_connections, 0)
+    app.state.max_keepalive_connections = max(args.max_keepalive_connections, 0)
+    app.state.keepalive_expiry = max(args.keepalive_expiry, 0.0)
+    app.state.pool_timeout = max(args.pool_timeout, 0.0)
+    app.state.http2 = args.http2
+    if args.http2:
+        check_http2_available()
+    app.state.stale_while_revalidate = max(args.stale_while_revalidate, 0)
+    app.state.stale_if_error = max(args.stale_if_error, 0)
+    app.state.revalidate_window = max(args.revalidate_window, 0)
+    app.state.max_cacheable_size = max(args.max_cacheable_size, 0)
+    app.state.hash_keys = args.hash_keys
+    app.state.compression = get_codec(args.compression)
+    app.state.compression_min_size = max(args.compression_min_size, 0)
+    app.state.cache = create_cache(args)
+    app.state.admission = create_admission_filter(args)
+    app.state.negative_policy = NegativeCachePolicy.parse(args.negative_ttl)
+    app.state.negative_cache = None
+    if app.state.negative_policy:
+        app.state.negative_cache = InMemoryCache(
+            max_entries=max(args.negative_max_entries, 0),
+            max_bytes=settings.NEGATIVE_CACHE_MAX_BYTES,
+        )
+    app.state.snapshot = get_snapshot_path(args)
+    return app
+
+
+def create_worker_app() -> FastAPI:
+    """App factory for uvicorn worker processes, which get the CLI arguments through the environment."""
+    args = argparse.Namespace(**json.loads(os.environ[WORKER_ARGS_ENV]))
+    return configure_app(args)
+
+
+def get_server_implementations() -> dict[str, str]:
+    """The uvloop event loop and the httptools parser when installed with the `speedups` extra, asyncio and h11 otherwise."""
+    return {
+        "loop": "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        "http": "httptools" if importlib.util.find_spec("httptools") else "h11",
+    }
+
+
+def run_server(args):
+    if args.cache_backend == "shared":
+        shared_server = LocalRespServer(max_bytes=args.max_bytes, policy=args.eviction)
+        args.redis_url = shared_server.start()
+
+    implementations = get_server_implementations()
+    logger.info("Serving with the %s event loop and the %s HTTP parser", implementations["loop"], implementations["http"])
+
+    if args.workers <= 1:
+        configure_app(args)
+        uvicorn.run(app=app, host=settings.HOST, port=args.port, log_config="logging_config.json", **implementations)
+        return
+
+    if args.cache_backend in ("memory", "tiered"):
+        logger.warning(
+            "Each of %s workers keeps a private %s cache, use --cache-backend shared", args.workers, args.cache_backend
+        )
+
+    os.environ[WORKER_ARGS_ENV] = json.dumps({k: v for k, v in vars(args).items() if k != "func"})
+    uvicorn.run(
+        "src.caching_proxy.server:create_worker_app",
+        factory=True,
+        host=settings.HOST,
+        port=args.port,
+        workers=args.workers,
+        log_config="logging_config.json",
+        **implementations,
+    )
 
 
 app.include_router(router_management)
@@ -64,15 +240,19 @@ async def proxy(
     request: Request,
     proxy_service: ProxyServiceDep,
 ) -> Response:
-    request_components = CachingHelper.extract_request_components(request)
-    cache_key = CachingHelper.make_cache_key(request_components)
+    # CacheHitMiddleware already matched the route and built the key, resolve() reads them from the scope state
+    resolved = proxy_service.resolve(request.scope)
+    if resolved is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No route for /{path}")
+    request_components, route, cache_key = resolved
 
-    cached_response = proxy_service.get_cached_response(
-        request,
+    # fresh hits never get here, CacheHitMiddleware sends them before routing
+    stale_response = await proxy_service.get_stale_response(
+        request_components,
+        route,
         cache_key,
-        request.method,
     )
-    if cached_response:
-        return cached_response
+    if stale_response:
+        return stale_response
 
-    return await proxy_service.fetch_from_origin(request_components)
+    return await proxy_service.fetch_from_origin(request_components, route, cache_key)
@@ -1,62 +1,517 @@
-from typing import Annotated
+import asyncio
+from dataclasses import replace
+from time import perf_counter
+from typing import Annotated, AsyncIterator, Awaitable, Callable, Mapping
 
 import httpx
 from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from starlette.datastructures import State
+from starlette.types import Receive, Scope, Send
 
-from src.caching_proxy.cache import Cache, cache
+from src.caching_proxy.admission import AdmissionFilter
+from src.caching_proxy.cache import Cache
+from src.caching_proxy.coalescing import SingleFlight
+from src.caching_proxy.compression import CODECS, Codec, accepts_encoding, is_compressible
+from src.caching_proxy.config import settings
+from src.caching_proxy.freshness import Freshness, FreshnessPolicy, get_marker_vary, make_vary_marker
 from src.caching_proxy.logconfig import get_logger
-from src.caching_proxy.schemas import DataToCache, RequestComponents
+from src.caching_proxy.metrics import metrics
+from src.caching_proxy.negative import NEGATIVE_HIT, NegativeCachePolicy
+from src.caching_proxy.overload import OriginShed
+from src.caching_proxy.pool import ConnectionTrace
+from src.caching_proxy.ranges import (
+    RangeNotSatisfiable,
+    build_not_satisfiable_response,
+    build_range_response,
+    get_complete_length,
+    if_range_matches,
+    parse_range,
+)
+from src.caching_proxy.request import RequestComponents
+from src.caching_proxy.routing import Route, RouteTable
+from src.caching_proxy.schemas import DataToCache
 from src.caching_proxy.utils import CachingHelper
 
 logger = get_logger("service")
 
+# a background fetch of the whole object must not ask for the client's range
+RANGE_REQUEST_HEADERS = frozenset((b"range", b"if-range"))
+# preconditions of one client; the origin's answer to them can not be shared with coalesced requests
+CONDITIONAL_REQUEST_HEADERS = frozenset((b"if-none-match", b"if-modified-since", b"if-match", b"if-unmodified-since"))
+# statuses that answer the leader's own preconditions or range, waiters fetch their own response instead
+PER_CLIENT_STATUSES = frozenset(
+    (status.HTTP_206_PARTIAL_CONTENT, status.HTTP_304_NOT_MODIFIED, status.HTTP_412_PRECONDITION_FAILED)
+)
+
+
+def get_content_length(headers: Mapping[str, str]) -> int | None:
+    """The origin's Content-Length, None when it is missing or not a valid length, so the size is unknown."""
+    value = headers.get("content-length", "").strip()
+    return int(value) if value.isascii() and value.isdigit() else None
+
+
+class OriginStreamTee:
+    """Relays an origin body chunk by chunk while buffering up to `max_buffered` bytes of it for the cache."""
+
+    def __init__(self, response: httpx.Response, max_buffered: int):
+        self._response = response
+        self._max_buffered = max_buffered
+        self._chunks: list[bytes] | None = [] if max_buffered >= 0 else None
+        self._buffered = 0
+        self._completed = False
+        self._finished = False
+        self.on_finish: Callable[[], Awaitable[None]] | None = None
+
+    @property
+    def buffered_body(self) -> bytes | None:
+        if not self._completed or self._chunks is None:
+            return None
+        return b"".join(self._chunks)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in self._response.aiter_bytes():
+                if self._chunks is not None:
+                    self._buffered += len(chunk)
+                    if self._buffered > self._max_buffered:
+                        logger.debug("Body of %s exceeds %s bytes, not caching", self._response.url, self._max_buffered)
+                        self._chunks = None
+                    else:
+                        self._chunks.append(chunk)
+                yield chunk
+            self._completed = True
+        except httpx.HTTPError as exc:
+            logger.error(
+                "HTTP error streaming %s! Type: %s. DETAIL: %s",
+                self._response.url,
+                exc.__class__.__name__,
+                str(exc),
+            )
+            raise
+        finally:
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        await self._response.aclose()
+        if self.on_finish is not None:
+            await self.on_finish()
+
+
+class OriginStreamResponse(StreamingResponse):
+    """
+    Sends an OriginStreamTee and closes it however the response ends. A disconnecting client stops
+    the send with ClientDisconnect, so a background task would never run and the tee would stay suspended
+    with the origin connection open and coalesced requests waiting for it.
+    """
+
+    def __init__(self, tee: OriginStreamTee, status_code: int, headers: Mapping[str, str]):
+        super().__init__(content=tee, status_code=status_code, headers=headers)
+        self._tee = tee
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self._tee.aclose()
+
 
 class ProxyService:
     def __init__(
         self,
-        origin: str,
-        ttl: int,
+        routes: RouteTable,
+        freshness: FreshnessPolicy,
         client: httpx.AsyncClient,
         cache: Cache,
+        single_flight: SingleFlight,
+        stale_while_revalidate: int = 0,
+        stale_if_error: int = 0,
+        revalidate_window: int = 0,
+        max_cacheable_size: int = settings.MAX_CACHEABLE_SIZE,
+        hash_keys: bool = False,
+        compression: Codec | None = None,
+        compression_min_size: int = settings.COMPRESSION_MIN_SIZE,
+        negative_cache: Cache | None = None,
+        negative_policy: NegativeCachePolicy | None = None,
+        admission: AdmissionFilter | None = None,
+        coalesce_timeout: float = settings.COALESCE_TIMEOUT,
     ):
-        self.origin = origin
-        self.ttl = ttl
+        self.routes = routes
+        # rules shared by every route; lifetimes come from the policy of the route that served the response
+        self.freshness = freshness
         self.client = client
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_if_error = stale_if_error
+        self.revalidate_window = revalidate_window
+        self.max_cacheable_size = max_cacheable_size
+        self.admission = admission
+        self.hash_keys = hash_keys
+        self.compression = compression
+        self.compression_min_size = compression_min_size
         self._cache = cache
+        # error responses live in their own small store, so they can never evict a response worth keeping
+        self._negative_cache = negative_cache
+        self.negative_policy = negative_policy
+        self._single_flight = single_flight
+        # a leader streams to its own client first, a slow one must not hold its waiters indefinitely
+        self.coalesce_timeout = coalesce_timeout
 
-    def get_cached_response(self, request: Request, cache_key: str, method: str) -> Response | None:
-        cached: None | DataToCache = self._cache.getval(cache_key)
-        if not cached:
+    def resolve(self, scope: Scope) -> tuple[RequestComponents, Route, str] | None:
+        """
+        Matches the route and builds the cache key once per request, CacheHitMiddleware does it and the proxy
+        route reads the result back from the scope state. Returns None when no route serves the request.
+        """
+        state = scope.setdefault("state", {})
+        if "route" not in state:
+            request_components = CachingHelper.extract_scope_components(scope)
+            route = self.routes.match(request_components)
+            state["request_components"] = request_components
+            state["route"] = route
+            if route is not None:
+                state["cache_key"] = CachingHelper.make_cache_key(
+                    request_components, hashed=self.hash_keys, namespace=route.key_namespace
+                )
+        if state["route"] is None:
             return None
+        return state["request_components"], state["route"], state["cache_key"]
 
-        if self._is_conditional_request(request, cached.headers):
-            return self._build_not_modified_response(cached.headers)
+    async def get_cached_entry(
+        self,
+        request_components: RequestComponents,
+        cache_key: str,
+    ) -> DataToCache | None:
+        cached = await self._lookup(request_components, cache_key, self._cache.getval)
+        if cached is not None and self.freshness.requires_revalidation(cached.headers):
+            # fetch_from_origin finds it as the revalidation candidate
+            return None
+        return cached
 
-        return self._build_cached_response(
-            cached.body,
-            cached.status_code,
-            cached.headers,
-            method,
+    def can_send_as_is(self, request_components: RequestComponents, cached: DataToCache) -> bool:
+        """Whether a hit can go out with the entry's precomputed headers, without a 304 check or decompression."""
+        if request_components.get_header(b"if-none-match") or request_components.get_header(b"if-modified-since"):
+            return False
+        if request_components.method == "GET" and request_components.get_header(b"range"):
+            return False
+
+        encoding = cached.headers.get("content-encoding")
+        return not encoding or accepts_encoding(request_components.accept_encoding, encoding)
+
+    async def get_stale_response(
+        self,
+        request_components: RequestComponents,
+        route: Route,
+        cache_key: str,
+    ) -> Response | None:
+        if not self.stale_while_revalidate:
+            return None
+
+        found = await self._lookup_entry(
+            request_components,
+            cache_key,
+            lambda key: self._cache.getstale(key, self.stale_while_revalidate),
         )
+        if not found or not self.freshness.allows_stale(found[1].headers):
+            return None
+        stale_key, cached = found
+        self._cache.record_stale_hit(stale_key)
+
+        self._single_flight.spawn(
+            cache_key,
+            lambda: self._fetch(request_components, route, cache_key, expired=cached),
+        )
+        logger.debug("Serving stale %s while revalidating in background", cache_key)
+
+        return self.respond_from_cache(request_components, cached, "STALE")
 
     async def fetch_from_origin(
         self,
         request_components: RequestComponents,
+        route: Route,
+        cache_key: str,
+    ) -> Response:
+        if self._negative_cache is not None:
+            negative = await self._negative_cache.getval(cache_key)
+            if negative is not None:
+                return await self._build_origin_response(request_components, cache_key, negative, NEGATIVE_HIT)
+
+        try:
+            if request_components.method == "GET" and request_components.get_header(b"range"):
+                # waiting for an in-flight fetch of a large object would delay the range the client asked for
+                return await self._fetch_range(request_components, route, cache_key)
+
+            flight = self._single_flight.join(cache_key)
+            if flight is not None:
+                try:
+                    # shield: giving up on the flight must not cancel the leader's fetch
+                    fetched = await asyncio.wait_for(asyncio.shield(flight), self.coalesce_timeout)
+                except TimeoutError:
+                    logger.warning("In-flight fetch of %s took over %ss, fetching directly", cache_key, self.coalesce_timeout)
+                    fetched = None
+                if fetched is not None and self.freshness.get_vary(fetched.headers) != ():
+                    # the leader may have fetched another variant, only reuse the one stored for our headers
+                    fetched = await self._lookup(request_components, cache_key, self._cache.getval)
+            else:
+                expired = await self._get_revalidation_candidate(request_components, cache_key)
+                # the client's preconditions go to the origin unless the stored validators replace them,
+                # then the result answers this client only and it does not lead a coalesced fetch
+                shareable = expired is not None or not self._has_preconditions(request_components)
+                if request_components.method == "GET":
+                    return await self._stream_from_origin(
+                        request_components, route, cache_key, coalesce=shareable, expired=expired
+                    )
+                if shareable:
+                    fetched = await self._single_flight.do(
+                        cache_key,
+                        lambda: self._fetch(request_components, route, cache_key, expired=expired),
+                    )
+                else:
+                    fetched = await self._fetch(request_components, route, cache_key, expired=expired)
+        except HTTPException as exc:
+            max_stale = self.stale_if_error
+            if isinstance(exc, OriginShed):
+                # the origin was not even asked, an entry kept for revalidation beats an error
+                max_stale = max(max_stale, self.revalidate_window)
+            stale_response = await self._get_stale_on_error(request_components, cache_key, max_stale)
+            if stale_response:
+                return stale_response
+            raise
+
+        if fetched is None:
+            # the leader's body was too large, not shareable with this client or too slow, fetch our own copy
+            return await self._stream_from_origin(request_components, route, cache_key, coalesce=False)
+
+        return await self._build_origin_response(request_components, cache_key, fetched)
+
+    async def _fetch(
+        self,
+        request_components: RequestComponents,
+        route: Route,
+        cache_key: str,
+        expired: DataToCache | None = None,
+    ) -> DataToCache:
+        validators = self.freshness.get_validators(expired.headers) if expired is not None else {}
+        resp = await self._send_to_origin(request_components, route, stream=False, validators=validators)
+        if validators and resp.status_code == status.HTTP_304_NOT_MODIFIED:
+            return await self._refresh_not_modified(request_components, route, cache_key, expired, resp)
+
+        fetched = DataToCache(
+            status_code=resp.status_code,
+            headers=self._clean_origin_headers(resp),
+            body=resp.content,
+        )
+        freshness = self._get_freshness(request_components, route, fetched.status_code, fetched.headers)
+        if freshness is not None and self._admit(cache_key, len(resp.content)):
+            await self._save_to_cache(request_components, cache_key, fetched, freshness)
+        elif not self._is_cacheable_status(fetched.status_code):
+            await self._save_negative(request_components, route, cache_key, fetched)
+
+        return fetched
+
+    async def _fetch_range(
+        self,
+        request_components: RequestComponents,
+        route: Route,
+        cache_key: str,
     ) -> Response:
+        """
+        Relays the origin's answer to the range request without storing it. When the object fits the cache,
+        going by the size in Content-Range, it is fetched whole once in the background,
+        so the following ranges are cut from the cached body.
+        """
+        metrics.range_requests.inc(("origin",))
+        response = await self._stream_from_origin(request_components, route, cache_key, coalesce=False)
+        if response.status_code != status.HTTP_206_PARTIAL_CONTENT:
+            # the origin ignored the range, a full 200 is stored as it streams
+            return response
+
+        size = get_complete_length(response.headers.get("content-range", ""))
+        if route.freshness is not None and size is not None and self._admit(cache_key, size):
+            full_request = replace(
+                request_components,
+                excluded_headers=request_components.excluded_headers | RANGE_REQUEST_HEADERS,
+            )
+            self._single_flight.spawn(cache_key, lambda: self._fetch_full_object(full_request, route, cache_key))
+        return response
+
+    async def _fetch_full_object(
+        self,
+        request_components: RequestComponents,
+        route: Route,
+        cache_key: str,
+    ) -> DataToCache | None:
+        """
+        Downloads the whole object for the cache, giving up as soon as it is known not to be stored:
+        an uncacheable response or a body larger than max_cacheable_size. Requests waiting for it
+        then fetch their own copy.
+        """
+        resp = await self._send_to_origin(request_components, route, stream=True)
+        try:
+            response_headers = self._clean_origin_headers(resp)
+            freshness = self._get_freshness(request_components, route, resp.status_code, response_headers)
+            content_length = get_content_length(resp.headers)
+            if freshness is None or (content_length is not None and content_length > self.max_cacheable_size):
+                return None
+
+            chunks = []
+            size = 0
+            async for chunk in resp.aiter_bytes():
+                size += len(chunk)
+                if size > self.max_cacheable_size:
+                    return None
+                chunks.append(chunk)
+        except httpx.HTTPError as exc:
+            logger.error(
+                "Background fetch of %s failed! Type: %s. DETAIL: %s",
+                cache_key,
+                exc.__class__.__name__,
+                str(exc),
+            )
+            return None
+        finally:
+            await resp.aclose()
+
+        fetched = DataToCache(
+            status_code=resp.status_code,
+            headers=response_headers,
+            body=b"".join(chunks),
+        )
+        await self._save_to_cache(request_components, cache_key, fetched, freshness)
+        logger.debug("Fetched the whole of %s in background, %s bytes", cache_key, size)
+        return fetched
+
+    async def _stream_from_origin(
+        self,
+        request_components: RequestComponents,
+        route: Route,
+        cache_key: str,
+        coalesce: bool = True,
+        expired: DataToCache | None = None,
+    ) -> Response:
+        flight = self._single_flight.begin(cache_key) if coalesce else None
+        resp = None
+        try:
+            validators = self.freshness.get_validators(expired.headers) if expired is not None else {}
+            resp = await self._send_to_origin(request_components, route, stream=True, validators=validators)
+            if validators and resp.status_code == status.HTTP_304_NOT_MODIFIED:
+                await resp.aclose()
+                refreshed = await self._refresh_not_modified(request_components, route, cache_key, expired, resp)
+                if flight is not None:
+                    flight.set_result(refreshed)
+                return self.respond_from_cache(request_components, refreshed, "REVALIDATED")
+
+            response_headers = self._clean_origin_headers(resp)
+
+            if resp.status_code != status.HTTP_206_PARTIAL_CONTENT and not self._is_cacheable_status(resp.status_code):
+                # error bodies are small and not cached, buffer them so waiters can share the result
+                await resp.aread()
+                fetched = DataToCache(
+                    status_code=resp.status_code,
+                    headers=response_headers,
+                    body=resp.content,
+                )
+                await self._save_negative(request_components, route, cache_key, fetched)
+                if flight is not None:
+                    flight.set_result(None if fetched.status_code in PER_CLIENT_STATUSES else fetched)
+                return await self._build_origin_response(request_components, cache_key, fetched)
+
+            freshness = self._get_freshness(request_components, route, resp.status_code, response_headers)
+            content_length = get_content_length(resp.headers)
+            buffer_body = freshness is not None and not (content_length is not None and content_length > self.max_cacheable_size)
+            if freshness is not None and not buffer_body:
+                # counted as rejected for its size; bodies the filter turns down otherwise are still buffered for waiters
+                self._admit(cache_key, content_length)
+        except BaseException as exc:
+            if resp is not None:
+                # the tee that would close it was not created
+                await resp.aclose()
+            if flight is not None and not flight.done():
+                if isinstance(exc, HTTPException):
+                    flight.set_exception(exc)
+                else:
+                    flight.set_result(None)
+            raise
+
+        tee = OriginStreamTee(resp, self.max_cacheable_size if buffer_body else -1)
+
+        async def finish() -> None:
+            body = tee.buffered_body
+            fetched = None
+            if body is not None:
+                fetched = DataToCache(
+                    status_code=resp.status_code,
+                    headers=response_headers,
+                    body=body,
+                )
+                if self._admit(cache_key, len(body)):
+                    await self._save_to_cache(request_components, cache_key, fetched, freshness)
+            if flight is not None and not flight.done():
+                flight.set_result(fetched)
+
+        tee.on_finish = finish
+        return OriginStreamResponse(tee, status_code=resp.status_code, headers={**response_headers, "X-Cache": "MISS"})
+
+    async def _send_to_origin(
+        self,
+        request_components: RequestComponents,
+        route: Route,
+        stream: bool,
+        validators: dict[str, str] | None = None,
+    ) -> httpx.Response:
+        await route.admit()
+        upstream = route.pick_upstream()
         target_url = CachingHelper.make_absolute_url(
-            self.origin,
+            upstream.url,
             request_components.path,
         )
 
+        start_time = perf_counter()
+        metrics.origin_in_flight.inc()
+        upstream.begin()
+        trace = ConnectionTrace()
+        healthy = False
+        reached_upstream = True
         try:
-            resp: httpx.Response = await self.client.request(
+            headers = request_components.headers
+            if validators:
+                # the cached validators replace the client's own, its conditions are checked against the refreshed entry
+                headers.pop("if-none-match", None)
+                headers.pop("if-modified-since", None)
+                headers.update(validators)
+
+            origin_request = self.client.build_request(
                 method=request_components.method,
                 url=target_url,
                 params=request_components.params,
-                headers=request_components.headers,
+                headers=headers,
                 content=None,
+                extensions={"trace": trace},
+            )
+            resp = await self.client.send(origin_request, stream=stream)
+            healthy = resp.status_code < status.HTTP_500_INTERNAL_SERVER_ERROR
+            metrics.origin_requests.inc(("ok",))
+            if validators:
+                not_modified = resp.status_code == status.HTTP_304_NOT_MODIFIED
+                metrics.revalidations.inc(("not_modified",) if not_modified else ("modified",))
+            return resp
+        except httpx.PoolTimeout as exc:
+            # every connection is busy, the origin itself is not at fault
+            reached_upstream = False
+            metrics.origin_requests.inc(("pool_timeout",))
+            logger.error(
+                "No free connection to %s within the pool timeout! Type: %s. DETAIL: %s",
+                upstream.url,
+                exc.__class__.__name__,
+                str(exc),
+            )
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Upstream connection pool exhausted: {upstream.url}",
             )
         except httpx.TimeoutException as exc:
+            metrics.origin_requests.inc(("timeout",))
             logger.error(
                 "Timeout after retries fetching %s! Type: %s. DETAIL: %s",
                 target_url,
@@ -68,6 +523,7 @@ class ProxyService:
                 detail=f"Origin server timeout: {target_url}",
             )
         except httpx.HTTPError as exc:
+            metrics.origin_requests.inc(("error",))
             logger.error(
                 "HTTP error fetching %s! Type: %s. DETAIL: %s",
                 target_url,
@@ -78,49 +534,238 @@ class ProxyService:
                 status_code=status.HTTP_502_BAD_GATEWAY,
                 detail=f"Proxy error: {exc.__class__.__name__}",
             )
+        finally:
+            elapsed = perf_counter() - start_time
+            trace.record(upstream)
+            if reached_upstream:
+                upstream.finish(elapsed, healthy)
+            else:
+                upstream.release()
+            route.complete(elapsed, healthy, reached_upstream)
+            metrics.origin_in_flight.dec()
+            metrics.origin_duration.observe(elapsed)
 
-        response_headers = CachingHelper.clean_response_headers_for_cache(dict(resp.headers))
-
-        if self._is_response_was_decoded(resp):
-            response_headers.pop("content-encoding", None)
-            logger.debug("Removed content-encoding because httpx decoded the content")
-
-        if resp.status_code in range(status.HTTP_200_OK, status.HTTP_300_MULTIPLE_CHOICES):
-            cache_key = CachingHelper.make_cache_key(request_components)
-            resp.headers = httpx.Headers(response_headers)
-            self._save_to_cache(cache_key, resp)
+    async def _build_origin_response(
+        self,
+        request_components: RequestComponents,
+        cache_key: str,
+        fetched: DataToCache,
+        cache_status: str = "MISS",
+    ) -> Response:
+        if fetched.status_code >= status.HTTP_500_INTERNAL_SERVER_ERROR:
+            stale_response = await self._get_stale_on_error(request_components, cache_key)
+            if stale_response:
+                return stale_response
+        if fetched.status_code == status.HTTP_200_OK and self._is_conditional_request(
+            request_components.headers, fetched.headers
+        ):
+            # a response shared by the leader is checked against this client's own preconditions
+            return self._build_not_modified_response(fetched.headers, cache_status)
 
-        response_headers["X-Cache"] = "MISS"
+        # a revalidated entry shared by the leader may be stored compressed
+        body, response_headers = self._encode_for_client(fetched.body, fetched.headers, request_components.accept_encoding)
+        response_headers["X-Cache"] = cache_status
 
         return Response(
-            content=resp.content,
-            status_code=resp.status_code,
+            content=body,
+            status_code=fetched.status_code,
             headers=response_headers,
         )
 
-    def _is_response_was_decoded(self, response: httpx.Response) -> bool:
-        content_encoding = response.headers.get("content-encoding", "").lower()
-        content_length = response.headers.get("content-length")
-        actual_content_length = len(response.content)
+    async def _get_stale_on_error(
+        self,
+        request_components: RequestComponents,
+        cache_key: str,
+        max_stale: int | None = None,
+    ) -> Response | None:
+        max_stale = self.stale_if_error if max_stale is None else max_stale
+        if not max_stale:
+            return None
+
+        found = await self._lookup_entry(
+            request_components,
+            cache_key,
+            lambda key: self._cache.getstale(key, max_stale),
+        )
+        if not found or not self.freshness.allows_stale(found[1].headers):
+            return None
+        stale_key, cached = found
+        self._cache.record_stale_hit(stale_key)
+
+        logger.warning("Origin failed, serving stale %s", cache_key)
+        return self._build_cached_response(
+            cached.body,
+            cached.status_code,
+            cached.headers,
+            request_components.method,
+            "STALE",
+            request_components.accept_encoding,
+        )
 
-        logger.debug("Content-Encoding: %s", "N/A" if not content_encoding else content_encoding)
-        logger.debug("Content-Length: %s", content_length)
-        logger.debug("Actual length: %s", actual_content_length)
+    async def _lookup(
+        self,
+        request_components: RequestComponents,
+        cache_key: str,
+        lookup: Callable[[str], Awaitable[DataToCache | None]],
+    ) -> DataToCache | None:
+        found = await self._lookup_entry(request_components, cache_key, lookup)
+        return None if found is None else found[1]
 
-        return content_encoding in ["gzip", "deflate", "br"] and content_length and int(content_length) != actual_content_length
+    async def _lookup_entry(
+        self,
+        request_components: RequestComponents,
+        cache_key: str,
+        lookup: Callable[[str], Awaitable[DataToCache | None]],
+    ) -> tuple[str, DataToCache] | None:
+        """Returns the entry with the key it is stored under, the variant key when the response varies."""
+        cached = await lookup(cache_key)
+        if cached is None:
+            return None
+
+        vary = get_marker_vary(cached)
+        if vary is None:
+            return cache_key, cached
+        variant_key = CachingHelper.make_variant_key(cache_key, vary, request_components, self.hash_keys)
+        cached = await lookup(variant_key)
+        return None if cached is None else (variant_key, cached)
+
+    async def _get_revalidation_candidate(
+        self,
+        request_components: RequestComponents,
+        cache_key: str,
+    ) -> DataToCache | None:
+        """Returns an expired entry that can be revalidated instead of refetched."""
+        if not self.revalidate_window:
+            return None
+
+        expired = await self._lookup(
+            request_components,
+            cache_key,
+            lambda key: self._cache.getstale(key, self.revalidate_window),
+        )
+        if expired is None or not self.freshness.get_validators(expired.headers):
+            return None
+        return expired
+
+    async def _refresh_not_modified(
+        self,
+        request_components: RequestComponents,
+        route: Route,
+        cache_key: str,
+        expired: DataToCache,
+        resp: httpx.Response,
+    ) -> DataToCache:
+        """Keeps the stored body, updating its headers and TTL from the origin's 304 response."""
+        refreshed = DataToCache(
+            status_code=expired.status_code,
+            headers={**expired.headers, **self._clean_origin_headers(resp)},
+            body=expired.body,
+        )
+        metrics.revalidation_bytes_saved.inc(amount=len(expired.body))
+        logger.debug("Origin confirmed %s is not modified, %s bytes saved", cache_key, len(expired.body))
+
+        freshness = self._get_freshness(request_components, route, refreshed.status_code, refreshed.headers)
+        if freshness is not None:
+            await self._save_to_cache(request_components, cache_key, refreshed, freshness)
+        return refreshed
+
+    def _get_freshness(
+        self,
+        request_components: RequestComponents,
+        route: Route,
+        status_code: int,
+        response_headers: dict[str, str],
+    ) -> Freshness | None:
+        if not self._is_cacheable_status(status_code):
+            return None
+        if route.freshness is None:
+            return None
+        return route.freshness.evaluate(request_components, response_headers)
+
+    def respond_from_cache(
+        self,
+        request_components: RequestComponents,
+        cached: DataToCache,
+        cache_status: str,
+    ) -> Response:
+        if self._is_conditional_request(request_components.headers, cached.headers):
+            return self._build_not_modified_response(cached.headers, cache_status)
+
+        range_header = request_components.get_header(b"range") if request_components.method == "GET" else ""
+        if range_header and cached.status_code == status.HTTP_200_OK:
+            response = self._build_range_response(request_components, cached, range_header, cache_status)
+            if response is not None:
+                return response
+
+        return self._build_cached_response(
+            cached.body,
+            cached.status_code,
+            cached.headers,
+            request_components.method,
+            cache_status,
+            request_components.accept_encoding,
+        )
+
+    def _build_range_response(
+        self,
+        request_components: RequestComponents,
+        cached: DataToCache,
+        range_header: str,
+        cache_status: str,
+    ) -> Response | None:
+        """Returns None when the full body is sent instead: the entry changed since If-Range or the header is ignored."""
+        if_range = request_components.get_header(b"if-range")
+        if if_range and not if_range_matches(if_range, cached.headers):
+            metrics.range_requests.inc(("full",))
+            return None
+
+        # ranges address the identity body, a compressed entry is decoded first
+        body, headers = self._encode_for_client(cached.body, cached.headers, "")
+        try:
+            ranges = parse_range(range_header, len(body))
+        except RangeNotSatisfiable:
+            metrics.range_requests.inc(("not_satisfiable",))
+            return build_not_satisfiable_response(len(body), cache_status)
+        if ranges is None:
+            metrics.range_requests.inc(("full",))
+            return None
+
+        metrics.range_requests.inc(("partial",) if len(ranges) == 1 else ("multipart",))
+        return build_range_response(body, ranges, headers, cache_status)
+
+    def _clean_origin_headers(self, response: httpx.Response) -> dict[str, str]:
+        response_headers = CachingHelper.clean_response_headers_for_cache(dict(response.headers))
+
+        # the client's Accept-Encoding is not forwarded, so httpx only negotiates encodings it decodes itself
+        if response_headers.pop("content-encoding", None):
+            logger.debug("Removed content-encoding because httpx decoded the content")
+
+        return response_headers
+
+    @staticmethod
+    def _is_cacheable_status(status_code: int) -> bool:
+        # a 206 holds part of the body, the whole object is stored under the key
+        return (
+            status.HTTP_200_OK <= status_code < status.HTTP_300_MULTIPLE_CHOICES
+            and status_code != status.HTTP_206_PARTIAL_CONTENT
+        )
+
+    @staticmethod
+    def _has_preconditions(request_components: RequestComponents) -> bool:
+        return any(name in CONDITIONAL_REQUEST_HEADERS for name, _ in request_components.raw_headers)
 
     def _is_conditional_request(
         self,
-        request: Request,
+        request_headers: Mapping[str, str],
         cached_headers: dict,
     ) -> bool:
-        if_none_match = request.headers.get("if-none-match")
+        if_none_match = request_headers.get("if-none-match")
         if if_none_match:
             cached_etag = cached_headers.get("etag")
             if cached_etag and if_none_match in [cached_etag, "*"]:
                 return True
 
-        if_modified_since = request.headers.get("if-modified-since")
+        if_modified_since = request_headers.get("if-modified-since")
         if if_modified_since:
             last_modified = cached_headers.get("last-modified")
             if last_modified and if_modified_since == last_modified:
@@ -128,9 +773,9 @@ class ProxyService:
 
         return False
 
-    def _build_not_modified_response(self, cached_headers: dict) -> Response:
+    def _build_not_modified_response(self, cached_headers: dict, cache_status: str = "HIT") -> Response:
         headers = {
-            "X-Cache": "HIT",
+            "X-Cache": cache_status,
             "ETag": cached_headers.get("etag", ""),
             "Last-Modified": cached_headers.get("last-modified", ""),
             "Cache-Control": cached_headers.get("cache-control", ""),
@@ -149,8 +794,11 @@ class ProxyService:
         status_code: int,
         headers: dict,
         method: str,
+        cache_status: str = "HIT",
+        accept_encoding: str = "",
     ) -> Response:
-        headers["X-Cache"] = "HIT"
+        body, headers = self._encode_for_client(body, headers, accept_encoding)
+        headers["X-Cache"] = cache_status
 
         if method == "HEAD":
             headers["Content-Length"] = str(len(body))
@@ -166,25 +814,118 @@ class ProxyService:
             headers=headers,
         )
 
-    def _save_to_cache(self, cache_key: str, response: httpx.Response) -> None:
-        self._cache.setval(
-            cache_key,
-            DataToCache(
-                status_code=response.status_code,
-                headers=dict(response.headers),
-                body=response.content,
-            ),
-            ttl=self.ttl,
+    def _encode_for_client(
+        self,
+        body: bytes | memoryview,
+        headers: dict[str, str],
+        accept_encoding: str,
+    ) -> tuple[bytes | memoryview, dict[str, str]]:
+        """Sends a compressed entry as is when the client accepts its encoding, otherwise decompresses it."""
+        headers = dict(headers)
+        encoding = headers.get("content-encoding")
+        if not encoding:
+            return body, headers
+
+        vary = headers.get("vary")
+        if not vary:
+            headers["vary"] = "Accept-Encoding"
+        elif "accept-encoding" not in vary.lower():
+            headers["vary"] = f"{vary}, Accept-Encoding"
+
+        codec = CODECS.get(encoding)
+        if codec is None or accepts_encoding(accept_encoding, encoding):
+            # an entry restored from disk may use a codec that is no longer installed, it is only sent as is
+            return body, headers
+
+        del headers["content-encoding"]
+        return codec.decompress(body), headers
+
+    def _compress(self, data: DataToCache) -> DataToCache:
+        if (
+            self.compression is None
+            or len(data.body) < self.compression_min_size
+            or "content-encoding" in data.headers
+            or not is_compressible(data.headers.get("content-type", ""), settings.COMPRESSIBLE_CONTENT_TYPES)
+        ):
+            return data
+
+        compressed = self.compression.compress(bytes(data.body))
+        if len(compressed) >= len(data.body):
+            return data
+
+        return DataToCache(
+            status_code=data.status_code,
+            headers={**data.headers, "content-encoding": self.compression.name},
+            body=compressed,
         )
 
+    def _admit(self, cache_key: str, size: int) -> bool:
+        """Whether a fetched response may be stored, asked once per response before Cache.setval."""
+        if self.admission is None:
+            return size <= self.max_cacheable_size
+        return self.admission.admit(cache_key, size)
 
-def get_proxy_service(request: Request) -> ProxyService:
+    async def _save_to_cache(
+        self,
+        request_components: RequestComponents,
+        cache_key: str,
+        data: DataToCache,
+        freshness: Freshness,
+    ) -> None:
+        ttl = freshness.ttl
+        stale_ttl = max(self.stale_while_revalidate, self.stale_if_error) if freshness.allow_stale else 0
+        if freshness.revalidate:
+            if not self.revalidate_window:
+                return
+            # never served as a hit, kept only as the revalidation candidate
+            ttl, stale_ttl = self.revalidate_window, 0
+        elif self.freshness.get_validators(data.headers):
+            # keep the entry past its TTL so it can be revalidated instead of refetched
+            stale_ttl = max(stale_ttl, self.revalidate_window)
+        if freshness.vary:
+            await self._cache.setval(cache_key, make_vary_marker(freshness.vary), ttl=ttl, stale_ttl=stale_ttl)
+            cache_key = CachingHelper.make_variant_key(cache_key, freshness.vary, request_components, self.hash_keys)
+
+        await self._cache.setval(cache_key, self._compress(data), ttl=ttl, stale_ttl=stale_ttl)
+
+    async def _save_negative(
+        self,
+        request_components: RequestComponents,
+        route: Route,
+        cache_key: str,
+        data: DataToCache,
+    ) -> None:
+        if self._negative_cache is None or self.negative_policy is None or route.freshness is None:
+            return
+        ttl = self.negative_policy.get_ttl(data.status_code, data.headers)
+        if ttl:
+            logger.debug("Caching %s for %s for %ss", data.status_code, cache_key, ttl)
+            await self._negative_cache.setval(cache_key, data, ttl=ttl)
+
+
+def create_proxy_service(state: State) -> ProxyService:
+    """Builds the app-wide service once the HTTP client exists, requests share it."""
     return ProxyService(
-        origin=request.app.state.origin,
-        ttl=request.app.state.ttl,
-        client=request.app.state.client,
-        cache=cache,
+        routes=state.routes,
+        freshness=state.freshness,
+        client=state.client,
+        cache=state.cache,
+        single_flight=state.single_flight,
+        stale_while_revalidate=state.stale_while_revalidate,
+        stale_if_error=state.stale_if_error,
+        revalidate_window=state.revalidate_window,
+        max_cacheable_size=state.max_cacheable_size,
+        hash_keys=state.hash_keys,
+        compression=state.compression,
+        compression_min_size=state.compression_min_size,
+        negative_cache=state.negative_cache,
+        negative_policy=state.negative_policy,
+        admission=state.admission,
     )
 
 
+def get_proxy_service(request: Request) -> ProxyService:
+    return request.app.state.proxy_service
+
+
 ProxyServiceDep = Annotated[ProxyService, Depends(get_proxy_service)]
@@ -0,0 +1,498 @@
+import asyncio
+import fnmatch
+import json
+import socket
+import struct
+import threading
+import time
+from typing import AsyncIterator
+from urllib.parse import urlparse
+
+from src.caching_proxy.cache import Cache, ScanIndex, key_matches
+from src.caching_proxy.eviction import make_eviction_policy
+from src.caching_proxy.invalidation import VARIANT_SEPARATOR, get_surrogate_keys
+from src.caching_proxy.logconfig import get_logger
+from src.caching_proxy.schemas import CacheStats, DataToCache, KeyInfo
+
+logger = get_logger("cache")
+
+# status_code, ttl, stale_ttl, expires_at, headers_len
+VALUE_HEADER = struct.Struct("<HIIdI")
+
+
+class RespError(Exception):
+    pass
+
+
+def encode_command(*args: bytes | str | int) -> bytes:
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        if isinstance(arg, int):
+            arg = str(arg)
+        if isinstance(arg, str):
+            arg = arg.encode()
+        parts.append(f"${len(arg)}\r\n".encode())
+        parts.append(arg)
+        parts.append(b"\r\n")
+    return b"".join(parts)
+
+
+class RespClient:
+    """
+    Minimal asyncio client for servers speaking the Redis protocol (RESP2).
+    Connections are pooled, so concurrent requests do not queue behind each other's round trips.
+    """
+
+    def __init__(self, url: str, timeout: float = 1.0, max_connections: int = 16):
+        parsed = urlparse(url)
+        self._host = parsed.hostname or "localhost"
+        self._port = parsed.port or 6379
+        self._db = int(parsed.path.lstrip("/") or 0)
+        self._password = parsed.password
+        self._timeout = timeout
+        self._idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def execute(self, *args: bytes | str | int):
+        return (await self.pipeline([args]))[0]
+
+    async def pipeline(self, commands: list[tuple]) -> list:
+        if not commands:
+            return []
+        try:
+            # every slot may be held by a stalled command, queueing behind them would outlast the timeout
+            async with asyncio.timeout(self._timeout):
+                await self._slots.acquire()
+        except TimeoutError:
+            raise RespError(f"No free connection to {self._host}:{self._port} within {self._timeout}s") from None
+        connection = None
+        try:
+            async with asyncio.timeout(self._timeout):
+                connection = self._idle.pop() if self._idle else await self._connect()
+                reader, writer = connection
+                writer.write(b"".join(encode_command(*command) for command in commands))
+                await writer.drain()
+                replies = [await self._read_reply(reader) for _ in commands]
+        except BaseException:
+            # a half-read reply would desynchronize the next command, so the connection is dropped
+            if connection is not None:
+                connection[1].close()
+            raise
+        else:
+            self._idle.append(connection)
+            return replies
+        finally:
+            self._slots.release()
+
+    async def close(self) -> None:
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    async def _connect(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self._host, self._port)
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        handshake = []
+        if self._password:
+            handshake.append(("AUTH", self._password))
+        if self._db:
+            handshake.append(("SELECT", self._db))
+        try:
+            for command in handshake:
+                writer.write(encode_command(*command))
+                await self._read_reply(reader)
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    async def _read_reply(self, reader: asyncio.StreamReader):
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            raise RespError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply(reader) for _ in range(length)]
+        raise RespError(f"Unexpected reply: {line!r}")
+
+
+class RedisCache(Cache):
+    """
+    Cache shared by every worker and node that points at the same Redis-compatible server.
+    Commands run on the event loop and give up after the client timeout, so a slow server costs a miss, not a stall.
+    Server errors are logged and treated as cache misses.
+    """
+
+    def __init__(self, url: str, namespace: str = "caching-proxy:", timeout: float = 1.0):
+        self._client = RespClient(url, timeout)
+        self._url = url
+        self._namespace = namespace
+        # tag sets live outside the namespace, so scanning the entries never returns them
+        self._tag_namespace = f"{namespace.rstrip(':')}-tag:"
+
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._errors = 0
+
+    async def getval(self, key) -> None | DataToCache:
+        decoded = await self._get(key)
+        if decoded is None:
+            self._misses += 1
+            return None
+
+        expires_at, value = decoded
+        if expires_at and expires_at < time.time():
+            self._misses += 1
+            return None
+
+        self._hits += 1
+        return value
+
+    async def getstale(self, key, max_stale: int) -> None | DataToCache:
+        decoded = await self._get(key)
+        if decoded is None:
+            return None
+
+        expires_at, value = decoded
+        if expires_at and expires_at + max_stale < time.time():
+            return None
+
+        return value
+
+    def record_stale_hit(self, key: str) -> bool:
+        self._stale_hits += 1
+        return True
+
+    async def setval(self, key: str, value: DataToCache, ttl: int = 0, stale_ttl: int = 0) -> None:
+        expires_at = time.time() + ttl if ttl else 0.0
+        headers = json.dumps(value.headers, separators=(",", ":")).encode()
+        payload = b"".join(
+            [
+                VALUE_HEADER.pack(value.status_code, ttl, stale_ttl, expires_at, len(headers)),
+                headers,
+                value.body,
+            ]
+        )
+        command = ["SET", self._namespace + key, payload]
+        if ttl:
+            command.extend(["PX", (ttl + stale_ttl) * 1000])
+        commands = [tuple(command)]
+        # members outlive expired entries; purging deletes them together with the set, which is harmless
+        commands.extend(("SADD", self._tag_namespace + tag, key) for tag in get_surrogate_keys(value.headers))
+        await self._safe_execute(commands)
+
+    async def delval(self, key: str) -> None:
+        await self._safe_execute([("DEL", self._namespace + key)])
+
+    async def clear(self) -> None:
+        for namespace in (self._namespace, self._tag_namespace):
+            batches = [batch async for batch in self._scan(namespace)]
+            for batch in batches:
+                await self._safe_execute([("DEL", *batch)])
+
+    async def purge_key(self, key: str) -> int:
+        return await self._delete([key]) + await self.purge_prefix(key + VARIANT_SEPARATOR)
+
+    async def purge_prefix(self, prefix: str) -> int:
+        # Redis has no prefix index, the namespace is scanned and filtered here rather than with a MATCH glob
+        # that would need escaping
+        start = len(self._namespace)
+        keys = [key[start:].decode() async for batch in self._scan() for key in batch]
+        return await self._delete([key for key in keys if key.startswith(prefix)])
+
+    async def purge_tag(self, tag: str) -> int:
+        replies = await self._safe_execute([("SMEMBERS", self._tag_namespace + tag), ("DEL", self._tag_namespace + tag)])
+        if not replies or not replies[0]:
+            return 0
+        return await self._delete([key.decode() for key in replies[0]])
+
+    async def scan(
+        self,
+        cursor: str | None,
+        count: int,
+        prefix: str = "",
+        match: str | None = None,
+    ) -> tuple[list[KeyInfo], str | None]:
+        # Redis SCAN may return a key in more than one page, ProxyClient.iter_keys drops the repeats
+        reply = await self._safe_execute([("SCAN", cursor or "0", "MATCH", f"{self._namespace}*", "COUNT", count)])
+        if not reply:
+            return [], None
+        next_cursor, batch = reply[0]
+        batch = [key for key in batch if key_matches(key[len(self._namespace) :].decode(), prefix, match)]
+
+        page: list[KeyInfo] = []
+        # read only the fixed-size value header to learn the expiration time, hits are not tracked per key here
+        commands = [command for key in batch for command in (("GETRANGE", key, 0, VALUE_HEADER.size - 1), ("STRLEN", key))]
+        replies = await self._safe_execute(commands) if commands else []
+        for key, header, size in zip(batch, (replies or [])[::2], (replies or [])[1::2]):
+            if not header or len(header) < VALUE_HEADER.size:
+                continue
+            expires_at = VALUE_HEADER.unpack(header)[3]
+            page.append(KeyInfo(key=key[len(self._namespace) :].decode(), expires_at=expires_at or None, size=size, hits=0))
+
+        next_cursor = next_cursor.decode() if isinstance(next_cursor, bytes) else str(next_cursor)
+        return page, None if next_cursor == "0" else next_cursor
+
+    async def get_stats(self) -> CacheStats:
+        replies = await self._safe_execute([("DBSIZE",)])
+        return CacheStats(
+            policy=f"shared ({self._url})",
+            entries=replies[0] if replies else 0,
+            bytes=0,
+            max_entries=0,
+            max_bytes=0,
+            hits=self._hits,
+            stale_hits=self._stale_hits,
+            misses=self._misses,
+            evictions=0,
+            expirations=0,
+            rejections=0,
+            errors=self._errors,
+        )
+
+    async def close(self) -> None:
+        await self._client.close()
+
+    async def _get(self, key: str) -> tuple[float, DataToCache] | None:
+        replies = await self._safe_execute([("GET", self._namespace + key)])
+        if not replies or replies[0] is None:
+            return None
+
+        payload = replies[0]
+        status_code, _, _, expires_at, headers_len = VALUE_HEADER.unpack_from(payload)
+        body_start = VALUE_HEADER.size + headers_len
+        value = DataToCache(
+            status_code=status_code,
+            headers=json.loads(payload[VALUE_HEADER.size : body_start]),
+            body=memoryview(payload)[body_start:],
+        )
+        return expires_at, value
+
+    async def _delete(self, keys: list[str]) -> int:
+        if not keys:
+            return 0
+        replies = await self._safe_execute([("DEL", *(self._namespace + key for key in keys))])
+        return replies[0] if replies else 0
+
+    async def _scan(self, namespace: str | None = None) -> AsyncIterator[list[bytes]]:
+        cursor = b"0"
+        while True:
+            reply = await self._safe_execute([("SCAN", cursor, "MATCH", f"{namespace or self._namespace}*", "COUNT", 1000)])
+            if not reply:
+                return
+            cursor, batch = reply[0]
+            if batch:
+                yield batch
+            if cursor in (b"0", 0):
+                return
+
+    async def _safe_execute(self, commands: list[tuple]) -> list | None:
+        try:
+            return await self._client.pipeline(commands)
+        except (OSError, RespError, asyncio.IncompleteReadError) as exc:
+            self._errors += 1
+            logger.error("Shared cache error on %s! Type: %s. DETAIL: %s", self._url, exc.__class__.__name__, str(exc))
+            return None
+
+
+class LocalRespServer:
+    """
+    In-process stand-in for Redis that speaks enough of RESP for RedisCache.
+    It runs on its own thread so that every uvicorn worker on this host can share one cache.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, max_bytes: int = 0, policy: str = "lru"):
+        self._host = host
+        self._port = port
+        self._max_bytes = max_bytes
+        self._store: dict[bytes, tuple[bytes, float | None]] = {}
+        self._sets: dict[bytes, set[bytes]] = {}
+        self._policy = make_eviction_policy(policy)
+        # SCAN cursors are positions in this index, so keys written or removed between calls do not shift them
+        self._scan_index = ScanIndex()
+        self._size = 0
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"redis://{self._host}:{self._port}/0"
+
+    def start(self) -> str:
+        thread = threading.Thread(target=self._run, name="resp-server", daemon=True)
+        thread.start()
+        self._started.wait()
+        return self.url
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle, self._host, self._port))
+        self._port = server.sockets[0].getsockname()[1]
+        logger.info("Shared cache server listening on %s", self.url)
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                writer.write(self._dispatch(command))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> list[bytes] | None:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def _dispatch(self, command: list[bytes]) -> bytes:
+        name = command[0].upper().decode()
+        handler = getattr(self, f"_cmd_{name.lower()}", None)
+        if handler is None:
+            return f"-ERR unknown command '{name}'\r\n".encode()
+        try:
+            return handler(*command[1:])
+        except (TypeError, ValueError, IndexError):
+            return f"-ERR wrong arguments for '{name}'\r\n".encode()
+
+    def _lookup(self, key: bytes) -> bytes | None:
+        value = self._peek(key)
+        if value is not None:
+            self._policy.record_access(key.decode())
+        return value
+
+    def _peek(self, key: bytes) -> bytes | None:
+        """Reads a live value without counting it as an access, so listing keys leaves the eviction order alone."""
+        item = self._store.get(key)
+        if item is None:
+            return None
+        value, deadline = item
+        if deadline is not None and deadline <= time.monotonic():
+            self._remove(key)
+            return None
+        return value
+
+    def _remove(self, key: bytes) -> bool:
+        item = self._store.pop(key, None)
+        if item is None:
+            return False
+        self._size -= len(key) + len(item[0])
+        self._policy.record_remove(key.decode())
+        self._scan_index.discard(key.decode())
+        return True
+
+    @staticmethod
+    def _bulk(value: bytes | None) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def _cmd_ping(self, *args: bytes) -> bytes:
+        return b"+PONG\r\n"
+
+    def _cmd_select(self, db: bytes) -> bytes:
+        return b"+OK\r\n"
+
+    def _cmd_get(self, key: bytes) -> bytes:
+        return self._bulk(self._lookup(key))
+
+    def _cmd_getrange(self, key: bytes, start: bytes, end: bytes) -> bytes:
+        # RedisCache reads ranges and lengths only to list keys
+        value = self._peek(key)
+        if value is None:
+            return self._bulk(b"")
+        return self._bulk(value[int(start) : int(end) + 1])
+
+    def _cmd_set(self, key: bytes, value: bytes, *options: bytes) -> bytes:
+        deadline = None
+        if len(options) >= 2 and options[0].upper() in (b"PX", b"EX"):
+            seconds = int(options[1]) / (1000 if options[0].upper() == b"PX" else 1)
+            deadline = time.monotonic() + seconds
+
+        self._remove(key)
+        self._store[key] = (value, deadline)
+        self._size += len(key) + len(value)
+        self._policy.record_insert(key.decode())
+        self._scan_index.add(key.decode())
+        while self._max_bytes and self._size > self._max_bytes:
+            victim = self._policy.select_victim()
+            if victim is None:
+                break
+            item = self._store.pop(victim.encode(), None)
+            if item is not None:
+                self._size -= len(victim.encode()) + len(item[0])
+            self._scan_index.discard(victim)
+        return b"+OK\r\n"
+
+    def _cmd_strlen(self, key: bytes) -> bytes:
+        value = self._peek(key)
+        return b":%d\r\n" % (len(value) if value is not None else 0)
+
+    def _cmd_del(self, *keys: bytes) -> bytes:
+        removed = sum(self._remove(key) or self._sets.pop(key, None) is not None for key in keys)
+        return b":%d\r\n" % removed
+
+    def _cmd_sadd(self, key: bytes, *members: bytes) -> bytes:
+        members_set = self._sets.setdefault(key, set())
+        added = len(set(members) - members_set)
+        members_set.update(members)
+        return b":%d\r\n" % added
+
+    def _cmd_smembers(self, key: bytes) -> bytes:
+        members = self._sets.get(key, set())
+        return b"".join([b"*%d\r\n" % len(members), *(self._bulk(member) for member in members)])
+
+    def _cmd_dbsize(self) -> bytes:
+        return b":%d\r\n" % len(self._store)
+
+    def _cmd_flushdb(self, *args: bytes) -> bytes:
+        self._store.clear()
+        self._sets.clear()
+        self._policy.clear()
+        self._scan_index.clear()
+        self._size = 0
+        return b"+OK\r\n"
+
+    def _cmd_scan(self, cursor: bytes, *options: bytes) -> bytes:
+        pattern, count = b"*", 10
+        for name, value in zip(options[::2], options[1::2]):
+            if name.upper() == b"MATCH":
+                pattern = value
+            elif name.upper() == b"COUNT":
+                count = int(value)
+
+        positions, next_cursor = self._scan_index.page(int(cursor), count)
+        keys = [key for _, key in positions if fnmatch.fnmatchcase(key, pattern.decode())]
+        matched = [key.encode() for key in keys if self._peek(key.encode()) is not None]
+        reply = [b"*2\r\n", self._bulk(str(next_cursor or 0).encode()), b"*%d\r\n" % len(matched)]
+        reply.extend(self._bulk(key) for key in matched)
+        return b"".join(reply)
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import os
+import struct
+import time
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from src.caching_proxy.cache import InMemoryCache
+from src.caching_proxy.logconfig import get_logger
+from src.caching_proxy.schemas import CachedBucket, DataToCache
+
+logger = get_logger("cache")
+
+SNAPSHOT_MAGIC = b"CPXSNAP1"
+# status_code, ttl, stale_ttl, expires_at (0 = never), key_len, headers_len, body_len
+SNAPSHOT_RECORD = struct.Struct("<HIIdIIQ")
+RESTORE_BATCH_SIZE = 500
+
+
+def dump_snapshot(cache: InMemoryCache, path: Path) -> int:
+    """
+    Writes every retained entry to `path` and returns the number of entries written.
+    The file is written next to the target and renamed over it, so a crash never leaves a torn snapshot.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    now = time.time()
+    written = 0
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        for key, bucket in cache.items():
+            if not cache.is_retained(bucket, now):
+                continue
+            key_bytes = key.encode()
+            headers = json.dumps(bucket.value.headers, separators=(",", ":")).encode()
+            f.write(
+                SNAPSHOT_RECORD.pack(
+                    bucket.value.status_code,
+                    bucket.ttl,
+                    bucket.stale_ttl,
+                    bucket.expires_at or 0.0,
+                    len(key_bytes),
+                    len(headers),
+                    len(bucket.value.body),
+                )
+            )
+            f.write(key_bytes)
+            f.write(headers)
+            f.write(bucket.value.body)
+            written += 1
+    os.replace(tmp_path, path)
+    return written
+
+
+def _read_exact(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise EOFError("Truncated snapshot record")
+    return data
+
+
+def iter_snapshot(f: BinaryIO) -> Iterator[tuple[str, CachedBucket]]:
+    if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        raise ValueError("Not a cache snapshot")
+
+    while header := f.read(SNAPSHOT_RECORD.size):
+        if len(header) != SNAPSHOT_RECORD.size:
+            raise EOFError("Truncated snapshot record")
+        status_code, ttl, stale_ttl, expires_at, key_len, headers_len, body_len = SNAPSHOT_RECORD.unpack(header)
+        key = _read_exact(f, key_len).decode()
+        headers = json.loads(_read_exact(f, headers_len))
+        body = _read_exact(f, body_len)
+        yield (
+            key,
+            CachedBucket(
+                ttl=ttl,
+                expires_at=expires_at or None,
+                stale_ttl=stale_ttl,
+                value=DataToCache(status_code=status_code, headers=headers, body=body),
+            ),
+        )
+
+
+async def restore_snapshot(cache: InMemoryCache, path: Path) -> int:
+    """
+    Streams the snapshot into the cache in small batches, yielding to the event loop between them
+    so the server accepts requests while it is warming up. Entries cached in the meantime win,
+    and a purge or clear in the meantime ends the restore, since the rest of the snapshot predates it.
+    """
+    if not path.exists():
+        return 0
+
+    restored = 0
+    generation = cache.purge_generation
+    try:
+        with open(path, "rb") as f:
+            for i, (key, bucket) in enumerate(iter_snapshot(f), start=1):
+                if cache.is_retained(bucket, time.time()) and cache.restore(key, bucket):
+                    restored += 1
+                if i % RESTORE_BATCH_SIZE == 0:
+                    await asyncio.sleep(0)
+                    if cache.purge_generation != generation:
+                        logger.info("Cache was purged while restoring snapshot %s, stopped after %s entries", path, restored)
+                        return restored
+    except (OSError, ValueError, EOFError) as exc:
+        logger.warning("Cache snapshot %s is unreadable, restored %s entries. DETAIL: %s", path, restored, str(exc))
+        return restored
+
+    logger.info("Restored %s entries from cache snapshot %s", restored, path)
+    return restored
@@ -1,21 +1,49 @@
+import hashlib
 import json
+from functools import lru_cache
 from pathlib import Path
-from urllib.parse import urlencode, urljoin
-
-from fastapi import Request
+from typing import TYPE_CHECKING
+from urllib.parse import parse_qsl, urlencode, urljoin
 
 from src.caching_proxy.config import settings
-from src.caching_proxy.schemas import AppConfig, AppStatus, RequestComponents
+from src.caching_proxy.invalidation import VARIANT_SEPARATOR
+from src.caching_proxy.request import RequestComponents
+
+if TYPE_CHECKING:
+    from fastapi import Request
+    from starlette.types import Scope
+
+    from src.caching_proxy.schemas import AppStatus
+
+
+REQUEST_EXCLUDED_HEADERS = frozenset(header.encode() for header in settings.REQUEST_EXCLUDED_HEADERS)
+
+
+@lru_cache(maxsize=settings.CACHE_KEY_MEMO_SIZE)
+def _build_cache_key(method: str, path: str, query_string: str, hashed: bool, namespace: str = "") -> str:
+    key = f"{method} {namespace}{path}"
+    if query_string:
+        params = dict(parse_qsl(query_string, keep_blank_values=True))
+        key = f"{key}?{urlencode(sorted(params.items()))}"
+
+    if hashed:
+        return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    return key
 
 
 class CachingHelper:
     @staticmethod
-    def extract_request_components(request: Request) -> RequestComponents:
+    def extract_request_components(request: "Request") -> RequestComponents:
+        return CachingHelper.extract_scope_components(request.scope)
+
+    @staticmethod
+    def extract_scope_components(scope: "Scope") -> RequestComponents:
         return RequestComponents(
-            headers=CachingHelper.clean_request_headers(dict(request.headers)),
-            params=dict(request.query_params),
-            path=request.url.path.lstrip("/"),
-            method=request.method,
+            method=scope["method"],
+            path=scope["path"].lstrip("/"),
+            query_string=scope["query_string"].decode("latin-1"),
+            raw_headers=scope["headers"],
+            excluded_headers=REQUEST_EXCLUDED_HEADERS,
         )
 
     @staticmethod
@@ -27,14 +55,36 @@ class CachingHelper:
         return {k: v for k, v in headers.items() if k.lower() not in settings.RESPONSE_EXCLUDED_HEADERS}
 
     @staticmethod
-    def make_cache_key(request_components: RequestComponents) -> str:
-        path_with_params = request_components.path
-
-        if request_components.params:
-            query_string = urlencode(sorted(request_components.params.items()))
-            path_with_params = f"{path_with_params}?{query_string}"
+    def make_cache_key(request_components: RequestComponents, hashed: bool = False, namespace: str = "") -> str:
+        """
+        Builds the key from the method, path and sorted query params, optionally as a fixed-length digest.
+        Keys are memoized by the raw request line, so repeated requests skip parsing and sorting.
+        """
+        return _build_cache_key(
+            request_components.method,
+            request_components.path,
+            request_components.query_string,
+            hashed,
+            namespace,
+        )
 
-        return f"{request_components.method} {path_with_params}"
+    @staticmethod
+    def make_variant_key(
+        cache_key: str,
+        vary: tuple[str, ...],
+        request_components: RequestComponents,
+        hashed: bool = False,
+    ) -> str:
+        """
+        Extends the key with the normalized values of the request headers named by the response's Vary.
+        The plain key stays a prefix of every variant key, also when hashed, so purging a key reaches its variants.
+        """
+        headers = request_components.headers
+        selected = "&".join(f"{name}={' '.join(headers.get(name, '').split())}" for name in vary)
+
+        if hashed:
+            selected = hashlib.blake2b(selected.encode(), digest_size=16).hexdigest()
+        return f"{cache_key}{VARIANT_SEPARATOR}{selected}"
 
     @staticmethod
     def make_absolute_url(base: str, path: str) -> str:
@@ -46,48 +96,46 @@ class CachingHelper:
 
 
 class ConfigHelper:
+    """Keeps the running servers in a JSON file as plain dicts, so the CLI reads it without loading pydantic."""
+
     def __init__(self, cfg_file: Path):
         self._cfg_file = cfg_file
 
-    def read_config(self) -> AppConfig:
+    def read_servers(self) -> list[dict]:
         if not self._cfg_file.exists():
-            return AppConfig(servers=[])
+            return []
 
         try:
             json_string = self._cfg_file.read_text()
             data = json.loads(json_string)
-            return AppConfig.model_validate(data)
+            return [server for server in data["servers"] if isinstance(server.get("port"), int)]
         except Exception:
-            return AppConfig(servers=[])
+            return []
 
-    def write_config(self, config: AppConfig):
-        data = config.model_dump()
-        json_string = json.dumps(data, indent=4)
+    def write_servers(self, servers: list[dict]):
+        json_string = json.dumps({"servers": servers}, indent=4)
         self._cfg_file.write_text(json_string)
 
-    def add_server_to_config(self, server: AppStatus):
-        config = self.read_config()
-        config.servers = [serv for serv in config.servers if serv.port != server.port]
-        config.servers.append(server)
-        self.write_config(config)
+    def add_server_to_config(self, server: "AppStatus"):
+        servers = [serv for serv in self.read_servers() if serv["port"] != server.port]
+        servers.append(server.model_dump())
+        self.write_servers(servers)
 
     def remove_server_from_config(self, port: int):
-        config = self.read_config()
-        config.servers = [serv for serv in config.servers if serv.port != port]
-        self.write_config(config)
-
-    def get_server_by_port(self, port: int):
-        config = self.read_config()
-        for server in config.servers:
-            if server.port == port:
+        servers = [serv for serv in self.read_servers() if serv["port"] != port]
+        self.write_servers(servers)
+
+    def get_server_by_port(self, port: int) -> dict | None:
+        for server in self.read_servers():
+            if server["port"] == port:
                 return server
         return None
 
-    def get_last_server(self):
-        config = self.read_config()
-        if not config.servers:
+    def get_last_server(self) -> dict | None:
+        servers = self.read_servers()
+        if not servers:
             return None
-        return config.servers[-1]
+        return servers[-1]
 
 
 cfg = ConfigHelper(cfg_file=settings.APP_CONFIG_FILE)
@@ -1,4 +1,81 @@
 import sys
 from pathlib import Path
 
+import httpx
+import pytest
+from starlette.responses import Response, StreamingResponse
+
 sys.path.append(str(Path(__file__).parent.parent))
+
+from src.caching_proxy.cache import InMemoryCache
+from src.caching_proxy.coalescing import SingleFlight
+from src.caching_proxy.config import settings
+from src.caching_proxy.freshness import FreshnessPolicy
+from src.caching_proxy.request import RequestComponents
+from src.caching_proxy.routing import create_route_table
+from src.caching_proxy.schemas import DataToCache
+from src.caching_proxy.service import ProxyService
+from src.caching_proxy.utils import REQUEST_EXCLUDED_HEADERS
+
+ORIGIN_URL = "http://origin.test"
+
+
+@pytest.fixture
+def make_request():
+    """Builds the components of a proxied request, as the middleware extracts them from the ASGI scope."""
+
+    def factory(path: str = "a", method: str = "GET", headers: dict[str, str] | None = None) -> RequestComponents:
+        path, _, query_string = path.partition("?")
+        raw_headers = [(b"host", b"proxy.test")]
+        raw_headers.extend((name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in (headers or {}).items())
+        return RequestComponents(
+            method=method,
+            path=path,
+            query_string=query_string,
+            raw_headers=raw_headers,
+            excluded_headers=REQUEST_EXCLUDED_HEADERS,
+        )
+
+    return factory
+
+
+@pytest.fixture
+def make_service():
+    """Builds a ProxyService whose origin is `handler`, an httpx.MockTransport handler that may be async."""
+
+    def factory(handler, cache=None, ttl: int = 60, **kwargs) -> ProxyService:
+        freshness = FreshnessPolicy(default_ttl=ttl, ignored_headers=frozenset(settings.REQUEST_EXCLUDED_HEADERS))
+        return ProxyService(
+            routes=create_route_table([ORIGIN_URL], freshness),
+            freshness=freshness,
+            client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+            cache=InMemoryCache() if cache is None else cache,
+            single_flight=SingleFlight(),
+            **kwargs,
+        )
+
+    return factory
+
+
+@pytest.fixture
+def make_value():
+    """Builds a cacheable 200 response, as the service stores it."""
+
+    def factory(body: bytes = b"body", headers: dict[str, str] | None = None) -> DataToCache:
+        return DataToCache(status_code=200, headers=headers or {"content-type": "text/plain"}, body=body)
+
+    return factory
+
+
+async def read_body(response: Response) -> bytes:
+    if isinstance(response, StreamingResponse):
+        chunks = [chunk async for chunk in response.body_iterator]
+        if response.background is not None:
+            await response.background()
+        return b"".join(chunks)
+    return bytes(response.body)
+
+
+@pytest.fixture
+def read():
+    return read_body
@@ -0,0 +1,63 @@
+import pytest
+
+from src.caching_proxy.admission import AdmissionFilter, BloomDoorkeeper, CountMinSketch, make_sketch
+
+
+def test_count_min_never_underestimates():
+    sketch = CountMinSketch(capacity=1024)
+    counts = {f"GET {i}": i % 7 + 1 for i in range(500)}
+    for key, count in counts.items():
+        for _ in range(count):
+            estimate = sketch.increment(key)
+        assert estimate >= count
+
+
+def test_count_min_halves_counters_after_the_sample():
+    sketch = CountMinSketch(capacity=1024)
+    for _ in range(20):
+        sketch.increment("GET hot")
+    # the sample is 10 increments per counter, then every counter is halved
+    for _ in range(10 * 1024 - 20):
+        sketch.increment("GET other")
+    assert sketch.increment("GET hot") == 11
+
+
+def test_count_min_saturates_at_255():
+    sketch = CountMinSketch(capacity=1024)
+    estimates = [sketch.increment("GET a") for _ in range(300)]
+    assert max(estimates) == 255
+
+
+def test_bloom_doorkeeper_tells_repeated_keys_and_forgets_after_capacity():
+    sketch = BloomDoorkeeper(capacity=100)
+    assert sketch.increment("GET a") == 1
+    assert sketch.increment("GET a") == 2
+    # keys already seen, or false positives, are not new insertions
+    i = 0
+    while sketch._insertions:
+        sketch.increment(f"GET {i}")
+        i += 1
+    assert i >= 99
+    assert sketch.increment("GET a") == 1
+
+
+def test_make_sketch():
+    assert isinstance(make_sketch("Bloom", 100), BloomDoorkeeper)
+    with pytest.raises(ValueError):
+        make_sketch("cuckoo", 100)
+
+
+def test_admission_rejects_large_rare_and_costly_objects():
+    admission = AdmissionFilter(CountMinSketch(capacity=1024), max_object_size=1000, min_hits=2, max_bytes_per_hit=300)
+
+    assert not admission.admit("GET huge", 2000)
+    assert not admission.admit("GET once", 10)
+    assert admission.admit("GET once", 10)
+    # requested twice so far, 800 bytes cost 400 per hit
+    admission.admit("GET big", 800)
+    assert not admission.admit("GET big", 800)
+    assert admission.admit("GET big", 800)
+
+    stats = admission.stats
+    assert (stats.sketch, stats.admitted) == ("count-min", 2)
+    assert stats.rejected == {"size": 1, "frequency": 2, "cost": 1}
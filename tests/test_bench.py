@@ -0,0 +1,41 @@
+import asyncio
+
+import uvicorn
+
+from src.caching_proxy.bench import StubOrigin, drive, get_free_port, percentile, run_bench
+from src.caching_proxy.cli import build_parser
+from src.caching_proxy.config import settings
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert (percentile(values, 0.5), percentile(values, 0.99), percentile(values, 1.0)) == (51.0, 100.0, 100.0)
+    assert percentile([], 0.5) == 0.0
+
+
+def test_bench_options_after_the_separator_go_to_the_proxy(capsys):
+    args = build_parser().parse_args(["bench", "-n", "10", "--hit-ratio", "1.5", "--", "--cache-backend", "tiered"])
+    assert (args.requests, args.proxy_args) == (10, ["--", "--cache-backend", "tiered"])
+
+    run_bench(args)
+    assert args.proxy_args == ["--cache-backend", "tiered"]
+    assert capsys.readouterr().out == "--hit-ratio must be between 0 and 1\n"
+
+
+def test_drive_warms_the_hot_keys_and_sends_the_requests():
+    async def main():
+        origin = StubOrigin(latency=0, body_size=64)
+        port = get_free_port()
+        server = uvicorn.Server(uvicorn.Config(origin, host=settings.HOST, port=port, lifespan="off", log_level="error"))
+        task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        try:
+            latencies, errors, hits, elapsed = await drive(f"http://{settings.HOST}:{port}", 20, 4, 0.5, 3)
+        finally:
+            server.should_exit = True
+            await task
+        return len(latencies), errors, hits, elapsed > 0, origin.requests
+
+    # the stub origin sends no X-Cache, so nothing counts as a hit
+    assert asyncio.run(main()) == (20, 0, 0, True, 23)
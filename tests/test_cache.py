@@ -0,0 +1,58 @@
+import asyncio
+
+from src.caching_proxy.cache import SCAN_INDEX_SLACK, InMemoryCache, ScanIndex, entry_size
+
+
+def scan_all(index: ScanIndex, budget: int) -> list[str]:
+    keys, cursor = [], 0
+    while cursor is not None:
+        page, cursor = index.page(cursor, budget)
+        keys.extend(key for _, key in page)
+    return keys
+
+
+def test_scan_index_lists_every_key_once():
+    index = ScanIndex()
+    for i in range(10):
+        index.add(f"k{i}")
+    index.discard("k3")
+
+    assert scan_all(index, 3) == [f"k{i}" for i in range(10) if i != 3]
+
+
+def test_scan_index_drops_dead_positions():
+    index = ScanIndex()
+    index.add("a")
+    for _ in range(3 * SCAN_INDEX_SLACK):
+        index.add("b")
+
+    assert len(index._seqs) <= 2 * 2 + SCAN_INDEX_SLACK + 1
+    assert scan_all(index, 100) == ["a", "b"]
+
+
+def test_byte_budget_evicts_least_recently_used(make_value):
+    async def main():
+        # room for three 100-byte bodies under 5-byte keys
+        cache = InMemoryCache(max_bytes=3 * entry_size("GET a", make_value(b"x" * 100)), policy="lru")
+        for key in ("GET a", "GET b", "GET c"):
+            await cache.setval(key, make_value(b"x" * 100))
+        await cache.getval("GET a")
+        await cache.setval("GET d", make_value(b"x" * 100))
+        return [key for key in ("GET a", "GET b", "GET c", "GET d") if await cache.getval(key)], await cache.get_stats()
+
+    keys, stats = asyncio.run(main())
+    assert keys == ["GET a", "GET c", "GET d"]
+    assert (stats.entries, stats.bytes, stats.evictions) == (3, stats.max_bytes, 1)
+
+
+def test_entry_larger_than_the_budget_is_rejected(make_value):
+    async def main():
+        cache = InMemoryCache(max_bytes=100)
+        await cache.setval("GET a", make_value(b"x" * 10))
+        # a rewrite too large for the cache drops the old value too
+        await cache.setval("GET a", make_value(b"x" * 200))
+        return await cache.getval("GET a"), await cache.get_stats()
+
+    value, stats = asyncio.run(main())
+    assert value is None
+    assert (stats.entries, stats.bytes, stats.rejections) == (0, 0, 1)
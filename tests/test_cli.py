@@ -0,0 +1,31 @@
+import socket
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BASE_DIR = Path(__file__).parent.parent
+# the server stack, which management commands must leave unloaded
+HEAVY_MODULES = ("fastapi", "starlette", "uvicorn", "httpx", "pydantic", "src.caching_proxy.server", "src.caching_proxy.service")
+
+
+def get_closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.parametrize(
+    "command",
+    [["health"], ["stats"], ["keys"], ["purge", "--key", "/a"], ["clear"], ["stop"]],
+    ids=lambda command: command[0],
+)
+def test_management_commands_do_not_load_the_server_stack(command):
+    argv = ["caching-proxy", command[0], "-p", str(get_closed_port()), *command[1:]]
+    code = (
+        f"import sys; from src.caching_proxy import cli; sys.argv = {argv!r}; cli.main(); "
+        f"print('loaded:', *(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=BASE_DIR, capture_output=True, text=True, check=True, timeout=30)
+    assert out.stdout.splitlines()[-1] == "loaded:"
@@ -0,0 +1,25 @@
+from contextlib import contextmanager
+
+from src.caching_proxy.client import ProxyClient
+
+
+class StreamedResponse:
+    status = 200
+
+    def __init__(self, lines: list[bytes]):
+        self._lines = lines
+
+    def __iter__(self):
+        return iter(self._lines)
+
+
+def test_iter_keys_drops_keys_repeated_by_the_scan(monkeypatch):
+    lines = [b'{"key": "GET a"}\n', b'{"key": "GET b"}\n', b"\n", b'{"key": "GET a"}\n']
+
+    @contextmanager
+    def open_keys(*args, **kwargs):
+        yield StreamedResponse(lines)
+
+    client = ProxyClient("127.0.0.1")
+    monkeypatch.setattr(client, "_open", open_keys)
+    assert [info["key"] for info in client.iter_keys(3000)] == ["GET a", "GET b"]
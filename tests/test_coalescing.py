@@ -0,0 +1,115 @@
+import asyncio
+
+import httpx
+
+from src.caching_proxy.coalescing import SingleFlight
+
+ETAG = '"v1"'
+
+
+def make_origin(delay: float = 0.05):
+    """An origin that answers If-None-Match itself and counts the requests it got."""
+    requests: list[httpx.Request] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        await asyncio.sleep(delay)
+        headers = {"etag": ETAG, "cache-control": "max-age=60"}
+        if request.headers.get("if-none-match") == ETAG:
+            return httpx.Response(304, headers=headers)
+        return httpx.Response(200, headers=headers, content=b"payload")
+
+    return handler, requests
+
+
+def test_single_flight_runs_one_call_per_key():
+    calls = 0
+
+    async def fetch() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("key", fetch) for _ in range(5)))
+        return results, flight.stats
+
+    results, stats = asyncio.run(main())
+    assert results == [1] * 5
+    assert (stats.leaders, stats.coalesced, stats.in_flight) == (1, 4, 0)
+
+
+def test_concurrent_misses_share_one_origin_fetch(make_service, make_request, read):
+    handler, requests = make_origin()
+
+    async def main():
+        service = make_service(handler)
+        route = service.routes.routes[0]
+        leader = asyncio.create_task(service.fetch_from_origin(make_request(), route, "GET a"))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(service.fetch_from_origin(make_request(), route, "GET a"))
+        leader_body = await read(await leader)
+        follower_response = await follower
+        return leader_body, follower_response.status_code, await read(follower_response)
+
+    assert asyncio.run(main()) == (b"payload", 200, b"payload")
+    assert len(requests) == 1
+
+
+def test_follower_stops_waiting_for_a_slow_leader(make_service, make_request, read):
+    handler, requests = make_origin(delay=0)
+
+    async def main():
+        service = make_service(handler, coalesce_timeout=0.05)
+        route = service.routes.routes[0]
+        # the leader's client has not read the body yet, so the flight stays open
+        leader = await service.fetch_from_origin(make_request(), route, "GET a")
+        follower = await service.fetch_from_origin(make_request(), route, "GET a")
+        return await read(follower), await read(leader)
+
+    assert asyncio.run(main()) == (b"payload", b"payload")
+    assert len(requests) == 2
+
+
+def test_follower_gets_full_response_behind_conditional_request(make_service, make_request, read):
+    handler, requests = make_origin()
+
+    async def main():
+        service = make_service(handler)
+        route = service.routes.routes[0]
+        conditional_request = make_request(headers={"If-None-Match": ETAG})
+        conditional = asyncio.create_task(service.fetch_from_origin(conditional_request, route, "GET a"))
+        await asyncio.sleep(0.01)
+        plain = asyncio.create_task(service.fetch_from_origin(make_request(), route, "GET a"))
+        conditional_response = await conditional
+        plain_response = await plain
+        return (
+            conditional_response.status_code,
+            plain_response.status_code,
+            await read(plain_response),
+            plain_response.headers["x-cache"],
+        )
+
+    assert asyncio.run(main()) == (304, 200, b"payload", "MISS")
+    # the conditional request can not lead, so the plain one fetched the body itself
+    assert len(requests) == 2
+    assert "if-none-match" not in requests[1].headers
+
+
+def test_conditional_follower_checks_its_own_preconditions(make_service, make_request, read):
+    handler, requests = make_origin()
+
+    async def main():
+        service = make_service(handler)
+        route = service.routes.routes[0]
+        plain = asyncio.create_task(service.fetch_from_origin(make_request(), route, "GET a"))
+        await asyncio.sleep(0.01)
+        conditional_request = make_request(headers={"If-None-Match": ETAG})
+        conditional = asyncio.create_task(service.fetch_from_origin(conditional_request, route, "GET a"))
+        await read(await plain)
+        return (await conditional).status_code
+
+    assert asyncio.run(main()) == 304
+    assert len(requests) == 1
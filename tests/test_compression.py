@@ -0,0 +1,67 @@
+import asyncio
+import gzip
+
+import httpx
+import pytest
+
+from src.caching_proxy.compression import accepts_encoding, get_codec, is_compressible
+
+BODY = b'{"items": [' + b", ".join(b'"item"' for _ in range(200)) + b"]}"
+
+
+@pytest.mark.parametrize(
+    ("accept_encoding", "accepted"),
+    [
+        ("gzip, br", True),
+        ("br;q=1.0, gzip;q=0.5", True),
+        ("gzip;q=0", False),
+        ("*", True),
+        ("*, gzip;q=0", False),
+        ("br", False),
+        ("", False),
+    ],
+)
+def test_accepts_encoding(accept_encoding, accepted):
+    assert accepts_encoding(accept_encoding, "gzip") is accepted
+
+
+def test_is_compressible():
+    types = ["text/", "application/json", "+json"]
+    assert is_compressible("text/html; charset=utf-8", types)
+    assert is_compressible("application/problem+json", types)
+    assert not is_compressible("image/png", types)
+
+
+def test_get_codec():
+    codec = get_codec("gzip")
+    assert codec.decompress(codec.compress(BODY)) == BODY
+    assert get_codec("none") is None
+    with pytest.raises(ValueError):
+        get_codec("lzma")
+
+
+def test_entry_is_stored_compressed_and_decoded_per_client(make_service, make_request, read):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={"content-type": "application/json", "cache-control": "max-age=60"}, content=BODY)
+
+    async def main():
+        service = make_service(handler, compression=get_codec("gzip"), compression_min_size=64)
+        route = service.routes.routes[0]
+        await read(await service.fetch_from_origin(make_request(), route, "GET a"))
+        cached = await service.get_cached_entry(make_request(), "GET a")
+
+        gzip_client = make_request(headers={"Accept-Encoding": "gzip"})
+        precompressed = service.respond_from_cache(gzip_client, cached, "HIT")
+        identity = service.respond_from_cache(make_request(), cached, "HIT")
+        return cached, precompressed, await read(precompressed), identity, await read(identity)
+
+    cached, precompressed, precompressed_body, identity, identity_body = asyncio.run(main())
+    assert cached.headers["content-encoding"] == "gzip"
+    assert len(cached.body) < len(BODY)
+
+    assert precompressed.headers["content-encoding"] == "gzip"
+    assert precompressed.headers["vary"] == "Accept-Encoding"
+    assert gzip.decompress(precompressed_body) == BODY
+
+    assert "content-encoding" not in identity.headers
+    assert identity_body == BODY
@@ -0,0 +1,71 @@
+import asyncio
+
+from src.caching_proxy.cache import InMemoryCache
+from src.caching_proxy.disk import RECORD_HEADER, DiskCache, TieredCache
+
+
+def test_entries_survive_a_restart(tmp_path, make_value):
+    async def main():
+        cache = DiskCache(tmp_path, max_bytes=4096, segment_size=1024)
+        await cache.setval("GET a", make_value(b"first"), ttl=60)
+        await cache.setval("GET a", make_value(b"second"), ttl=60)
+        await cache.setval("GET b", make_value(headers={"surrogate-key": "t1"}))
+        await cache.setval("GET c", make_value())
+        await cache.delval("GET c")
+        await cache.close()
+
+        reopened = DiskCache(tmp_path, max_bytes=4096, segment_size=1024)
+        value = await reopened.getval("GET a")
+        return value, await reopened.getval("GET c"), await reopened.purge_tag("t1")
+
+    value, deleted, purged = asyncio.run(main())
+    assert (value.status_code, value.headers, bytes(value.body)) == (200, {"content-type": "text/plain"}, b"second")
+    assert deleted is None
+    assert purged == 1
+
+
+def test_torn_record_ends_the_segment_on_load(tmp_path, make_value):
+    async def main():
+        cache = DiskCache(tmp_path, max_bytes=4096, segment_size=1024)
+        await cache.setval("GET a", make_value())
+        await cache.setval("GET b", make_value())
+        # a crash before the second record's header was written
+        entry = cache._index["GET b"]
+        start = entry.body_offset + entry.body_len - entry.record_len
+        cache._segments[entry.segment_id].data[start : start + RECORD_HEADER.size] = bytes(RECORD_HEADER.size)
+        await cache.close()
+
+        reopened = DiskCache(tmp_path, max_bytes=4096, segment_size=1024)
+        return await reopened.getval("GET a"), await reopened.getval("GET b")
+
+    kept, torn = asyncio.run(main())
+    assert bytes(kept.body) == b"body"
+    assert torn is None
+
+
+def test_oldest_segment_is_dropped_over_the_budget(tmp_path, make_value):
+    async def main():
+        cache = DiskCache(tmp_path, max_bytes=2048, segment_size=1024)
+        for i in range(8):
+            await cache.setval(f"GET {i}", make_value(b"x" * 400))
+        await cache.setval("GET huge", make_value(b"x" * 2048))
+        present = [i for i in range(8) if await cache.getval(f"GET {i}") is not None]
+        return present, await cache.get_stats(), len(list(tmp_path.glob("segment-*.dat")))
+
+    present, stats, segment_files = asyncio.run(main())
+    # two 400-byte records fit a segment, the two newest segments are kept
+    assert present == [4, 5, 6, 7]
+    assert (stats.entries, stats.evictions, stats.rejections) == (4, 4, 1)
+    assert segment_files == 2
+
+
+def test_tiered_cache_promotes_disk_hits(tmp_path, make_value):
+    async def main():
+        cache = TieredCache(InMemoryCache(max_entries=1), DiskCache(tmp_path, max_bytes=4096, segment_size=1024))
+        await cache.setval("GET a", make_value(b"a"), ttl=60)
+        await cache.setval("GET b", make_value(b"b"), ttl=60)
+        assert await cache._hot.getval("GET a") is None
+        value = await cache.getval("GET a")
+        return bytes(value.body), await cache._hot.getval("GET a") is not None
+
+    assert asyncio.run(main()) == (b"a", True)
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from src.caching_proxy.cache import InMemoryCache
+from src.caching_proxy.eviction import LFUPolicy, LRUPolicy, S3FIFOPolicy, make_eviction_policy
+from src.caching_proxy.schemas import DataToCache
+
+
+def drain(policy) -> list[str]:
+    victims = []
+    while (key := policy.select_victim()) is not None:
+        victims.append(key)
+    return victims
+
+
+def test_lru_evicts_least_recently_used():
+    policy = LRUPolicy()
+    for key in ("a", "b", "c"):
+        policy.record_insert(key)
+    policy.record_access("a")
+    policy.record_remove("b")
+    assert drain(policy) == ["c", "a"]
+
+
+def test_lfu_evicts_least_frequently_used_then_oldest():
+    policy = LFUPolicy()
+    for key in ("a", "b", "c", "d"):
+        policy.record_insert(key)
+    policy.record_access("a")
+    policy.record_access("a")
+    policy.record_access("c")
+    assert drain(policy) == ["b", "d", "c", "a"]
+
+
+def test_lfu_minimum_skips_removed_buckets():
+    policy = LFUPolicy()
+    for key in ("a", "b", "c"):
+        policy.record_insert(key)
+    for _ in range(3):
+        policy.record_access("b")
+    for _ in range(5):
+        policy.record_access("c")
+    # removing the only key at the lowest frequency moves the minimum up past the missing frequencies
+    policy.record_remove("a")
+    assert policy.select_victim() == "b"
+
+    policy.record_insert("d")
+    policy.record_access("d")
+    policy.record_remove("c")
+    assert drain(policy) == ["d"]
+    assert policy._min_freq is None and not policy._lower and not policy._higher
+
+
+def test_s3fifo_promotes_reused_keys_and_evicts_one_hit_wonders():
+    policy = S3FIFOPolicy()
+    policy.record_insert("hot")
+    policy.record_access("hot")
+    policy.record_access("hot")
+    for i in range(5):
+        policy.record_insert(f"scan-{i}")
+
+    victims = [policy.select_victim() for _ in range(5)]
+    assert victims == [f"scan-{i}" for i in range(5)]
+    assert policy.select_victim() == "hot"
+    assert policy.select_victim() is None
+
+
+def test_s3fifo_ghost_hit_goes_to_main():
+    policy = S3FIFOPolicy()
+    policy.record_insert("a")
+    policy.record_insert("b")
+    assert policy.select_victim() == "a"
+    policy.record_insert("a")
+    assert "a" in policy._main
+
+
+def test_make_eviction_policy_rejects_unknown_names():
+    assert isinstance(make_eviction_policy("lfu"), LFUPolicy)
+    with pytest.raises(ValueError):
+        make_eviction_policy("mru")
+
+
+@pytest.mark.parametrize("policy", ["lru", "lfu", "s3fifo"])
+def test_cache_stays_within_max_entries(policy):
+    async def main():
+        cache = InMemoryCache(max_entries=3, policy=policy)
+        for i in range(10):
+            await cache.setval(f"GET {i}", DataToCache(status_code=200, headers={}, body=b"x"), ttl=60)
+            await cache.getval("GET 0")
+        return await cache.get_stats()
+
+    stats = asyncio.run(main())
+    assert (stats.entries, stats.evictions) == (3, 7)
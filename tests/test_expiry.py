@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+from src.caching_proxy.cache import InMemoryCache
+from src.caching_proxy.expiry import ExpiryQueue, run_active_expiry
+from src.caching_proxy.schemas import CachedBucket, DataToCache
+
+
+def store(cache: InMemoryCache, key: str, expires_at: float, stale_ttl: int = 0) -> None:
+    value = DataToCache(status_code=200, headers={}, body=b"body")
+    cache.setbucket(key, CachedBucket(ttl=10, expires_at=expires_at, stale_ttl=stale_ttl, value=value))
+
+
+def test_expiry_queue_pops_due_items_in_deadline_order():
+    queue = ExpiryQueue()
+    for key, deadline in (("c", 30.0), ("a", 10.0), ("never", None), ("b", 20.0)):
+        queue.schedule(key, deadline)
+
+    assert queue.next_deadline == 10.0
+    assert list(queue.pop_due(25.0)) == [(10.0, "a"), (20.0, "b")]
+    assert (len(queue), queue.next_deadline) == (1, 30.0)
+
+
+def test_expire_removes_only_entries_past_retention():
+    cache = InMemoryCache()
+    now = time.time()
+    store(cache, "GET expired", now - 5)
+    store(cache, "GET stale", now - 5, stale_ttl=60)
+    store(cache, "GET fresh", now + 60)
+    # rewritten with a later deadline, its first heap item is outdated
+    store(cache, "GET rewritten", now - 5)
+    store(cache, "GET rewritten", now + 60)
+
+    assert cache.expire(time_budget=1.0) == 1
+    assert sorted(cache._store) == ["GET fresh", "GET rewritten", "GET stale"]
+    assert cache.next_expiration == now + 55
+
+
+def test_expire_stops_when_the_time_budget_is_spent():
+    cache = InMemoryCache()
+    for i in range(3):
+        store(cache, f"GET {i}", time.time() - 5)
+
+    assert [cache.expire(time_budget=0) for _ in range(4)] == [1, 1, 1, 0]
+    assert asyncio.run(cache.get_stats()).expirations == 3
+
+
+def test_active_expiry_wakes_up_at_the_next_deadline():
+    async def main():
+        cache = InMemoryCache()
+        store(cache, "GET a", time.time() + 0.05)
+        task = asyncio.create_task(run_active_expiry(cache, interval=10, time_budget=0.01))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        return dict(cache._store)
+
+    assert asyncio.run(main()) == {}
@@ -0,0 +1,143 @@
+import asyncio
+from email.utils import formatdate
+
+import httpx
+import pytest
+
+from src.caching_proxy.freshness import FreshnessPolicy, parse_cache_control
+
+ETAG = '"v1"'
+NOW = 1_700_000_000.0
+
+
+def test_parse_cache_control():
+    assert parse_cache_control('public, Max-Age=60, no-cache="set-cookie"') == {
+        "public": None,
+        "max-age": "60",
+        "no-cache": "set-cookie",
+    }
+    assert parse_cache_control(None) == {}
+
+
+@pytest.mark.parametrize(
+    ("headers", "ttl"),
+    [
+        ({}, 30),
+        ({"cache-control": "max-age=60"}, 60),
+        ({"cache-control": "max-age=60, s-maxage=120"}, 120),
+        ({"cache-control": "max-age=60", "age": "15"}, 45),
+        ({"expires": formatdate(NOW + 90, usegmt=True), "date": formatdate(NOW, usegmt=True)}, 90),
+        ({"cache-control": "max-age=7200"}, 3600),
+    ],
+)
+def test_lifetime(make_request, headers, ttl):
+    policy = FreshnessPolicy(default_ttl=30, max_ttl=3600)
+    freshness = policy.evaluate(make_request(), headers, now=NOW)
+    assert (freshness.ttl, freshness.revalidate) == (ttl, False)
+
+
+@pytest.mark.parametrize(
+    ("request_headers", "response_headers"),
+    [
+        ({}, {"cache-control": "no-store"}),
+        ({}, {"cache-control": "private, max-age=60"}),
+        ({}, {"cache-control": "max-age=60", "age": "60"}),
+        ({}, {"expires": "not a date"}),
+        ({}, {"vary": "*"}),
+        ({}, {"cache-control": "no-cache"}),
+        ({"cache-control": "no-store"}, {}),
+        ({"authorization": "Bearer t"}, {"cache-control": "max-age=60"}),
+    ],
+)
+def test_not_stored(make_request, request_headers, response_headers):
+    policy = FreshnessPolicy(default_ttl=30)
+    assert policy.evaluate(make_request(headers=request_headers), response_headers, now=NOW) is None
+
+
+def test_shared_authorized_response_is_stored(make_request):
+    policy = FreshnessPolicy(default_ttl=30)
+    request = make_request(headers={"authorization": "Bearer t"})
+    assert policy.evaluate(request, {"cache-control": "s-maxage=60"}, now=NOW).ttl == 60
+
+
+def test_no_cache_with_validator_has_zero_freshness(make_request):
+    policy = FreshnessPolicy(default_ttl=30)
+    freshness = policy.evaluate(make_request(), {"cache-control": "no-cache", "etag": ETAG}, now=NOW)
+    assert (freshness.ttl, freshness.allow_stale, freshness.revalidate) == (0, False, True)
+    assert policy.requires_revalidation({"cache-control": "no-cache"})
+    assert not policy.requires_revalidation({"cache-control": "max-age=60"})
+
+
+def test_vary_ignores_headers_never_sent_to_the_origin(make_request):
+    policy = FreshnessPolicy(default_ttl=30, ignored_headers=frozenset({"accept-encoding"}))
+    freshness = policy.evaluate(make_request(), {"vary": "Accept-Language, accept-encoding, X-Tenant"}, now=NOW)
+    assert freshness.vary == ("accept-language", "x-tenant")
+
+
+def test_max_ttl_caps_every_lifetime(make_request):
+    # without a default TTL entries never expire, unless max_ttl bounds them
+    assert FreshnessPolicy(default_ttl=0).evaluate(make_request(), {}, now=NOW).ttl == 0
+    policy = FreshnessPolicy(default_ttl=0, max_ttl=120)
+    assert policy.evaluate(make_request(), {}, now=NOW).ttl == 120
+    assert policy.derive(max_ttl=30).evaluate(make_request(), {"cache-control": "max-age=60"}, now=NOW).ttl == 30
+
+
+def test_validators_and_stale_permission():
+    headers = {"etag": ETAG, "last-modified": "Wed, 21 Oct 2015 07:28:00 GMT"}
+    assert FreshnessPolicy.get_validators(headers) == {
+        "if-none-match": ETAG,
+        "if-modified-since": "Wed, 21 Oct 2015 07:28:00 GMT",
+    }
+    assert FreshnessPolicy.allows_stale({"cache-control": "max-age=60"})
+    assert not FreshnessPolicy.allows_stale({"cache-control": "max-age=60, proxy-revalidate"})
+
+
+def test_no_cache_response_is_revalidated_before_reuse(make_service, make_request, read):
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        headers = {"etag": ETAG, "cache-control": "no-cache"}
+        if request.headers.get("if-none-match") == ETAG:
+            return httpx.Response(304, headers=headers)
+        return httpx.Response(200, headers=headers, content=b"payload")
+
+    async def main():
+        service = make_service(handler, revalidate_window=60)
+        route = service.routes.routes[0]
+        first = await service.fetch_from_origin(make_request(), route, "GET a")
+        await read(first)
+        # lets the finished flight leave the single-flight table
+        await asyncio.sleep(0)
+        assert await service.get_cached_entry(make_request(), "GET a") is None
+        second = await service.fetch_from_origin(make_request(), route, "GET a")
+        return first.headers["x-cache"], second.headers["x-cache"], await read(second)
+
+    assert asyncio.run(main()) == ("MISS", "REVALIDATED", b"payload")
+    assert len(requests) == 2
+    assert requests[1].headers["if-none-match"] == ETAG
+
+
+def test_variants_are_stored_per_selecting_header(make_service, make_request, read):
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        language = request.headers.get("accept-language", "en")
+        return httpx.Response(200, headers={"vary": "Accept-Language", "cache-control": "max-age=60"}, content=language.encode())
+
+    async def main():
+        service = make_service(handler)
+        route = service.routes.routes[0]
+        for language in ("en", "de"):
+            request = make_request(headers={"Accept-Language": language})
+            await read(await service.fetch_from_origin(request, route, "GET a"))
+
+        cached = [
+            await service.get_cached_entry(make_request(headers={"Accept-Language": language}), "GET a")
+            for language in ("en", "de", "fr")
+        ]
+        return [None if entry is None else bytes(entry.body) for entry in cached]
+
+    assert asyncio.run(main()) == [b"en", b"de", None]
+    assert len(requests) == 2
@@ -0,0 +1,83 @@
+import asyncio
+
+from src.caching_proxy.cache import InMemoryCache
+from src.caching_proxy.invalidation import PurgeIndex, get_surrogate_keys, iter_prefix_boundaries
+
+
+def test_get_surrogate_keys():
+    headers = {"surrogate-key": "product-1  catalog", "cache-tag": "catalog, sale,"}
+    assert get_surrogate_keys(headers) == {"product-1", "catalog", "sale"}
+    assert get_surrogate_keys({}) == frozenset()
+
+
+def test_iter_prefix_boundaries():
+    assert list(iter_prefix_boundaries("GET a/b?q=1/2")) == ["GET ", "GET a/", "GET a/b?"]
+    assert list(iter_prefix_boundaries("GET a|x-lang=en")) == ["GET ", "GET a|"]
+    assert list(iter_prefix_boundaries("GET b?q=1|x-lang=en")) == ["GET ", "GET b?", "GET b?q=1|"]
+
+
+def test_purge_index_by_prefix():
+    index = PurgeIndex()
+    for key in ("GET a/1", "GET a/2", "GET ab/1", "GET b?q=1", "GET b?q=1|x-lang=en"):
+        index.add(key, frozenset())
+
+    assert sorted(index.by_prefix("GET a/")) == ["GET a/1", "GET a/2"]
+    # a prefix ending mid-segment is served from its last boundary and filtered
+    assert sorted(index.by_prefix("GET a")) == ["GET a/1", "GET a/2", "GET ab/1"]
+    assert index.by_prefix("GET b?q=1|") == ["GET b?q=1|x-lang=en"]
+    assert sorted(index.by_prefix("GET b?q")) == ["GET b?q=1", "GET b?q=1|x-lang=en"]
+    assert len(index.by_prefix("GE")) == 5
+
+    index.discard("GET a/1")
+    assert index.by_prefix("GET a/") == ["GET a/2"]
+
+
+def test_purge_index_by_tag():
+    index = PurgeIndex()
+    index.add("GET a", frozenset({"t1", "t2"}))
+    index.add("GET b", frozenset({"t2"}))
+    assert sorted(index.by_tag("t2")) == ["GET a", "GET b"]
+
+    index.add("GET a", frozenset({"t3"}))
+    assert index.by_tag("t2") == ["GET b"]
+    assert index.by_tag("t1") == []
+
+
+def test_purge_key_removes_variants(make_value):
+    async def main():
+        cache = InMemoryCache()
+        for key in ("GET a", "GET a|x-lang=en", "GET a|x-lang=de", "GET ab"):
+            await cache.setval(key, make_value())
+
+        assert await cache.purge_key("GET a") == 3
+        assert await cache.getval("GET ab") is not None
+
+    asyncio.run(main())
+
+
+def test_purge_key_removes_variants_of_url_with_query(make_value):
+    async def main():
+        cache = InMemoryCache()
+        for key in ("GET b?q=1", "GET b?q=1|x-lang=en", "GET b?q=12|x-lang=en"):
+            await cache.setval(key, make_value())
+
+        assert await cache.purge_key("GET b?q=1") == 2
+        assert await cache.getval("GET b?q=1|x-lang=en") is None
+        assert await cache.getval("GET b?q=12|x-lang=en") is not None
+
+    asyncio.run(main())
+
+
+def test_purge_prefix_and_tag(make_value):
+    async def main():
+        cache = InMemoryCache()
+        await cache.setval("GET img/1", make_value(headers={"surrogate-key": "images"}))
+        await cache.setval("GET img/2", make_value(headers={"cache-tag": "images"}))
+        await cache.setval("GET css/1", make_value())
+
+        assert await cache.purge_tag("images") == 2
+        await cache.setval("GET img/3", make_value())
+        assert await cache.purge_prefix("GET img/") == 1
+        assert (await cache.get_stats()).entries == 1
+
+    asyncio.run(main())
@@ -0,0 +1,40 @@
+import logging
+import logging.config
+import logging.handlers
+
+from src.caching_proxy import logconfig
+
+
+def configure() -> logging.handlers.QueueListener:
+    logging.config.dictConfig(
+        {
+            "version": 1,
+            "disable_existing_loggers": False,
+            "handlers": {
+                "sink": {"class": "logging.NullHandler"},
+                logconfig.QUEUE_HANDLER_NAME: {"class": "logging.handlers.QueueHandler", "handlers": ["sink"]},
+            },
+        }
+    )
+    return logging.getHandlerByName(logconfig.QUEUE_HANDLER_NAME).listener
+
+
+def test_log_listener_is_started_once_and_replaced_after_reconfiguration(monkeypatch):
+    registered = []
+    monkeypatch.setattr(logconfig.atexit, "register", registered.append)
+    monkeypatch.setattr(logconfig, "_atexit_registered", False)
+    try:
+        first = configure()
+        logconfig.start_log_listener()
+        logconfig.start_log_listener()
+        assert logconfig._listener is first
+
+        second = configure()
+        logconfig.start_log_listener()
+        assert logconfig._listener is second
+        assert registered == [logconfig.stop_log_listener]
+    finally:
+        logconfig.stop_log_listener()
+        logging.config.dictConfig({"version": 1, "disable_existing_loggers": False})
+
+    assert logconfig._listener is None
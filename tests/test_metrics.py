@@ -0,0 +1,30 @@
+from src.caching_proxy.metrics import Histogram, Metric
+
+
+def test_label_values_are_escaped():
+    metric = Metric("proxy_origin_shed_total", "Requests refused", labelnames=("route", "reason"))
+    metric.inc(('/a\\b"c\nd', "queue"))
+    assert list(metric.render())[-1] == 'proxy_origin_shed_total{route="/a\\\\b\\"c\\nd",reason="queue"} 1'
+
+
+def test_values_are_rendered_exactly():
+    counter = Metric("proxy_requests_total", "Requests served")
+    counter.inc(amount=1_234_567)
+    gauge = Metric("proxy_cache_hit_ratio", "Share of hits", kind="gauge")
+    gauge.set(0.123456789)
+    assert list(counter.render())[-1] == "proxy_requests_total 1234567"
+    assert list(gauge.render())[-1] == "proxy_cache_hit_ratio 0.123456789"
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("proxy_request_duration_seconds", "Time to serve a request", labelnames=("cache",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, ("HIT",))
+    histogram.observe(0.5, ("HIT",))
+    histogram.observe(5.0, ("HIT",))
+    assert list(histogram.render())[2:] == [
+        'proxy_request_duration_seconds_bucket{cache="HIT",le="0.1"} 1',
+        'proxy_request_duration_seconds_bucket{cache="HIT",le="1.0"} 2',
+        'proxy_request_duration_seconds_bucket{cache="HIT",le="+Inf"} 3',
+        'proxy_request_duration_seconds_sum{cache="HIT"} 5.55',
+        'proxy_request_duration_seconds_count{cache="HIT"} 3',
+    ]
@@ -0,0 +1,86 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+
+from src.caching_proxy.cache import InMemoryCache
+from src.caching_proxy.middlewares import CacheHitMiddleware
+from src.caching_proxy.schemas import DataToCache
+
+
+def make_scope(service, path: str = "/a") -> dict:
+    return {
+        "type": "http",
+        "app": SimpleNamespace(state=SimpleNamespace(proxy_service=service)),
+        "method": "GET",
+        "path": path,
+        "query_string": b"",
+        "headers": [(b"host", b"proxy.test")],
+    }
+
+
+async def call(middleware: CacheHitMiddleware, scope: dict) -> list[dict]:
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    return messages
+
+
+def count_matches(service) -> list[int]:
+    calls = [0]
+    match = service.routes.match
+
+    def counting_match(request_components):
+        calls[0] += 1
+        return match(request_components)
+
+    service.routes.match = counting_match
+    return calls
+
+
+def test_miss_passes_route_and_key_in_scope_state(make_service):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        raise AssertionError("the middleware never contacts the origin")
+
+    service = make_service(handler)
+    calls = count_matches(service)
+    seen = []
+
+    async def app(scope, receive, send):
+        # the proxy route resolves again, the middleware's result is reused
+        seen.append(service.resolve(scope))
+
+    scope = make_scope(service)
+    asyncio.run(call(CacheHitMiddleware(app), scope))
+
+    assert len(seen) == 1
+    request_components, route, cache_key = seen[0]
+    assert (request_components.path, cache_key) == ("a", "GET a")
+    assert route is service.routes.routes[0]
+    assert scope["state"]["cache_key"] == "GET a"
+    assert calls[0] == 1
+
+
+def test_hit_is_sent_by_the_middleware(make_service):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        raise AssertionError("the middleware never contacts the origin")
+
+    async def app(scope, receive, send):
+        raise AssertionError("a fresh hit is not passed on")
+
+    async def main():
+        cache = InMemoryCache()
+        await cache.setval("GET a", DataToCache(status_code=200, headers={"etag": '"v1"'}, body=b"cached"), ttl=60)
+        service = make_service(handler, cache=cache)
+        return await call(CacheHitMiddleware(app), make_scope(service))
+
+    start, body = asyncio.run(main())
+    assert start["status"] == 200
+    assert (b"etag", b'"v1"') in start["headers"]
+    assert body["body"] == b"cached"
@@ -0,0 +1,86 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.caching_proxy.cache import InMemoryCache
+from src.caching_proxy.negative import NEGATIVE_HIT, NegativeCachePolicy
+
+
+def test_parse_and_ttl_by_status():
+    policy = NegativeCachePolicy.parse("404=30, 5xx=2, 503=10")
+    assert (policy.get_ttl(404, {}), policy.get_ttl(500, {}), policy.get_ttl(503, {})) == (30, 2, 10)
+    assert policy.get_ttl(410, {}) == 0
+    assert policy.get_ttl(404, {"cache-control": "max-age=5"}) == 5
+    assert policy.get_ttl(404, {"cache-control": "no-store"}) == 0
+    assert not NegativeCachePolicy.parse("404=0")
+
+
+@pytest.mark.parametrize("value", ["404", "200=30", "4x4=30", "304=30", "404=soon"])
+def test_parse_rejects_invalid_tables(value):
+    with pytest.raises(ValueError):
+        NegativeCachePolicy.parse(value)
+
+
+def make_origin(status_code: int):
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(status_code, content=b"error")
+
+    return handler, requests
+
+
+def test_error_is_served_from_the_negative_store(make_service, make_request, read):
+    handler, requests = make_origin(404)
+
+    async def main():
+        cache, negative_cache = InMemoryCache(), InMemoryCache()
+        service = make_service(
+            handler, cache=cache, negative_cache=negative_cache, negative_policy=NegativeCachePolicy.parse("404=30")
+        )
+        route = service.routes.routes[0]
+        first = await service.fetch_from_origin(make_request(), route, "GET a")
+        second = await service.fetch_from_origin(make_request(), route, "GET a")
+        return (
+            (first.status_code, await read(first), first.headers["x-cache"]),
+            (second.status_code, await read(second), second.headers["x-cache"]),
+            [key for key, _ in cache.items()],
+            negative_cache._store["GET a"].ttl,
+        )
+
+    first, second, positive_keys, ttl = asyncio.run(main())
+    assert first == (404, b"error", "MISS")
+    assert second == (404, b"error", NEGATIVE_HIT)
+    # errors never take room in the store of cacheable responses
+    assert (positive_keys, ttl, len(requests)) == ([], 30, 1)
+
+
+def test_statuses_without_a_ttl_go_to_the_origin(make_service, make_request, read):
+    handler, requests = make_origin(500)
+
+    async def main():
+        service = make_service(handler, negative_cache=InMemoryCache(), negative_policy=NegativeCachePolicy.parse("404=30"))
+        route = service.routes.routes[0]
+        for _ in range(2):
+            response = await service.fetch_from_origin(make_request(), route, "GET a")
+            assert (response.status_code, response.headers["x-cache"]) == (500, "MISS")
+            # lets the finished flight unregister, a request right behind it would share its result
+            await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert len(requests) == 2
+
+
+def test_negative_store_without_a_policy_caches_nothing(make_service, make_request):
+    handler, requests = make_origin(404)
+
+    async def main():
+        negative_cache = InMemoryCache()
+        service = make_service(handler, negative_cache=negative_cache)
+        route = service.routes.routes[0]
+        response = await service.fetch_from_origin(make_request(), route, "GET a")
+        return response.status_code, negative_cache.items()
+
+    assert asyncio.run(main()) == (404, [])
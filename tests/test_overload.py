@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import pytest
+
+from src.caching_proxy.config import settings
+from src.caching_proxy.overload import AimdLimiter, CircuitBreaker, OriginShed, make_limiter
+
+
+def test_limiter_queues_over_the_limit_and_sheds_a_full_queue():
+    async def main():
+        limiter = AimdLimiter("/", max_limit=2, max_queue=1, queue_timeout=1.0)
+        await limiter.acquire()
+        await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.queued == 1
+
+        with pytest.raises(OriginShed) as shed:
+            await limiter.acquire()
+        assert (shed.value.status_code, shed.value.reason) == (503, "queue_full")
+
+        limiter.release()
+        await queued
+        return limiter.in_flight, limiter.queued, limiter.shed
+
+    assert asyncio.run(main()) == (2, 0, {"queue_full": 1})
+
+
+def test_limiter_sheds_after_the_queue_timeout():
+    async def main():
+        limiter = AimdLimiter("/", max_limit=1, queue_timeout=0.01)
+        await limiter.acquire()
+        with pytest.raises(OriginShed) as shed:
+            await limiter.acquire()
+        return shed.value.reason, shed.value.headers["Retry-After"], limiter.queued
+
+    assert asyncio.run(main()) == ("queue_timeout", "1", 0)
+
+
+def test_aimd_backs_off_on_slow_responses_and_grows_when_utilized():
+    async def main():
+        limiter = AimdLimiter("/", max_limit=50)
+        initial = limiter.limit
+        for _ in range(int(initial)):
+            await limiter.acquire()
+        limiter.release(latency=0.01)
+        grown = limiter.limit
+
+        await limiter.acquire()
+        limiter.release(latency=1.0)
+        return initial, grown, limiter.limit
+
+    initial, grown, backed_off = asyncio.run(main())
+    assert grown == pytest.approx(initial + 1 / initial)
+    assert backed_off == pytest.approx(grown * settings.ORIGIN_LIMIT_BACKOFF)
+
+
+def test_make_limiter():
+    assert make_limiter("none", "/") is None
+    assert make_limiter("GRADIENT", "/").name == "gradient"
+    with pytest.raises(ValueError):
+        make_limiter("vegas", "/")
+
+
+def open_breaker(breaker: CircuitBreaker) -> None:
+    for i in range(settings.CIRCUIT_MIN_REQUESTS):
+        breaker.admit()
+        breaker.record(ok=i % 2 == 0)
+
+
+def test_breaker_opens_on_the_failure_ratio_and_closes_after_probes():
+    breaker = CircuitBreaker("/", failure_ratio=0.5, open_time=0.01)
+    open_breaker(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(OriginShed):
+        breaker.admit()
+
+    time.sleep(0.02)
+    for _ in range(settings.CIRCUIT_HALF_OPEN_PROBES):
+        breaker.admit()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # the probes are taken until they report back
+    with pytest.raises(OriginShed):
+        breaker.admit()
+
+    for _ in range(settings.CIRCUIT_HALF_OPEN_PROBES):
+        breaker.record(ok=True)
+    assert (breaker.state, breaker.opened, breaker.shed) == (CircuitBreaker.CLOSED, 1, 2)
+
+
+def test_failed_probe_opens_the_breaker_again():
+    breaker = CircuitBreaker("/", failure_ratio=0.5, open_time=0.01)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    breaker.admit()
+    breaker.record(ok=False)
+    assert (breaker.state, breaker.opened) == (CircuitBreaker.OPEN, 2)
+
+
+def test_breaker_stays_closed_below_the_minimum_requests():
+    breaker = CircuitBreaker("/", failure_ratio=0.5)
+    for _ in range(settings.CIRCUIT_MIN_REQUESTS - 1):
+        breaker.record(ok=False)
+    assert breaker.state == CircuitBreaker.CLOSED
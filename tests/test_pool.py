@@ -0,0 +1,86 @@
+import asyncio
+import sys
+
+import httpx
+import pytest
+from starlette.datastructures import State
+
+from src.caching_proxy import pool
+from src.caching_proxy.pool import ConnectionTrace, check_http2_available, create_origin_client
+from src.caching_proxy.routing import Upstream
+
+
+def test_origin_client_is_sized_from_the_state():
+    state = State(
+        {"pool_timeout": 2.5, "max_connections": 0, "max_keepalive_connections": 7, "keepalive_expiry": 12.0, "http2": False}
+    )
+
+    async def main():
+        async with create_origin_client(state) as client:
+            connection_pool = client._transport._pool
+            return (
+                client.timeout.pool,
+                connection_pool._max_connections,
+                connection_pool._max_keepalive_connections,
+                connection_pool._keepalive_expiry,
+            )
+
+    # 0 connections means no limit
+    assert asyncio.run(main()) == (2.5, sys.maxsize, 7, 12.0)
+
+
+def test_http2_needs_the_h2_package(monkeypatch):
+    monkeypatch.setattr(pool.importlib.util, "find_spec", lambda name: None)
+    with pytest.raises(ValueError):
+        check_http2_available()
+
+
+def replay(trace: ConnectionTrace, *events: str) -> None:
+    for event in events:
+        asyncio.run(trace(event, {}))
+
+
+def test_trace_tells_new_connections_from_reused_ones():
+    upstream = Upstream("http://origin.test")
+    opened = ConnectionTrace()
+    replay(
+        opened,
+        "connection.connect_tcp.started",
+        "connection.connect_tcp.complete",
+        "http11.send_request_headers.started",
+    )
+    opened.record(upstream)
+    reused = ConnectionTrace()
+    replay(reused, "http11.send_request_headers.started")
+    reused.record(upstream)
+    # the pool timed out before the request was sent, only the wait is counted
+    ConnectionTrace().record(upstream)
+
+    assert opened.new_connection and opened.connect_time > 0
+    assert not reused.new_connection
+    assert (upstream.connections_opened, upstream.connections_reused) == (1, 1)
+    assert upstream.pool_wait >= 0
+
+
+def test_trace_of_requests_over_a_real_connection():
+    async def serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    async def main():
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        upstream = Upstream(f"http://127.0.0.1:{port}")
+        async with httpx.AsyncClient() as client:
+            for _ in range(2):
+                trace = ConnectionTrace()
+                await client.get(upstream.url, extensions={"trace": trace})
+                trace.record(upstream)
+        server.close()
+        return upstream.connections_opened, upstream.connections_reused
+
+    assert asyncio.run(main()) == (1, 1)
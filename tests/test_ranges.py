@@ -0,0 +1,132 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.caching_proxy.ranges import (
+    RangeNotSatisfiable,
+    build_not_satisfiable_response,
+    build_range_response,
+    get_complete_length,
+    if_range_matches,
+    parse_range,
+)
+
+
+@pytest.mark.parametrize(
+    ("value", "size", "expected"),
+    [
+        ("bytes=0-9", 100, [(0, 9)]),
+        ("bytes=90-", 100, [(90, 99)]),
+        ("bytes=-10", 100, [(90, 99)]),
+        ("bytes=-500", 100, [(0, 99)]),
+        ("bytes=50-500", 100, [(50, 99)]),
+        ("bytes=0-4, 5-9, 20-29", 100, [(0, 9), (20, 29)]),
+        ("bytes=20-29,0-9", 100, [(0, 9), (20, 29)]),
+        ("bytes=0-9,200-300", 100, [(0, 9)]),
+    ],
+)
+def test_parse_range(value, size, expected):
+    assert parse_range(value, size) == expected
+
+
+@pytest.mark.parametrize("value", ["items=0-9", "bytes=", "bytes=9-0", "bytes=a-b", "bytes=5", "bytes=" + ",".join(["0-1"] * 17)])
+def test_parse_range_ignores_invalid_headers(value):
+    assert parse_range(value, 100) is None
+
+
+@pytest.mark.parametrize(("value", "size"), [("bytes=100-", 100), ("bytes=200-300", 100), ("bytes=-0", 100)])
+def test_parse_range_not_satisfiable(value, size):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(value, size)
+
+
+@pytest.mark.parametrize("value", ["bytes=-10", "bytes=0-", "bytes=0-0"])
+def test_parse_range_on_empty_body_is_not_satisfiable(value):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(value, 0)
+
+
+def test_get_complete_length():
+    assert get_complete_length("bytes 0-9/100") == 100
+    assert get_complete_length("bytes 0-9/*") is None
+    assert get_complete_length("bytes */100") == 100
+    assert get_complete_length("garbage") is None
+
+
+def test_if_range_matches_strong_etag_only():
+    headers = {"etag": '"v1"', "last-modified": "Wed, 21 Oct 2015 07:28:00 GMT"}
+    assert if_range_matches('"v1"', headers)
+    assert not if_range_matches('"v2"', headers)
+    assert not if_range_matches('W/"v1"', headers)
+    assert not if_range_matches('"v1"', {"etag": 'W/"v1"'})
+
+
+def test_if_range_matches_last_modified():
+    headers = {"etag": '"v1"', "last-modified": "Wed, 21 Oct 2015 07:28:00 GMT"}
+    assert if_range_matches("Wed, 21 Oct 2015 07:28:00 GMT", headers)
+    assert not if_range_matches("Thu, 22 Oct 2015 07:28:00 GMT", headers)
+    assert not if_range_matches("Wed, 21 Oct 2015 07:28:00 GMT", {"etag": '"v1"'})
+
+
+def test_build_single_range_response():
+    resp = build_range_response(b"0123456789", [(2, 5)], {"content-type": "text/plain"}, "HIT")
+    assert resp.status_code == 206
+    assert resp.body == b"2345"
+    assert resp.headers["content-range"] == "bytes 2-5/10"
+    assert resp.headers["content-length"] == "4"
+    assert resp.headers["x-cache"] == "HIT"
+
+
+def test_build_multipart_range_response():
+    resp = build_range_response(b"0123456789", [(0, 1), (8, 9)], {"content-type": "text/plain"}, "HIT")
+    content_type = resp.headers["content-type"]
+    assert content_type.startswith("multipart/byteranges; boundary=")
+    boundary = content_type.partition("boundary=")[2]
+
+    parts = resp.body.split(f"--{boundary}".encode())
+    assert parts[0] == b""
+    assert parts[-1] == b"--\r\n"
+    assert parts[1] == b"\r\nContent-Type: text/plain\r\nContent-Range: bytes 0-1/10\r\n\r\n01\r\n"
+    assert parts[2] == b"\r\nContent-Type: text/plain\r\nContent-Range: bytes 8-9/10\r\n\r\n89\r\n"
+
+
+def test_build_not_satisfiable_response():
+    resp = build_not_satisfiable_response(0, "HIT")
+    assert resp.status_code == 416
+    assert resp.headers["content-range"] == "bytes */0"
+
+
+def test_range_miss_is_relayed_and_later_ranges_are_cut_from_the_cache(make_service, make_request, read):
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        headers = {"etag": '"v1"', "cache-control": "max-age=60"}
+        if "range" in request.headers:
+            return httpx.Response(206, headers={**headers, "content-range": "bytes 0-3/10"}, content=b"0123")
+        return httpx.Response(200, headers=headers, content=b"0123456789")
+
+    async def main():
+        service = make_service(handler)
+        route = service.routes.routes[0]
+        first = await service.fetch_from_origin(make_request(headers={"Range": "bytes=0-3"}), route, "GET a")
+        first_body = await read(first)
+        # the whole object is fetched in the background
+        await asyncio.sleep(0.01)
+        cached = await service.get_cached_entry(make_request(), "GET a")
+
+        second = service.respond_from_cache(make_request(headers={"Range": "bytes=4-6"}), cached, "HIT")
+        stale_if_range = make_request(headers={"Range": "bytes=4-6", "If-Range": '"v0"'})
+        third = service.respond_from_cache(stale_if_range, cached, "HIT")
+        return (
+            (first.status_code, first_body),
+            (second.status_code, second.headers["content-range"], await read(second)),
+            (third.status_code, await read(third)),
+        )
+
+    first, second, third = asyncio.run(main())
+    assert first == (206, b"0123")
+    assert second == (206, "bytes 4-6/10", b"456")
+    assert third == (200, b"0123456789")
+    assert [request.headers.get("range") for request in requests] == ["bytes=0-3", None]
@@ -0,0 +1,91 @@
+from dataclasses import replace
+
+import pytest
+
+from src.caching_proxy.config import settings
+from src.caching_proxy.freshness import FreshnessPolicy
+from src.caching_proxy.routing import (
+    EwmaBalancer,
+    LeastOutstandingBalancer,
+    RouteTable,
+    Upstream,
+    make_balancer,
+    make_route,
+)
+
+FRESHNESS = FreshnessPolicy(default_ttl=30)
+
+
+def match(table: RouteTable, make_request, path: str, host: str = "proxy.test") -> str | None:
+    route = table.match(replace(make_request(path), raw_headers=[(b"host", host.encode())]))
+    return route.name if route is not None else None
+
+
+def test_prefix_matches_on_a_segment_boundary(make_request):
+    table = RouteTable([make_route(["http://api"], FRESHNESS, "/api"), make_route(["http://default"], FRESHNESS)])
+    assert match(table, make_request, "api") == "/api"
+    assert match(table, make_request, "api/users") == "/api"
+    assert match(table, make_request, "apiary") == "/"
+
+    table = RouteTable([make_route(["http://api"], FRESHNESS, "/api/")])
+    assert match(table, make_request, "api/users") == "/api/"
+    assert match(table, make_request, "apiary") is None
+
+
+def test_host_routes_and_longer_prefixes_win(make_request):
+    table = RouteTable(
+        [
+            make_route(["http://default"], FRESHNESS),
+            make_route(["http://api"], FRESHNESS, "/api/"),
+            make_route(["http://users"], FRESHNESS, "/api/users/"),
+            make_route(["http://static"], FRESHNESS, host="Static.Example.com"),
+        ]
+    )
+    assert match(table, make_request, "api/users/1") == "/api/users/"
+    assert match(table, make_request, "api/items") == "/api/"
+    assert match(table, make_request, "api/users/1", host="static.example.com:8080") == "static.example.com/"
+    assert match(table, make_request, "other") == "/"
+
+
+def test_balancers_spread_load():
+    upstreams = [Upstream(f"http://{name}") for name in "abc"]
+    round_robin = make_balancer("Round-Robin")
+    assert [round_robin.choose(upstreams).url for _ in range(4)] == ["http://a", "http://b", "http://c", "http://a"]
+
+    upstreams[0].outstanding, upstreams[1].outstanding, upstreams[2].outstanding = 3, 1, 2
+    assert LeastOutstandingBalancer().choose(upstreams).url == "http://b"
+
+    # expected wait: 0.1 * 4, 0.5 * 2, 0.2 * 3
+    upstreams[0].ewma, upstreams[1].ewma, upstreams[2].ewma = 0.1, 0.5, 0.2
+    assert EwmaBalancer().choose(upstreams).url == "http://a"
+
+    with pytest.raises(ValueError):
+        make_balancer("random")
+
+
+def test_failing_upstream_is_ejected_until_it_succeeds():
+    route = make_route(["http://a", "http://b"], FRESHNESS, balancer="round-robin")
+    failing = route.upstreams[0]
+    for _ in range(settings.UPSTREAM_EJECT_FAILURES):
+        failing.begin()
+        failing.finish(0.01, ok=False)
+
+    assert failing.ejections == 1
+    assert {route.pick_upstream().url for _ in range(4)} == {"http://b"}
+
+    # one more failure after the ejection ejects it again, the first success brings it back
+    failing.ejected_until = 0.0
+    failing.begin()
+    failing.finish(0.01, ok=False)
+    assert (failing.ejections, failing.is_available(0.0)) == (2, False)
+    failing.ejected_until = 0.0
+    failing.begin()
+    failing.finish(0.01, ok=True)
+    assert (failing.failures, failing.outstanding) == (0, 0)
+
+
+def test_every_upstream_ejected_spreads_the_load_over_all():
+    route = make_route(["http://a", "http://b"], FRESHNESS, balancer="round-robin")
+    for upstream in route.upstreams:
+        upstream.ejected_until = float("inf")
+    assert {route.pick_upstream().url for _ in range(4)} == {"http://a", "http://b"}
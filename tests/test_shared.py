@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+from src.caching_proxy.shared import LocalRespServer, RedisCache
+
+
+def test_redis_cache_round_trip(make_value):
+    url = LocalRespServer().start()
+
+    async def main():
+        cache = RedisCache(url)
+        await cache.setval("GET a", make_value(), ttl=60)
+        await cache.setval("GET a|x-lang=en", make_value(headers={"surrogate-key": "t1"}), ttl=60)
+        await cache.setval("GET b", make_value(headers={"surrogate-key": "t1"}))
+
+        value = await cache.getval("GET a")
+        assert (value.status_code, value.headers, bytes(value.body)) == (200, {"content-type": "text/plain"}, b"body")
+        page, cursor = await cache.scan(None, 10, prefix="GET a")
+        assert sorted(info.key for info in page) == ["GET a", "GET a|x-lang=en"]
+        assert cursor is None
+
+        assert await cache.purge_key("GET a") == 2
+        assert await cache.purge_tag("t1") == 1
+        stats = await cache.get_stats()
+        await cache.close()
+        return stats
+
+    stats = asyncio.run(main())
+    assert (stats.entries, stats.hits, stats.errors) == (0, 1, 0)
+
+
+def test_concurrent_commands_do_not_share_a_connection(make_value):
+    url = LocalRespServer().start()
+
+    async def main():
+        cache = RedisCache(url)
+        await asyncio.gather(*(cache.setval(f"GET {i}", make_value(), ttl=60) for i in range(20)))
+        values = await asyncio.gather(*(cache.getval(f"GET {i}") for i in range(20)))
+        await cache.close()
+        return values
+
+    assert all(value is not None and bytes(value.body) == b"body" for value in asyncio.run(main()))
+
+
+def test_unresponsive_server_is_a_miss_after_the_timeout():
+    async def main():
+        # accepts connections but never answers
+        server = await asyncio.start_server(lambda reader, writer: None, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        cache = RedisCache(f"redis://127.0.0.1:{port}/0", timeout=0.1)
+
+        start = time.perf_counter()
+        value = await cache.getval("GET a")
+        elapsed = time.perf_counter() - start
+        stats = await cache.get_stats()
+        server.close()
+        return value, elapsed, stats.errors
+
+    value, elapsed, errors = asyncio.run(main())
+    assert value is None
+    assert elapsed < 0.5
+    assert errors == 2
+
+
+def test_waiting_for_a_free_connection_is_a_miss_after_the_timeout():
+    url = LocalRespServer().start()
+
+    async def main():
+        cache = RedisCache(url, timeout=0.05)
+        # every connection is taken by commands that have not returned yet
+        while not cache._client._slots.locked():
+            await cache._client._slots.acquire()
+        value = await cache.getval("GET a")
+        return value, cache._errors
+
+    assert asyncio.run(main()) == (None, 1)
+
+
+def test_scan_cursor_survives_writes_and_removals():
+    server = LocalRespServer()
+    for i in range(6):
+        server._dispatch([b"SET", b"k%d" % i, b"v"])
+
+    def scan(cursor: bytes) -> tuple[bytes, list[bytes]]:
+        reply = server._dispatch([b"SCAN", cursor, b"COUNT", b"3"]).split(b"\r\n")
+        return reply[2], reply[5::2]
+
+    cursor, first = scan(b"0")
+    # a removal before the cursor used to shift the remaining keys back past it
+    server._dispatch([b"DEL", b"k0"])
+    server._dispatch([b"SET", b"k6", b"v"])
+    cursor, second = scan(cursor)
+    assert (first, second) == ([b"k0", b"k1", b"k2"], [b"k3", b"k4", b"k5"])
+    assert scan(cursor) == (b"0", [b"k6"])
+
+
+def test_listing_keys_does_not_touch_the_eviction_order():
+    # room for two 1-byte values under 2-byte keys
+    server = LocalRespServer(max_bytes=6)
+    server._dispatch([b"SET", b"k1", b"a"])
+    server._dispatch([b"SET", b"k2", b"b"])
+
+    assert server._dispatch([b"SCAN", b"0", b"MATCH", b"k1"]).endswith(b"$2\r\nk1\r\n")
+    assert server._dispatch([b"STRLEN", b"k1"]) == b":1\r\n"
+    server._dispatch([b"SET", b"k3", b"c"])
+
+    # k1 was only listed, it is still the least recently used
+    assert server._dispatch([b"GET", b"k1"]) == b"$-1\r\n"
+    assert server._dispatch([b"GET", b"k2"]) == b"$1\r\nb\r\n"
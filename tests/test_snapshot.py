@@ -0,0 +1,72 @@
+import asyncio
+
+from src.caching_proxy import snapshot
+from src.caching_proxy.cache import InMemoryCache
+from src.caching_proxy.schemas import DataToCache
+from src.caching_proxy.snapshot import dump_snapshot, restore_snapshot
+
+
+def make_cache(*keys: str) -> InMemoryCache:
+    cache = InMemoryCache()
+
+    async def fill():
+        for key in keys:
+            await cache.setval(key, DataToCache(status_code=200, headers={"etag": f'"{key}"'}, body=key.encode()), ttl=60)
+
+    asyncio.run(fill())
+    return cache
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = tmp_path / "snapshot.bin"
+    source = make_cache("GET a", "GET b")
+    source.setbucket("GET expired", source._store["GET a"].model_copy(update={"expires_at": 1.0}))
+    assert dump_snapshot(source, path) == 2
+
+    cache = InMemoryCache()
+    assert asyncio.run(restore_snapshot(cache, path)) == 2
+    restored = {key: (bucket.ttl, bucket.expires_at, bucket.value) for key, bucket in cache.items()}
+    assert restored == {
+        key: (bucket.ttl, bucket.expires_at, bucket.value) for key, bucket in source.items() if key != "GET expired"
+    }
+
+
+def test_restore_keeps_entries_cached_in_the_meantime(tmp_path):
+    path = tmp_path / "snapshot.bin"
+    dump_snapshot(make_cache("GET a", "GET b"), path)
+    cache = make_cache("GET a")
+    cache._store["GET a"].value.body = b"newer"
+
+    assert asyncio.run(restore_snapshot(cache, path)) == 1
+    assert cache._store["GET a"].value.body == b"newer"
+
+
+def test_unreadable_snapshot_restores_what_precedes_the_damage(tmp_path):
+    path = tmp_path / "snapshot.bin"
+    dump_snapshot(make_cache("GET a", "GET b"), path)
+    data = path.read_bytes()
+
+    path.write_bytes(data[:-3])
+    cache = InMemoryCache()
+    assert asyncio.run(restore_snapshot(cache, path)) == 1
+    assert [key for key, _ in cache.items()] == ["GET a"]
+
+    path.write_bytes(b"garbage" + data)
+    assert asyncio.run(restore_snapshot(InMemoryCache(), path)) == 0
+    assert asyncio.run(restore_snapshot(InMemoryCache(), tmp_path / "missing.bin")) == 0
+
+
+def test_restore_stops_at_a_purge(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "RESTORE_BATCH_SIZE", 1)
+    path = tmp_path / "snapshot.bin"
+    dump_snapshot(make_cache("GET a", "GET b", "GET c"), path)
+
+    async def main():
+        cache = InMemoryCache()
+        restore = asyncio.create_task(restore_snapshot(cache, path))
+        await asyncio.sleep(0)
+        # purged before the restore reached it, the snapshot must not bring it back
+        await cache.purge_key("GET c")
+        return await restore, [key for key, _ in cache.items()]
+
+    assert asyncio.run(main()) == (1, ["GET a"])
@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import httpx
+
+from src.caching_proxy.cache import InMemoryCache
+from src.caching_proxy.schemas import CachedBucket, DataToCache
+
+ETAG = '"v1"'
+
+
+def store_expired(cache: InMemoryCache, key: str, expired_for: float = 5, headers: dict[str, str] | None = None) -> None:
+    value = DataToCache(status_code=200, headers=headers or {"etag": ETAG}, body=b"old")
+    cache.setbucket(key, CachedBucket(ttl=10, expires_at=time.time() - expired_for, stale_ttl=60, value=value))
+
+
+def test_getstale_does_not_count_a_stale_hit():
+    async def main():
+        cache = InMemoryCache()
+        store_expired(cache, "GET a")
+
+        assert await cache.getval("GET a") is None
+        assert await cache.getstale("GET a", max_stale=1) is None
+        assert (await cache.getstale("GET a", max_stale=10)).body == b"old"
+        assert (await cache.get_stats()).stale_hits == 0
+
+        assert cache.record_stale_hit("GET a")
+        assert not cache.record_stale_hit("GET b")
+        assert (await cache.get_stats()).stale_hits == 1
+
+    asyncio.run(main())
+
+
+def test_stale_while_revalidate_serves_stale_and_refreshes(make_service, make_request, read):
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, headers={"cache-control": "max-age=60"}, content=b"new")
+
+    async def main():
+        cache = InMemoryCache()
+        store_expired(cache, "GET a", headers={})
+        service = make_service(handler, cache=cache, stale_while_revalidate=30)
+        route = service.routes.routes[0]
+        response = await service.get_stale_response(make_request(), route, "GET a")
+        body = await read(response)
+        await asyncio.sleep(0.01)
+        stats = await cache.get_stats()
+        return response.headers["x-cache"], body, (await cache.getval("GET a")).body, stats.stale_hits
+
+    assert asyncio.run(main()) == ("STALE", b"old", b"new", 1)
+    assert len(requests) == 1
+
+
+def test_revalidation_candidate_is_not_a_stale_hit(make_service, make_request, read):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers["if-none-match"] == ETAG
+        return httpx.Response(304, headers={"etag": ETAG, "cache-control": "max-age=60"})
+
+    async def main():
+        cache = InMemoryCache()
+        store_expired(cache, "GET a")
+        service = make_service(handler, cache=cache, revalidate_window=60)
+        route = service.routes.routes[0]
+        response = await service.fetch_from_origin(make_request(), route, "GET a")
+        return response.headers["x-cache"], await read(response), (await cache.get_stats()).stale_hits
+
+    assert asyncio.run(main()) == ("REVALIDATED", b"old", 0)
+
+
+def test_stale_if_error_serves_stale_on_origin_error(make_service, make_request, read):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(503, content=b"down")
+
+    async def main():
+        cache = InMemoryCache()
+        store_expired(cache, "GET a", headers={})
+        service = make_service(handler, cache=cache, stale_if_error=30)
+        route = service.routes.routes[0]
+        response = await service.fetch_from_origin(make_request(), route, "GET a")
+        return response.status_code, response.headers["x-cache"], await read(response), (await cache.get_stats()).stale_hits
+
+    assert asyncio.run(main()) == (200, "STALE", b"old", 1)
+
+
+def test_no_stale_response_past_the_window(make_service, make_request, read):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(503, content=b"down")
+
+    async def main():
+        cache = InMemoryCache()
+        store_expired(cache, "GET a", expired_for=50, headers={})
+        service = make_service(handler, cache=cache, stale_if_error=30, stale_while_revalidate=30)
+        route = service.routes.routes[0]
+        assert await service.get_stale_response(make_request(), route, "GET a") is None
+        response = await service.fetch_from_origin(make_request(), route, "GET a")
+        return response.status_code, await read(response)
+
+    assert asyncio.run(main()) == (503, b"down")
+
+
+def test_must_revalidate_is_never_served_stale(make_service, make_request, read):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(503, content=b"down")
+
+    async def main():
+        cache = InMemoryCache()
+        store_expired(cache, "GET a", headers={"cache-control": "max-age=10, must-revalidate"})
+        service = make_service(handler, cache=cache, stale_if_error=30, stale_while_revalidate=30)
+        route = service.routes.routes[0]
+        assert await service.get_stale_response(make_request(), route, "GET a") is None
+        response = await service.fetch_from_origin(make_request(), route, "GET a")
+        return response.status_code, await read(response), (await cache.get_stats()).stale_hits
+
+    assert asyncio.run(main()) == (503, b"down", 0)
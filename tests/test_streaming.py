@@ -0,0 +1,122 @@
+import asyncio
+
+import httpx
+import pytest
+from starlette.requests import ClientDisconnect
+from starlette.responses import Response, StreamingResponse
+
+from src.caching_proxy.service import get_content_length
+
+CHUNKS = [b"a" * 100, b"b" * 100, b"c" * 100]
+
+
+async def handler(request: httpx.Request) -> httpx.Response:
+    async def body():
+        for chunk in CHUNKS:
+            yield chunk
+
+    return httpx.Response(200, headers={"cache-control": "max-age=60"}, content=body())
+
+
+async def send_to_client(response: Response, chunks: list[bytes], disconnect_after: int | None = None) -> None:
+    """Runs the response as the server would, for a client that goes away after `disconnect_after` chunks."""
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message["body"]:
+            if len(chunks) == disconnect_after:
+                raise OSError("connection reset by peer")
+            chunks.append(message["body"])
+
+    await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+
+
+def test_body_is_relayed_in_chunks_and_cached(make_service, make_request):
+    async def main():
+        service = make_service(handler)
+        route = service.routes.routes[0]
+        response = await service.fetch_from_origin(make_request(), route, "GET a")
+        assert isinstance(response, StreamingResponse)
+        chunks = []
+        await send_to_client(response, chunks)
+        return chunks, response.headers["x-cache"], await service.get_cached_entry(make_request(), "GET a")
+
+    chunks, cache_status, cached = asyncio.run(main())
+    assert (chunks, cache_status) == (CHUNKS, "MISS")
+    assert cached.body == b"".join(CHUNKS)
+
+
+def test_body_over_the_size_limit_is_relayed_but_not_cached(make_service, make_request, read):
+    async def main():
+        service = make_service(handler, max_cacheable_size=150)
+        route = service.routes.routes[0]
+        body = await read(await service.fetch_from_origin(make_request(), route, "GET a"))
+        return body, await service.get_cached_entry(make_request(), "GET a")
+
+    assert asyncio.run(main()) == (b"".join(CHUNKS), None)
+
+
+def test_interrupted_body_is_not_cached(make_service, make_request):
+    async def main():
+        service = make_service(handler)
+        route = service.routes.routes[0]
+        response = await service.fetch_from_origin(make_request(), route, "GET a")
+        chunks = []
+        with pytest.raises(ClientDisconnect):
+            await send_to_client(response, chunks, disconnect_after=1)
+        return chunks, await service.get_cached_entry(make_request(), "GET a")
+
+    assert asyncio.run(main()) == (CHUNKS[:1], None)
+
+
+def test_disconnect_releases_the_origin_and_coalesced_requests(make_service, make_request, read):
+    calls = 0
+
+    async def origin(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        return await handler(request)
+
+    async def main():
+        service = make_service(origin)
+        route = service.routes.routes[0]
+        response = await service.fetch_from_origin(make_request(), route, "GET a")
+        waiter = asyncio.create_task(service.fetch_from_origin(make_request(), route, "GET a"))
+        await asyncio.sleep(0)
+        flight = service._single_flight._calls["GET a"]
+
+        with pytest.raises(ClientDisconnect):
+            await send_to_client(response, [], disconnect_after=1)
+        # released when the response returns, not whenever the abandoned body iterator is collected
+        released = response.body_iterator._response.is_closed, flight.done()
+        # the waiter fetches its own copy
+        body = await read(await asyncio.wait_for(waiter, 1))
+        return released, body, calls, service._single_flight.stats.in_flight
+
+    assert asyncio.run(main()) == ((True, True), b"".join(CHUNKS), 2, 0)
+
+
+def test_invalid_content_length_is_an_unknown_size(make_service, make_request, read):
+    assert [get_content_length({"content-length": value}) for value in ("12", " 12 ", "-1", "1e3", "")] == [
+        12,
+        12,
+        None,
+        None,
+        None,
+    ]
+
+    async def origin(request: httpx.Request) -> httpx.Response:
+        response = await handler(request)
+        response.headers["content-length"] = "many"
+        return response
+
+    async def main():
+        service = make_service(origin)
+        route = service.routes.routes[0]
+        body = await read(await service.fetch_from_origin(make_request(), route, "GET a"))
+        return body, await service.get_cached_entry(make_request(), "GET a")
+
+    body, cached = asyncio.run(main())
+    assert body == cached.body == b"".join(CHUNKS)